@@ -153,6 +153,8 @@ class SolutionTransformer:
     @classmethod
     def transform_solution_to_canvasjs(cls, game: GroupGame, inject_slug: str):
         """
+        The solutions are taken from the tally of the current visit of the inject, so this does not depend on
+        the number of participants.
         :returns: a list of dictionaries of the format [{"y": number_of_solutions, "label": solution_label}, ...]
         """
         return_data = []  # [{"y": 5, "label": "Answer 1"}, {"y": 5, "label": "Answer 2"}]
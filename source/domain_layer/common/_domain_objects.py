@@ -1,7 +1,20 @@
+from typing import Optional
+
 from pydantic import BaseModel, PrivateAttr
 
 
 class AggregateRoot(BaseModel):
     """A base class for all aggregate roots."""
     _entity_id: str = PrivateAttr("new")
+    _version: Optional[int] = PrivateAttr(None)
+
+    @property
+    def version(self):
+        """:returns: the version of the stored entity that this object is based on. None, if it is not known."""
+        return self._version
+
+    def set_version(self, version: Optional[int]):
+        """Remember the version of the stored entity, after this entity has been loaded or saved."""
+        self._version = version
+
 
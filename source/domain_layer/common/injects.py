@@ -34,12 +34,20 @@ class BaseInjectCondition(BaseModel):
         return return_str
 
 
+class MediaVariant(BaseModel):
+    """A resized copy of the image of an inject, e.g. for participants on small screens."""
+    media_path: str
+    width: int
+    mimetype: str = "image/webp"
+
+
 class BaseInject(GraphNode):
     """An inject in a story."""
     text: str
     slug: str
     condition: Optional[BaseInjectCondition] = None
     media_path: Optional[str] = ""
+    media_variants: List[MediaVariant] = []
 
     def __init__(self, label: str, **keyword_args):
         slug = keyword_args.pop("slug", False)
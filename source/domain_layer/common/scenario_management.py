@@ -1,10 +1,14 @@
 import json
-from typing import List
+from typing import List, Optional
 
 from domain_layer.common.auxiliary import BaseScenarioVariable
 from domain_layer.common.injects import BaseChoiceInject
-from domain_layer.common.scenarios import BaseScenario, BaseStory
+from domain_layer.common.scenarios import BaseScenario, BaseStory, ScenarioSummary
+from infrastructure_layer.caching import LRUCache, create_cache_from_config
+from infrastructure_layer.indexes import IndexDefinition, TEXT
+from infrastructure_layer.pagination import Page
 from infrastructure_layer.repository import Repository
+from infrastructure_layer.unit_of_work import get_current_unit_of_work
 
 
 class ScenarioFactory:
@@ -44,6 +48,18 @@ class ScenarioFactory:
 
         return scenario
 
+    @staticmethod
+    def build_summary_from_dict(**scenario_data):
+        """
+        Builds a summary from the (projected) raw data of a scenario, without building its stories and injects.
+        :returns: a ScenarioSummary.
+        """
+        scenario_id = scenario_data.pop("scenario_id", None) or scenario_data.pop("_id", "")
+        description = scenario_data.pop("scenario_description", None) or scenario_data.pop("description", "")
+        summary_fields = {field_name: scenario_data[field_name]
+                          for field_name in ScenarioSummary.__fields__ if field_name in scenario_data}
+        return ScenarioSummary(scenario_id=str(scenario_id), scenario_description=description, **summary_fields)
+
     @classmethod
     def _build_scenario(cls, title, scenario_description, scenario_id,
                         stories, variables, **scenario_data) -> BaseScenario:
@@ -110,6 +126,10 @@ class ScenarioFactory:
 class ScenarioRepository(Repository):
     """Provides methods for accessing and persisting scenarios."""
     collection_name = "scenarios"
+    indexes = [IndexDefinition(("title", TEXT))]
+    versioned = True
+    _cache: Optional[LRUCache] = None
+    _latest_versions = {}
 
     @classmethod
     def get_factory(cls):
@@ -117,18 +137,120 @@ class ScenarioRepository(Repository):
         return ScenarioFactory
 
     @classmethod
-    def get_scenario_by_id(cls, scenario_id: str):
+    def get_scenario_by_id(cls, scenario_id: str, read_only: bool = False):
         """
+        Scenarios are served from a cache of built scenarios (keyed by repository, scenario id and version),
+        which is filled from the database on a miss. A cached scenario is only served while its version matches the
+        stored version, so that changes saved by other processes are picked up on the next read.
         :param scenario_id: the ID of the scenario to return. 'new' if a new scenario or placeholder should be created.
+        :param read_only: if True, the cached instance itself is returned, which must not be changed.
+        Otherwise, a copy is returned. Within a unit of work (i.e. a request), the same copy is returned every time.
         :returns: The scenario instance.
         """
         factory = cls.get_factory()
         if scenario_id == "new":
             return factory.create_scenario(scenario_id="new")
-        else:
-            scenario_id, scenario_data = cls._get_entity_by_id(entity_id=scenario_id)
-            scenario = factory.build_from_dict(scenario_id=scenario_id, **scenario_data)
+        unit_of_work = None if read_only else get_current_unit_of_work()
+        key = (cls, str(scenario_id))
+        if unit_of_work is not None and unit_of_work.get(key) is not None:
+            return unit_of_work.get(key)
+        scenario = cls._get_current_cached_scenarios([str(scenario_id)]).get(str(scenario_id))
+        if scenario is None:
+            scenario = cls._load_scenario(scenario_id)
+        if read_only:
             return scenario
+        scenario = scenario.copy(deep=True)
+        if unit_of_work is not None:
+            unit_of_work.add(key, scenario)
+        return scenario
+
+    @classmethod
+    def get_scenarios_by_ids(cls, scenario_ids, read_only: bool = False):
+        """
+        Retrieve several scenarios at once. Scenarios that are not cached (or outdated) are loaded with a single query.
+        :param read_only: if True, the cached instances themselves are returned, which must not be changed.
+        :returns: a dict of {scenario_id: scenario}. Scenarios that do not exist are missing from it.
+        """
+        scenario_ids = {str(scenario_id) for scenario_id in scenario_ids}
+        scenarios = cls._get_current_cached_scenarios(scenario_ids)
+        missing_ids = [scenario_id for scenario_id in scenario_ids if scenario_id not in scenarios]
+        if missing_ids:
+            for scenario_data in cls.get_many_by_criteria(criteria={"_id": {"$in": missing_ids}}):
+                scenario_id = str(scenario_data.pop("_id"))
+                scenarios[scenario_id] = cls._build_and_cache(scenario_id, scenario_data)
+        if read_only:
+            return scenarios
+        return {scenario_id: scenario.copy(deep=True) for scenario_id, scenario in scenarios.items()}
+
+    @classmethod
+    def _load_scenario(cls, scenario_id: str):
+        """Build a scenario from the database and add it to the cache."""
+        scenario_id, scenario_data = cls._get_entity_by_id(entity_id=scenario_id)
+        return cls._build_and_cache(scenario_id, scenario_data)
+
+    @classmethod
+    def _build_and_cache(cls, scenario_id: str, scenario_data: dict):
+        scenario_data.setdefault("version", 0)
+        scenario = cls.get_factory().build_from_dict(scenario_id=scenario_id, **scenario_data)
+        cls.get_cache().put((cls.__name__, scenario_id, scenario.version), scenario)
+        cls._latest_versions[(cls.__name__, scenario_id)] = scenario.version
+        return scenario
+
+    @classmethod
+    def _get_current_cached_scenarios(cls, scenario_ids):
+        """
+        Take scenarios from the cache, if their cached version is still the stored version. The stored versions are
+        compared with a single query that only loads ids and versions. Outdated scenarios are removed from the cache.
+        :returns: a dict of {scenario_id: scenario} of the scenarios that are cached and up to date.
+        """
+        cached_scenarios = {}
+        for scenario_id in scenario_ids:
+            scenario = cls._get_cached_scenario(scenario_id)
+            if scenario is not None:
+                cached_scenarios[scenario_id] = scenario
+        if not cached_scenarios:
+            return cached_scenarios
+        stored_versions = {str(entity["_id"]): entity.get("version", 0) for entity in cls.get_many_by_criteria(
+            criteria={"_id": {"$in": list(cached_scenarios)}}, projection={"version": 1})}
+        for scenario_id, scenario in list(cached_scenarios.items()):
+            if stored_versions.get(scenario_id) != scenario.version:
+                cls.invalidate_cache(scenario_id)
+                del cached_scenarios[scenario_id]
+        return cached_scenarios
+
+    @classmethod
+    def _get_cached_scenario(cls, scenario_id: str):
+        """:returns: the latest known version of the scenario from the cache, None if it is not cached."""
+        version = cls._latest_versions.get((cls.__name__, scenario_id))
+        if version is None:
+            return None
+        return cls.get_cache().get((cls.__name__, scenario_id, version))
+
+    @classmethod
+    def get_cache(cls) -> LRUCache:
+        """:returns: the cache of built scenarios, which is shared by all scenario repositories."""
+        if ScenarioRepository._cache is None:
+            ScenarioRepository._cache = create_cache_from_config("SCENARIOS")
+        return ScenarioRepository._cache
+
+    @classmethod
+    def invalidate_cache(cls, scenario_id: str):
+        """Remove all cached versions of a scenario, e.g. because it has been changed."""
+        scenario_id = str(scenario_id)
+        for key in [key for key in list(cls._latest_versions) if key[1] == scenario_id]:
+            cls._latest_versions.pop(key, None)
+        cls.get_cache().invalidate_where(lambda key: key[1] == scenario_id)
+        unit_of_work = get_current_unit_of_work()
+        if unit_of_work is not None:
+            unit_of_work.remove_where(lambda key: issubclass(key[0], ScenarioRepository) and key[1] == scenario_id)
+
+    @classmethod
+    def warm_up_cache(cls, scenario_ids):
+        """
+        Load scenarios into the cache, e.g. those with active games after the application has started.
+        :returns: the number of scenarios that have been loaded.
+        """
+        return len(cls.get_scenarios_by_ids(scenario_ids, read_only=True))
 
     @classmethod
     def get_all_scenarios(cls):
@@ -137,11 +259,47 @@ class ScenarioRepository(Repository):
         """
         scenario_entities = cls.my_db.get_all(cls.collection_name)
         for entity in scenario_entities:
-            if "_id" in entity and "scenario_id" not in entity:
-                entity["scenario_id"] = str(entity["_id"])
-            factory = cls.get_factory()
-            scenario = factory.build_from_dict(**entity)
-            yield scenario
+            yield cls._build_scenario_from_entity(entity)
+
+    @classmethod
+    def get_scenarios_page(cls, limit: int = 50, cursor: str = None) -> Page:
+        """
+        Retrieve one page of scenarios, ordered by their id.
+        :param cursor: Optional. The next_cursor of the previous page.
+        :raises ValueError: if the cursor is invalid.
+        """
+        page = cls.get_page(sort=[("_id", 1)], limit=limit, cursor=cursor)
+        return Page([cls._build_scenario_from_entity(entity) for entity in page], next_cursor=page.next_cursor)
+
+    @classmethod
+    def _build_scenario_from_entity(cls, entity: dict):
+        if "_id" in entity and "scenario_id" not in entity:
+            entity["scenario_id"] = str(entity["_id"])
+        entity.setdefault("version", 0)
+        return cls.get_factory().build_from_dict(**entity)
+
+    @classmethod
+    def get_scenario_summaries(cls):
+        """
+        Yield an iterator over summaries of all scenarios in the database.
+        Only the fields of a summary are loaded, which makes this far cheaper than get_all_scenarios() for overviews.
+        """
+        scenario_entities = cls._get_all(projection=ScenarioSummary.get_projection())
+        factory = cls.get_factory()
+        for entity in scenario_entities:
+            yield factory.build_summary_from_dict(**entity)
+
+    @classmethod
+    def get_scenario_summaries_page(cls, limit: int = 50, cursor: str = None) -> Page:
+        """
+        Retrieve one page of scenario summaries, ordered by the id of their scenarios.
+        :param cursor: Optional. The next_cursor of the previous page.
+        :raises ValueError: if the cursor is invalid.
+        """
+        page = cls.get_page(sort=[("_id", 1)], limit=limit, cursor=cursor,
+                            projection=ScenarioSummary.get_projection())
+        factory = cls.get_factory()
+        return Page([factory.build_summary_from_dict(**entity) for entity in page], next_cursor=page.next_cursor)
 
     @classmethod
     def save_scenario(cls, scenario: BaseScenario):
@@ -149,19 +307,37 @@ class ScenarioRepository(Repository):
         Updates the database entry of an existing scenario with the same ID.
         If the ID is not found or the scenario does not yet have an ID, the object will be inserted into the database.
         :param scenario: the scenario to be saved.
+        :raises ConcurrentModificationError: if the scenario has been changed since the given version was loaded.
         :return: the saved scenario.
         """
         scenario_dict = scenario.dict()
         scenario_id = scenario_dict.pop("scenario_id", None)
+        scenario_dict.pop("version", None)
         if not scenario.scenario_id or scenario.scenario_id == "":
             scenario_id = cls._insert_entity(entity=scenario_dict)
-            scenario_dict.update({"scenario_id": scenario_id})
+            scenario_dict.update({"scenario_id": scenario_id, "version": 0})
             scenario = cls.get_factory().build_from_dict(**scenario_dict)
             return scenario
-        cls._update_entity(entity=scenario_dict,
-                           entity_id=scenario_id)
+        try:
+            cls._update_entity(entity=scenario_dict,
+                               entity_id=scenario_id, expected_version=scenario.version)
+        finally:
+            cls.invalidate_cache(scenario_id)
+        if scenario.version is not None:
+            scenario.set_version(scenario.version + 1)
+        unit_of_work = get_current_unit_of_work()
+        if unit_of_work is not None:
+            unit_of_work.add((cls, str(scenario_id)), scenario)
         return scenario
 
+    @classmethod
+    def partial_update(cls, partial_dict: dict, entity_id: str = ""):
+        scenario_id = entity_id or partial_dict.get("_entity_id", "")
+        try:
+            return super().partial_update(partial_dict, entity_id)
+        finally:
+            cls.invalidate_cache(scenario_id)
+
     @classmethod
     def _insert_placeholder(cls, scenario_dict: dict):
         """Utility function. Inserts a placeholder into the database to generate a new ID."""
@@ -171,3 +347,4 @@ class ScenarioRepository(Repository):
     def delete_by_id(cls, scenario_id):
         """Delete a scenario that has the given ID."""
         cls._delete_one(scenario_id)
+        cls.invalidate_cache(scenario_id)
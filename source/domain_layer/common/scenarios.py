@@ -84,6 +84,7 @@ class BaseScenario(AggregateRoot):
     def __init__(self, title: str, scenario_description: str, scenario_id: str = "", **keyword_args):
         super().__init__(title=title, scenario_description=scenario_description, **keyword_args)
         self._entity_id = scenario_id
+        self._version = keyword_args.get("version", None)
         var_dict = keyword_args.get("variables", {})
         if var_dict:
             self._variables = self._prepare_variables_from_dict(var_dict)
@@ -132,10 +133,38 @@ class BaseScenario(AggregateRoot):
         scenario_dict.update({
             "scenario_id": self.scenario_id,
             "variables": {var_name: var.dict() for (var_name, var) in self.variables.items()},
+            "version": self.version,
         })
         return scenario_dict
 
 
+class ScenarioSummary(BaseModel):
+    """A read-only excerpt of a scenario, containing only what overviews display. Use this class only for data-transfer."""
+    scenario_id: str
+    title: str
+    scenario_description: str = ""
+    learning_objectives: Optional[str] = ""
+    required_knowledge: Optional[str] = ""
+    target_group: Optional[str]
+
+    class Config:
+        allow_mutation = False
+
+    @classmethod
+    def get_projection(cls):
+        """:returns: a projection that loads only the fields of a summary (and the legacy 'description')."""
+        projection = {field_name: 1 for field_name in cls.__fields__ if field_name != "scenario_id"}
+        projection["description"] = 1
+        return projection
+
+    @property
+    def description(self):
+        return self.scenario_description
+
+    def __str__(self):
+        return self.title
+
+
 class DetailedScenario(BaseScenario):
     """
     A scenario is a number of realistic situations that are exposed to a participant.
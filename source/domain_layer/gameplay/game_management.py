@@ -1,19 +1,36 @@
-from typing import List
+import functools
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional, Union
 
 from domain_layer.common.scenario_management import ScenarioRepository
 from domain_layer.common.scenarios import BaseScenario
 from domain_layer.gameplay.games import GroupGame, Game, GameState, GameScenario
+from domain_layer.gameplay.participants import ParticipantHistory
+from infrastructure_layer.caching import LRUCache, create_cache_from_config
+from infrastructure_layer.database import ConcurrentModificationError, DuplicateKeyError
+from infrastructure_layer.indexes import IndexDefinition, DESCENDING
+from infrastructure_layer.pagination import Page
 from infrastructure_layer.repository import Repository
+from infrastructure_layer.serialization import compress_document, decompress_document
+from infrastructure_layer.unit_of_work import get_current_unit_of_work
+from infrastructure_layer.write_behind import WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
 
 
 class GameFactory:
     """Creates instances of Games."""
+    _scenario_cache: Optional[LRUCache] = None
+
     @classmethod
     def create_game(cls, scenario: BaseScenario):
         """Create a new game to play an existing scenario.
         :param scenario: the scenario to be played.
         :returns: a new Game for this scenario."""
-        scenario = GameScenario(**scenario.dict())
+        scenario = cls.get_game_scenario(scenario)
         game = Game(scenario=scenario)
         return game
 
@@ -23,12 +40,64 @@ class GameFactory:
         :param scenario: The scenario which is being played.
         :param game_dict: a collection of keywords that describe the game so far.
         :returns: the Game."""
-        if isinstance(scenario, BaseScenario):
-            scenario = scenario.dict()
-        scenario = GameScenario(**scenario)
+        scenario = cls.get_game_scenario(scenario)
         game = Game(scenario=scenario, **game_dict)
         return game
 
+    @classmethod
+    def get_game_scenario(cls, scenario: Union[BaseScenario, dict]) -> GameScenario:
+        """
+        Compile a scenario into the immutable GameScenario that games are played with.
+        GameScenarios are cached per scenario id and version, so that all games of a scenario share one instance.
+        :param scenario: a scenario or the dict of a scenario.
+        :returns: a GameScenario.
+        """
+        if isinstance(scenario, GameScenario):
+            return scenario
+        if isinstance(scenario, BaseScenario):
+            scenario_id, version = scenario.scenario_id, scenario.version
+        else:
+            scenario_id, version = scenario.get("scenario_id"), scenario.get("version")
+        if not scenario_id or scenario_id == "new" or version is None:
+            return cls._compile_game_scenario(scenario)
+        cache = cls.get_scenario_cache()
+        cache_key = (str(scenario_id), version)
+        game_scenario = cache.get(cache_key)
+        if game_scenario is None:
+            game_scenario = cls._compile_game_scenario(scenario)
+            cache.put(cache_key, game_scenario)
+        return game_scenario
+
+    @classmethod
+    def get_game_scenario_from_snapshot(cls, scenario_snapshot: dict, scenario_hash: str) -> GameScenario:
+        """
+        Compile the snapshot that has been taken of a scenario when a game was created.
+        Snapshots are cached by their content hash, so every snapshot is compiled only once.
+        :param scenario_snapshot: the dict of a GameScenario.
+        :param scenario_hash: the content hash of the snapshot.
+        :returns: a GameScenario.
+        """
+        cache = cls.get_scenario_cache()
+        cache_key = ("snapshot", scenario_hash)
+        game_scenario = cache.get(cache_key)
+        if game_scenario is None:
+            game_scenario = cls._compile_game_scenario(scenario_snapshot)
+            cache.put(cache_key, game_scenario)
+        return game_scenario
+
+    @staticmethod
+    def _compile_game_scenario(scenario: Union[BaseScenario, dict]) -> GameScenario:
+        if isinstance(scenario, BaseScenario):
+            scenario = scenario.dict()
+        return GameScenario(**scenario)
+
+    @classmethod
+    def get_scenario_cache(cls) -> LRUCache:
+        """:returns: the cache of GameScenarios, which is shared by all game factories."""
+        if GameFactory._scenario_cache is None:
+            GameFactory._scenario_cache = create_cache_from_config("GAME_SCENARIOS")
+        return GameFactory._scenario_cache
+
 
 class GroupGameFactory(GameFactory):
     """Creates instances of GroupGames."""
@@ -38,9 +107,7 @@ class GroupGameFactory(GameFactory):
         :param scenario: The scenario which is being played.
         :param game_dict: a collection of keywords that describe the game so far.
         :returns: the GroupGame."""
-        if isinstance(scenario, BaseScenario):
-            scenario = scenario.dict()
-        scenario = GameScenario(**scenario)
+        scenario = cls.get_game_scenario(scenario)
         game = GroupGame(scenario=scenario, **game_dict)
         return game
 
@@ -49,64 +116,685 @@ class GroupGameFactory(GameFactory):
         """Create a new GroupGame to play an existing scenario.
         :param scenario: the scenario to be played.
         :returns: a new GroupGame for this scenario."""
-        if isinstance(scenario, BaseScenario):
-            scenario = scenario.dict()
-        scenario = GameScenario(**scenario)
+        scenario = cls.get_game_scenario(scenario)
         return GroupGame(scenario)
 
 
+class GameHistoryRepository(Repository):
+    """
+    Stores the solutions of participants as append-only events, one document per solution.
+    This keeps the documents of games small, however many participants and injects a game has.
+    Solutions are stored before the game that counts them (see GameRepository.save_game()). Each one is keyed by
+    its game, participant, inject and sequence, so that storing it again after a failed update of the game replaces it
+    instead of adding it twice. Solutions beyond the counts of their game are ignored when a game is loaded.
+    """
+    collection_name = "game_histories"
+    indexes = [IndexDefinition("game_id", "inject_slug", "participant_id")]
+
+    @classmethod
+    def append(cls, game_id: str, entries: List[dict]):
+        """
+        Store new solutions of a game. Solutions that have been stored with the same key before are replaced.
+        :param entries: the solutions as returned by Game.get_unsaved_history().
+        """
+        for entry in entries:
+            entry_id = "{}:{}:{}:{}".format(game_id, entry["participant_id"], entry["inject_slug"], entry["sequence"])
+            cls.my_db.save_one(collection_name=cls.collection_name, new_values=dict(entry, game_id=str(game_id)),
+                               entity_id=entry_id)
+
+    @classmethod
+    def get_histories(cls, inject_slugs_by_game: dict):
+        """
+        Load the solutions to some injects of several games with a single query.
+        :param inject_slugs_by_game: a dict of {game_id: [inject_slug, ...]}. None instead of a list loads the
+        solutions to all injects of a game.
+        :returns: a dict of {game_id: [entry, ...]}, where the entries of each game are ordered by their sequence.
+        """
+        alternatives = [{"game_id": str(game_id)} if inject_slugs is None
+                        else {"game_id": str(game_id), "inject_slug": {"$in": list(inject_slugs)}}
+                        for game_id, inject_slugs in inject_slugs_by_game.items() if inject_slugs != []]
+        histories = {str(game_id): [] for game_id in inject_slugs_by_game}
+        if not alternatives:
+            return histories
+        criteria = alternatives[0] if len(alternatives) == 1 else {"$or": alternatives}
+        entries = cls.my_db.get_many(collection_name=cls.collection_name, criteria=criteria,
+                                     sort=[("sequence", 1)])
+        for entry in entries:
+            histories[entry["game_id"]].append(entry)
+        return histories
+
+    @classmethod
+    def delete_histories(cls, game_ids: List[str]):
+        """Delete all solutions of the given games."""
+        cls._delete_many({"game_id": {"$in": [str(game_id) for game_id in game_ids]}})
+
+
+class GameEventRepository(Repository):
+    """
+    Stores the commands of event-sourced games as an append-only log. Every save of such a game appends one document
+    with the events since its last save, numbered by a sequence per game. The document of the game itself is only
+    a snapshot, which is brought up to date by replaying the events after it.
+    """
+    collection_name = "game_events"
+    indexes = [IndexDefinition("game_id", "sequence", unique=True)]
+
+    @classmethod
+    def append(cls, game_id: str, sequence: int, events: List[dict]):
+        """
+        Store the new events of a game.
+        :param sequence: the sequence number of the last stored events of the game plus one.
+        :param events: the events as returned by Game.get_unsaved_events().
+        :raises ConcurrentModificationError: if events with this sequence number have been stored in the meantime.
+        """
+        try:
+            cls._insert_entity({"_id": "{}:{}".format(game_id, sequence), "game_id": str(game_id),
+                                "sequence": sequence, "events": events})
+        except DuplicateKeyError:
+            raise ConcurrentModificationError("The events {} of the game {} have already been stored!"
+                                              .format(sequence, game_id))
+
+    @classmethod
+    def get_events(cls, sequences_by_game: dict):
+        """
+        Load the events of several games that have been stored after a given sequence number with a single query.
+        :param sequences_by_game: a dict of {game_id: sequence}.
+        :returns: a dict of {game_id: [{"sequence", "events"}, ...]}, ordered by their sequence.
+        """
+        alternatives = [{"game_id": str(game_id), "sequence": {"$gt": sequence}}
+                        for game_id, sequence in sequences_by_game.items()]
+        event_documents = {str(game_id): [] for game_id in sequences_by_game}
+        if not alternatives:
+            return event_documents
+        criteria = alternatives[0] if len(alternatives) == 1 else {"$or": alternatives}
+        for document in cls.my_db.get_many(collection_name=cls.collection_name, criteria=criteria,
+                                           projection={"_id": 0}, sort=[("sequence", 1)]):
+            event_documents[document["game_id"]].append({"sequence": document["sequence"],
+                                                         "events": document["events"]})
+        return event_documents
+
+    @classmethod
+    def delete_events(cls, game_ids: List[str]):
+        """Delete all events of the given games."""
+        cls._delete_many({"game_id": {"$in": [str(game_id) for game_id in game_ids]}})
+
+
+class ScenarioSnapshotRepository(Repository):
+    """Keeps a single copy of every scenario snapshot that games and archived games refer to."""
+    collection_name = "scenario_snapshots"
+    indexes = [IndexDefinition("scenario_hash", unique=True)]
+
+    @classmethod
+    def save_snapshot(cls, scenario_hash: str, scenario_snapshot: dict):
+        """Store a snapshot, unless a snapshot with the same hash has already been stored."""
+        try:
+            cls.get_one_by_criteria(criteria={"scenario_hash": scenario_hash}, projection={"scenario_hash": 1})
+        except ValueError:
+            try:
+                cls._insert_entity({"scenario_hash": scenario_hash, "scenario_snapshot": scenario_snapshot})
+            except DuplicateKeyError:
+                pass
+
+    @classmethod
+    def get_snapshots(cls, scenario_hashes):
+        """
+        Load several snapshots with a single query.
+        :returns: a dict of {scenario_hash: scenario_snapshot}, without the hashes of which no snapshot is stored.
+        """
+        snapshot_dicts = cls.get_many_by_criteria(criteria={"scenario_hash": {"$in": list(scenario_hashes)}},
+                                                  projection={"scenario_hash": 1, "scenario_snapshot": 1})
+        return {snapshot_dict["scenario_hash"]: snapshot_dict["scenario_snapshot"] for snapshot_dict in snapshot_dicts}
+
+    @classmethod
+    def get_snapshot(cls, scenario_hash: str):
+        """:raises ValueError: if no snapshot with this hash has been stored."""
+        _, snapshot_dict = cls.get_one_by_criteria(criteria={"scenario_hash": scenario_hash})
+        return snapshot_dict["scenario_snapshot"]
+
+
+class GameArchiveRepository(Repository):
+    """
+    Closed games are moved from the games collection into this archive once they have been closed for a while,
+    so that the games collection only grows with the number of games that are currently played.
+    Every archived game is stored as a single compressed document, in which the solutions of each participant are
+    kept in the compact columnar form of a ParticipantHistory.
+    Scenario snapshots are stored only once for all archived games (see ScenarioSnapshotRepository).
+    """
+    collection_name = "archived_games"
+    indexes = [IndexDefinition("game_id", unique=True),
+               IndexDefinition("scenario_id")]
+    closed_game_delay = timedelta(hours=24)
+    open_game_ttl = timedelta(hours=72)
+
+    @classmethod
+    def get_closed_game_delay(cls) -> timedelta:
+        """:returns: how long closed games stay in the games collection (ARCHIVE.CLOSED_GAME_DELAY_HOURS)."""
+        return cls._get_configured_duration("CLOSED_GAME_DELAY_HOURS", cls.closed_game_delay)
+
+    @classmethod
+    def get_open_game_ttl(cls) -> timedelta:
+        """:returns: how long games may remain open without being started (ARCHIVE.OPEN_GAME_TTL_HOURS)."""
+        return cls._get_configured_duration("OPEN_GAME_TTL_HOURS", cls.open_game_ttl)
+
+    @staticmethod
+    def _get_configured_duration(setting: str, default: timedelta) -> timedelta:
+        from globalconfig import config
+        hours = config.get_db_config().get("ARCHIVE", {}).get(setting)
+        return default if hours is None else timedelta(hours=hours)
+
+    @classmethod
+    def archive_closed_games(cls, delay: timedelta = None, now: datetime = None) -> int:
+        """
+        Move all games that have been finished or aborted before the delay into the archive.
+        A game is only removed from the games collection once its archived copy has been stored,
+        so that this can safely be run again after it has been interrupted.
+        :returns: the number of games that have been archived.
+        """
+        cutoff = (now or datetime.now()) - (delay if delay is not None else cls.get_closed_game_delay())
+        criteria = {"game_state": {"$in": [GameState.Finished.value, GameState.Aborted.value]},
+                    "end_time": {"$lt": cutoff}}
+        archived_count = 0
+        for game_dict in GameRepository.get_many_by_criteria(criteria=criteria):
+            game_id = str(game_dict.pop("_id"))
+            cls._archive_game(game_id, game_dict)
+            GameHistoryRepository.delete_histories([game_id])
+            GameEventRepository.delete_events([game_id])
+            GameRepository._delete_one(game_id)
+            archived_count += 1
+        return archived_count
+
+    @classmethod
+    def _archive_game(cls, game_id: str, game_dict: dict):
+        try:
+            cls.get_one_by_criteria(criteria={"game_id": game_id})
+            return
+        except ValueError:
+            pass
+        scenario_snapshot = game_dict.pop("scenario_snapshot", None)
+        if scenario_snapshot:
+            ScenarioSnapshotRepository.save_snapshot(game_dict["scenario_hash"], scenario_snapshot)
+        cls._embed_histories(game_dict, GameHistoryRepository.get_histories({game_id: None})[game_id])
+        events = []
+        if game_dict.get("event_sequence") is not None:
+            events = GameEventRepository.get_events({game_id: game_dict["event_sequence"]})[game_id]
+        cls._insert_entity({"game_id": game_id,
+                            "scenario_id": game_dict.get("scenario_id"),
+                            "end_time": game_dict.get("end_time"),
+                            "archived_at": datetime.now(),
+                            "data": compress_document({"game": game_dict, "events": events})})
+
+    @staticmethod
+    def _embed_histories(game_dict: dict, entries: List[dict]):
+        """Add the stored solutions of each participant to the participant as a columnar history document."""
+        participant_dicts = game_dict.get("participants") or {}
+        solved_counts = {participant_id: participant_dict.get("solved_counts", {})
+                         for participant_id, participant_dict in participant_dicts.items()}
+        for participant_id, participant_entries in GroupGame.group_stored_history(solved_counts, entries).items():
+            history = ParticipantHistory.validate(participant_dicts[participant_id].get("history") or [])
+            history.extend(participant_entries)
+            participant_dicts[participant_id]["history"] = history.to_document()
+
+    @classmethod
+    def delete_stale_open_games(cls, ttl: timedelta = None, now: datetime = None) -> int:
+        """
+        Delete all games that have been opened before the ttl, but never been started.
+        :returns: the number of deleted games.
+        """
+        cutoff = (now or datetime.now()) - (ttl if ttl is not None else cls.get_open_game_ttl())
+        criteria = {"game_state": GameState.Open.value, "start_time": {"$lt": cutoff}}
+        game_ids = [str(game_dict["_id"]) for game_dict in
+                    GameRepository.get_many_by_criteria(criteria=criteria, projection={"_id": 1})]
+        if game_ids:
+            GameHistoryRepository.delete_histories(game_ids)
+            GameEventRepository.delete_events(game_ids)
+            GameRepository._delete_many({"_id": {"$in": game_ids}})
+        return len(game_ids)
+
+    @classmethod
+    def get_archived_game(cls, game_id: str):
+        """
+        :returns: a tuple of (game_dict, history, events) of an archived game. The game_dict contains its scenario
+        snapshot and the histories of its participants. The history only contains the solutions of games that have
+        been archived with a separate list of solutions. The events are those that an event-sourced game has stored
+        after its last snapshot.
+        :raises ValueError: if the game has not been archived.
+        """
+        _, archived_dict = cls.get_one_by_criteria(criteria={"game_id": str(game_id)})
+        archived_data = decompress_document(archived_dict["data"])
+        game_dict = archived_data["game"]
+        if game_dict.get("scenario_hash"):
+            game_dict["scenario_snapshot"] = ScenarioSnapshotRepository.get_snapshot(game_dict["scenario_hash"])
+        game_dict["archived_at"] = archived_dict["archived_at"]
+        return game_dict, archived_data.get("history", []), archived_data.get("events", [])
+
+
 class GameRepository(Repository):
     """Provides methods for accessing and persisting games."""
     collection_name = "games"
+    indexes = [IndexDefinition("game_state"),
+               IndexDefinition("scenario_id"),
+               IndexDefinition("scenario_hash"),
+               IndexDefinition("game_state", ("start_time", DESCENDING))]
+    versioned = True
+    _write_buffer: Optional[WriteBehindBuffer] = None
+    _write_behind_configured = False
+    _write_behind_strict = False
+    snapshot_interval = 50
+    snapshot_event_types = {"game_started", "game_aborted", "game_ended"}
 
     @classmethod
     def get_factory(cls):
         return GameFactory()
 
+    @classmethod
+    def _get_factory_for(cls, game_dict: dict):
+        """Event-sourced games are always rebuilt as the type they have been saved as, to which their events belong."""
+        if game_dict.get("event_sequence") is not None and game_dict.get("type") == "GROUP_GAME":
+            return GroupGameFactory()
+        return cls.get_factory()
+
     @classmethod
     def save_game(cls, game: Game):
-        """Persist a given game."""
+        """Persist a given game. Games that have been saved before are updated with their changes only.
+        New solutions are stored before the game is updated, so that they exist once the game counts them.
+        New GroupGames are event-sourced if EVENT_SOURCING.ENABLED is set: afterwards, only their events are appended
+        (see _save_events()).
+        :raises ConcurrentModificationError: if the game has been changed since the given version was loaded.
+        :raises ValueError: if the game has already been archived."""
+        if game.is_archived:
+            raise ValueError("The game {} has been archived and can not be changed any longer!".format(game.game_id))
         if not game.game_id or game.game_id == "new":
-            game_id = cls._insert_entity(game.dict())
+            if isinstance(game, GroupGame) and cls._get_event_sourcing_setting("ENABLED", False):
+                game.enable_event_sourcing()
+            game_dict = game.get_document()
+            scenario_hash, scenario_snapshot = cls._create_scenario_snapshot(game.scenario)
+            ScenarioSnapshotRepository.save_snapshot(scenario_hash, scenario_snapshot)
+            game_dict["scenario_hash"] = scenario_hash
+            game_id = cls._insert_entity(game_dict)
+            game.set_version(0)
+            GameHistoryRepository.append(game_id, game.get_unsaved_history())
+        elif game.is_event_sourced:
+            return cls._save_events(game)
         else:
-            game_id = cls._update_entity(game.dict(), game.game_id)
+            game_id = game.game_id
+            changes = game.get_changes()
+            GameHistoryRepository.append(game_id, game.get_unsaved_history())
+            if changes:
+                cls._apply_update(changes, game_id, expected_version=game.version)
+                if game.version is not None:
+                    game.set_version(game.version + 1)
+        game.mark_persisted()
         return game_id
 
     @classmethod
-    def get_game_by_id(cls, game_id: str):
+    def _save_events(cls, game: Game):
+        """
+        Append the unsaved events of an event-sourced game. Its document is only updated with a new snapshot
+        every EVENT_SOURCING.SNAPSHOT_EVERY sequence numbers and whenever the game starts or ends,
+        so that the fields by which games are queried stay current.
+        """
+        events = game.get_unsaved_events()
+        if events:
+            sequence = game.event_sequence + 1
+            GameEventRepository.append(game.game_id, sequence, events)
+            game.mark_events_persisted(sequence)
+        snapshot_interval = cls._get_event_sourcing_setting("SNAPSHOT_EVERY", cls.snapshot_interval)
+        if game.events_since_snapshot >= snapshot_interval \
+                or any(event["type"] in cls.snapshot_event_types for event in events):
+            cls._save_snapshot(game)
+        return game.game_id
+
+    @classmethod
+    def _save_snapshot(cls, game: Game):
+        """
+        Save the current state of an event-sourced game as its new snapshot. If someone else has saved a snapshot
+        in the meantime, this one is skipped: the events are stored already, so nothing is lost.
+        """
+        changes = game.get_changes()
+        GameHistoryRepository.append(game.game_id, game.get_unsaved_history())
+        if changes:
+            try:
+                cls._apply_update(changes, game.game_id, expected_version=game.version)
+            except ConcurrentModificationError as e:
+                logger.warning("Skipped the snapshot of game %s: %s", game.game_id, e)
+                return
+            game.set_version(game.version + 1)
+        game.mark_snapshot()
+
+    @staticmethod
+    def _get_event_sourcing_setting(setting: str, default):
+        from globalconfig import config
+        return config.get_db_config().get("EVENT_SOURCING", {}).get(setting, default)
+
+    @staticmethod
+    def _create_scenario_snapshot(scenario: GameScenario):
+        """
+        A snapshot of the scenario is taken when a game is created, so that the game is not affected if the scenario
+        is edited later on. The game only keeps the content hash of its snapshot, which is stored once for all games
+        (see ScenarioSnapshotRepository) and only loaded if its compiled GameScenario is not cached.
+        :returns: a tuple of (scenario_hash, scenario_snapshot).
+        """
+        scenario_snapshot = scenario.dict()
+        content = json.dumps(scenario_snapshot, sort_keys=True, separators=(",", ":"), default=str)
+        scenario_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        return scenario_hash, scenario_snapshot
+
+    @classmethod
+    def _get_game_scenario(cls, game_dict: dict, game_scenarios: dict = None):
+        """
+        Take the scenario of a game from its document or from the scenarios that have been loaded in advance.
+        Games that have been created before scenarios were embedded are played with the current version of their
+        scenario.
+        :param game_scenarios: Optional. The scenarios that have been loaded in advance (see _load_game_scenarios).
+        :raises ValueError: if the snapshot of the game or its scenario does not exist (any longer).
+        """
+        game_scenarios = game_scenarios or {}
+        scenario_id = game_dict.pop("scenario_id", None)
+        scenario_hash = game_dict.pop("scenario_hash", None)
+        scenario_snapshot = game_dict.pop("scenario_snapshot", None)
+        if scenario_snapshot:
+            return cls.get_factory().get_game_scenario_from_snapshot(scenario_snapshot, scenario_hash)
+        if scenario_hash:
+            game_scenario = game_scenarios.get(("snapshot", scenario_hash))
+            if game_scenario is None:
+                raise ValueError("The scenario snapshot {} does not exist!".format(scenario_hash))
+            return game_scenario
+        scenario = game_scenarios.get(("scenario", str(scenario_id)))
+        if scenario is None:
+            scenario = ScenarioRepository.get_scenario_by_id(scenario_id, read_only=True)
+        return scenario
+
+    @classmethod
+    def _load_game_scenarios(cls, game_dicts: list):
+        """
+        Load the scenarios of several games at once, instead of one query per game.
+        Snapshots whose GameScenario is cached are not loaded at all. All other snapshots are loaded with a single
+        query and compiled once (game dicts may omit their snapshot for this purpose). All scenarios of games without
+        a snapshot are fetched with a single query as well.
+        :returns: a dict of {("snapshot", scenario_hash) or ("scenario", scenario_id): scenario}
+        """
+        scenario_cache = cls.get_factory().get_scenario_cache()
+        game_scenarios = {}
+        missing_snapshots = {}
+        legacy_scenario_ids = set()
+        for game_dict in game_dicts:
+            scenario_hash = game_dict.get("scenario_hash")
+            if scenario_hash and not game_dict.get("scenario_snapshot"):
+                game_scenario = scenario_cache.get(("snapshot", scenario_hash))
+                if game_scenario is None:
+                    missing_snapshots.setdefault(scenario_hash, game_dict["_id"])
+                else:
+                    game_scenarios[("snapshot", scenario_hash)] = game_scenario
+            elif not scenario_hash and game_dict.get("scenario_id"):
+                legacy_scenario_ids.add(game_dict["scenario_id"])
+        if missing_snapshots:
+            game_scenarios.update(cls._load_snapshots(missing_snapshots))
+        if legacy_scenario_ids:
+            scenarios = ScenarioRepository.get_scenarios_by_ids(legacy_scenario_ids, read_only=True)
+            for scenario_id, scenario in scenarios.items():
+                game_scenarios[("scenario", scenario_id)] = scenario
+        return game_scenarios
+
+    @classmethod
+    def _load_snapshots(cls, game_ids_by_hash: dict):
+        """
+        Load and compile scenario snapshots from the scenario_snapshots collection. Games that have been created before
+        snapshots were stored separately still contain their snapshot, so these are taken from one of their games.
+        :param game_ids_by_hash: a dict of {scenario_hash: id of a game that refers to this snapshot}.
+        :returns: a dict of {("snapshot", scenario_hash): GameScenario}
+        """
+        snapshots = ScenarioSnapshotRepository.get_snapshots(game_ids_by_hash)
+        embedded_game_ids = [game_id for scenario_hash, game_id in game_ids_by_hash.items()
+                             if scenario_hash not in snapshots]
+        if embedded_game_ids:
+            snapshot_dicts = cls.get_many_by_criteria(criteria={"_id": {"$in": embedded_game_ids}},
+                                                      projection={"scenario_hash": 1, "scenario_snapshot": 1})
+            snapshots.update({snapshot_dict["scenario_hash"]: snapshot_dict["scenario_snapshot"]
+                              for snapshot_dict in snapshot_dicts if snapshot_dict.get("scenario_snapshot")})
+        factory = cls.get_factory()
+        return {("snapshot", scenario_hash): factory.get_game_scenario_from_snapshot(scenario_snapshot, scenario_hash)
+                for scenario_hash, scenario_snapshot in snapshots.items()}
+
+    @classmethod
+    def update_game(cls, game: Game, command):
+        """
+        Apply a command to a game and save the game.
+        If the game has been changed by someone else in the meantime, it is reloaded and the command is re-applied.
+        Within a unit of work (i.e. a request), the command is applied to the given game right away, but the game is
+        only saved when the unit of work ends (see _commit_game()).
+        Otherwise, if write-behind is enabled, the command is saved together with the other pending commands of the
+        same game (see flush_pending_writes()).
+        Since commands may be applied again later on, they must not depend on variables that change afterwards
+        (e.g. loop variables must be bound as default arguments).
+        :param game: the game as it has been loaded from this repository.
+        :param command: a function that takes a game as its only argument and changes it.
+        :returns: the game in the state in which it has been saved.
+        """
+        unit_of_work = get_current_unit_of_work()
+        write_buffer = cls.get_write_buffer()
+        if unit_of_work is not None or write_buffer is not None:
+            if game.is_archived:
+                raise ValueError("The game {} has been archived and can not be changed any longer!"
+                                 .format(game.game_id))
+            command(game)
+            key = (cls, str(game.game_id))
+            if unit_of_work is not None:
+                unit_of_work.register_change(key, command, functools.partial(cls._commit_game, game))
+                return game
+            return cls._buffer_commands(write_buffer, key, [command], game)
+
+        def apply_command(attempt):
+            current_game = game if attempt == 1 else cls._load_game(game.game_id)
+            command(current_game)
+            cls.save_game(current_game)
+            return current_game
+        return cls._retry_on_conflict(apply_command)
+
+    @classmethod
+    def _commit_game(cls, game: Game, key, commands):
+        """
+        Save a game at the end of a unit of work, to which its commands have already been applied.
+        If the game has been changed by someone else in the meantime, the commands are re-applied to its current state.
+        If write-behind is enabled, the commands are passed on to the write buffer instead, so that they are written
+        together with the pending commands of other requests (see flush_pending_writes()).
+        :returns: the game in the state in which it has been saved (or buffered).
+        """
+        write_buffer = cls.get_write_buffer()
+        if write_buffer is not None:
+            return cls._buffer_commands(write_buffer, key, commands, game)
+        try:
+            cls.save_game(game)
+            return game
+        except ConcurrentModificationError:
+            return cls._write_commands(key, commands)
+
+    @classmethod
+    def _buffer_commands(cls, write_buffer: WriteBehindBuffer, key, commands, game: Game):
+        for command in commands:
+            write_buffer.add(key, command)
+        if cls._write_behind_strict:
+            return write_buffer.flush([key], retry=False).get(key, game)
+        return game
+
+    @classmethod
+    def get_write_buffer(cls) -> Optional[WriteBehindBuffer]:
+        """
+        :returns: the buffer of pending commands, which is shared by all game repositories.
+        None, if write-behind is not enabled (WRITE_BEHIND.ENABLED in the database configuration).
+        """
+        if not GameRepository._write_behind_configured:
+            from globalconfig import config
+            write_behind_config = config.get_db_config().get("WRITE_BEHIND", {})
+            cls.configure_write_behind(enabled=write_behind_config.get("ENABLED", False),
+                                       window_ms=write_behind_config.get("WINDOW_MS", 50),
+                                       strict=write_behind_config.get("STRICT", False))
+        return GameRepository._write_buffer
+
+    @classmethod
+    def configure_write_behind(cls, enabled: bool, window_ms: Optional[int] = 50, strict: bool = False):
+        """
+        Enable or disable the coalescing of commands (see update_game()). Pending commands are written first.
+        :param window_ms: the number of milliseconds after which pending commands are written at the latest.
+        :param strict: if True, every command is written before update_game() returns, e.g. in tests.
+        """
+        if GameRepository._write_buffer is not None:
+            GameRepository._write_buffer.close()
+        window = window_ms / 1000 if window_ms is not None else None
+        GameRepository._write_buffer = WriteBehindBuffer(GameRepository._write_commands, window) if enabled else None
+        GameRepository._write_behind_strict = strict
+        GameRepository._write_behind_configured = True
+
+    @classmethod
+    def flush_pending_writes(cls):
+        """Write the pending commands of all games that have been changed by the current thread (or request)."""
+        write_buffer = GameRepository._write_buffer
+        if write_buffer is not None:
+            write_buffer.flush_touched()
+
+    @staticmethod
+    def _write_commands(key, commands):
+        """Apply all pending commands of a game to its current state and save it with a single write."""
+        repository, game_id = key
+
+        def apply_commands(attempt):
+            current_game = repository._load_game(game_id)
+            for command in commands:
+                command(current_game)
+            repository.save_game(current_game)
+            return current_game
+        return repository._retry_on_conflict(apply_commands)
+
+    @classmethod
+    def get_game_by_id(cls, game_id: str, inject_slugs: List[str] = None):
         """Retrieve a game.
-        :param game_id: The known id of the game."""
-        game_id, game_dict = cls._get_entity_by_id(entity_id=game_id)
-        scenario_id = game_dict.pop("scenario_id")
-        scenario = ScenarioRepository.get_scenario_by_id(scenario_id)
-        game_dict["scenario"] = scenario.dict()
+        :param game_id: The known id of the game.
+        :param inject_slugs: Optional. The injects whose solutions are loaded. Defaults to the current inject.
+        Games that have already been archived are loaded from the archive, with all their solutions.
+        Within a unit of work (i.e. a request), a game is only loaded once and the same instance is returned for every
+        further call (unless specific injects are requested)."""
+        unit_of_work = get_current_unit_of_work()
+        if unit_of_work is None or inject_slugs is not None:
+            return cls._load_game(game_id, inject_slugs)
+        key = (cls, str(game_id))
+        game = unit_of_work.get(key)
+        if game is None:
+            game = cls._load_game(game_id)
+            unit_of_work.add(key, game)
+        return game
+
+    @classmethod
+    def _load_game(cls, game_id: str, inject_slugs: List[str] = None):
+        try:
+            game_id, game_dict = cls._get_entity_by_id(entity_id=game_id, projection={"scenario_snapshot": 0})
+        except ValueError:
+            return cls._get_archived_game(game_id)
+        game_dict.setdefault("version", 0)
+        game_scenarios = cls._load_game_scenarios([dict(game_dict, _id=game_id)])
+        game_dict["scenario"] = cls._get_game_scenario(game_dict, game_scenarios)
         game_dict["game_id"] = game_id
-        game = cls.get_factory().build_from_dict(**game_dict)
+        game = cls._get_factory_for(game_dict).build_from_dict(**game_dict)
+        cls._load_histories([game], inject_slugs)
+        game.mark_persisted()
+        cls._replay_events([game])
         return game
 
+    @classmethod
+    def _get_archived_game(cls, game_id: str):
+        game_dict, history, event_documents = GameArchiveRepository.get_archived_game(game_id)
+        game_dict["scenario"] = cls._get_game_scenario(game_dict)
+        game_dict["game_id"] = str(game_id)
+        game = cls._get_factory_for(game_dict).build_from_dict(**game_dict)
+        game.load_history(history)
+        for event_document in event_documents:
+            game.apply_events(event_document["sequence"], event_document["events"])
+        game.mark_persisted()
+        return game
+
+    @staticmethod
+    def _replay_events(games: List[Game]):
+        """Bring event-sourced games up to date with the events after their snapshots, with a single query."""
+        event_sourced_games = {str(game.game_id): game for game in games if game.is_event_sourced}
+        if not event_sourced_games:
+            return
+        sequences_by_game = {game_id: game.event_sequence for game_id, game in event_sourced_games.items()}
+        for game_id, event_documents in GameEventRepository.get_events(sequences_by_game).items():
+            for event_document in event_documents:
+                event_sourced_games[game_id].apply_events(event_document["sequence"], event_document["events"])
+
+    @staticmethod
+    def _load_histories(games: List[Game], inject_slugs: List[str] = None):
+        """Add the stored solutions to the given injects (or the current inject) to each of the games."""
+        inject_slugs_by_game = {}
+        for game in games:
+            current_inject = game.current_inject
+            inject_slugs_by_game[game.game_id] = inject_slugs or ([current_inject.slug] if current_inject else [])
+        histories = GameHistoryRepository.get_histories(inject_slugs_by_game)
+        for game in games:
+            game.load_history(histories[str(game.game_id)])
+
     @classmethod
     def get_games_by_state(cls, states=None):
         """Yield an iterator over all open games.
         :param states: a list of GameState objects or one of ["open", "closed", "in_progress"]
         """
+        resultset = cls.get_many_by_criteria(criteria={"game_state": {"$in": cls._get_state_values(states)}},
+                                             projection={"scenario_snapshot": 0})
+        yield from cls._build_games(resultset)
+
+    @classmethod
+    def get_games_page(cls, states=None, limit: int = 50, cursor: str = None) -> Page:
+        """Retrieve one page of games, the most recently started games first.
+        :param states: a list of GameState objects or one of ["open", "closed", "in_progress"]
+        :param cursor: Optional. The next_cursor of the previous page.
+        :returns: a Page of games.
+        :raises ValueError: if the cursor is invalid.
+        """
+        page = cls.get_page(criteria={"game_state": {"$in": cls._get_state_values(states)}},
+                            sort=[("start_time", -1), ("_id", -1)], limit=limit, cursor=cursor,
+                            projection={"scenario_snapshot": 0})
+        return Page(list(cls._build_games(page.items)), next_cursor=page.next_cursor)
+
+    @staticmethod
+    def _get_state_values(states=None):
         if not states:
             states = [GameState.Open, GameState.In_Progress]
-        if isinstance(states[0], GameState):
-            states = [state.value for state in states]
-        resultset = cls.get_many_by_criteria(criteria={"game_state": {"$in": states}})
-        factory = cls.get_factory()
-        for game_dict in resultset:
+        return [state.value if isinstance(state, GameState) else state for state in states]
+
+    @classmethod
+    def _build_games(cls, game_dicts):
+        """
+        Build games from their documents. The scenarios and the solutions to the current injects of all games
+        are loaded in advance.
+        """
+        game_dicts = list(game_dicts)
+        game_scenarios = cls._load_game_scenarios(game_dicts)
+        games = []
+        for game_dict in game_dicts:
             game_id = str(game_dict.pop("_id"))
-            scenario_id = game_dict.pop("scenario_id")
+            game_dict.setdefault("version", 0)
             try:
-                scenario = ScenarioRepository.get_scenario_by_id(scenario_id)
+                scenario = cls._get_game_scenario(game_dict, game_scenarios)
                 game_dict["game_id"] = game_id
-                game = factory.build_from_dict(scenario=scenario, **game_dict)
-                yield game
+                games.append(cls._get_factory_for(game_dict).build_from_dict(scenario=scenario, **game_dict))
             except ValueError as ve:
                 print("VALUE ERROR!")
                 print(ve)
                 pass
+        cls._load_histories(games)
+        for game in games:
+            game.mark_persisted()
+        cls._replay_events(games)
+        return games
+
+    @classmethod
+    def warm_up_scenario_cache(cls):
+        """
+        Compile the scenarios of all open and running games, so that they are cached before the first request.
+        :returns: the number of scenarios that have been loaded.
+        """
+        states = [GameState.Open.value, GameState.In_Progress.value]
+        game_dicts = cls.get_many_by_criteria(criteria={"game_state": {"$in": states}},
+                                              projection={"scenario_id": 1, "scenario_hash": 1})
+        return len(cls._load_game_scenarios(list(game_dicts)))
 
 
 class GroupGameRepository(GameRepository):
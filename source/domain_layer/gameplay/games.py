@@ -1,11 +1,13 @@
+import bisect
 import copy
+import functools
 import string
 from datetime import datetime
 from enum import Enum
 import random
-from typing import Optional, List, Dict, Union
+from typing import ClassVar, Optional, List, Dict, Union
 
-from pydantic import PrivateAttr
+from pydantic import BaseModel, PrivateAttr
 
 from domain_layer.common._domain_objects import AggregateRoot
 from domain_layer.common.auxiliary import BaseVariableChange
@@ -41,9 +43,23 @@ class GameStory(BaseStory):
 
 
 class GameScenario(BaseScenario):
+    """The runtime version of a scenario. It is immutable, so that all games of a scenario can share one instance."""
     stories: List[GameStory] = []
     _variables: Dict[str, GameVariable] = {}
 
+    class Config:
+        allow_mutation = False
+
+    @classmethod
+    def validate(cls, value):
+        """
+        Instances are used as they are when a game is validated, instead of being copied for every game.
+        Pydantic copies model instances on validation, which copy_on_model_validation can not prevent before 1.10.
+        """
+        if isinstance(value, cls):
+            return value
+        return super().validate(value)
+
     @classmethod
     def _prepare_variables_from_dict(cls, var_dict: dict):
         if var_dict:
@@ -53,6 +69,35 @@ class GameScenario(BaseScenario):
         return var_dict
 
 
+_event_commands: Dict[str, str] = {}
+
+
+def records_event(event_type: str):
+    """
+    Mark a method of a game as a command, whose calls are recorded as events of this type if the game is
+    event-sourced (see Game.apply_events()). Only the outermost command is recorded, since the commands it calls
+    are called again when it is replayed. Commands that raise an error are not recorded.
+    """
+    def decorator(command):
+        _event_commands[event_type] = command.__name__
+
+        @functools.wraps(command)
+        def recorded_command(self, *args, **kwargs):
+            if self._command_time is not None:
+                return command(self, *args, **kwargs)
+            self._command_time = datetime.now()
+            try:
+                result = command(self, *args, **kwargs)
+                if self.is_event_sourced:
+                    self._unsaved_events.append({"type": event_type, "args": list(args), "kwargs": kwargs,
+                                                 "timestamp": self._command_time})
+                return result
+            finally:
+                self._command_time = None
+        return recorded_command
+    return decorator
+
+
 class Game(AggregateRoot):
     """A scenario that is currently being played or has been played."""
     _start_time: Optional[datetime] = PrivateAttr(None)
@@ -64,16 +109,26 @@ class Game(AggregateRoot):
     scenario: GameScenario
     game_variables: Dict[str, GameVariable] = {}
     _inject_counter: Dict[str, int] = PrivateAttr({})
+    _persisted_state: Optional[dict] = PrivateAttr(None)
+    _archived_at: Optional[datetime] = PrivateAttr(None)
+    _event_sequence: Optional[int] = PrivateAttr(None)
+    _snapshot_sequence: Optional[int] = PrivateAttr(None)
+    _unsaved_events: List[dict] = PrivateAttr([])
+    _command_time: Optional[datetime] = PrivateAttr(None)
 
     def __init__(self, scenario: GameScenario, **kwargs):
         super().__init__(scenario=scenario, **kwargs)
         self._entity_id = kwargs.get("game_id")
+        self._version = kwargs.get("version", None)
         self._start_time = kwargs.get("start_time", datetime.now())
         self._end_time = kwargs.get("end_time", None)
         self._game_state = GameState(kwargs.get("game_state", "open"))
         self._current_story_index = kwargs.get("current_story_index", 0)
         self._current_inject_slug = kwargs.get("current_inject", "")
         self._inject_counter = kwargs.get("inject_counter", self._initialize_inject_counter())
+        self._archived_at = kwargs.get("archived_at", None)
+        self._event_sequence = kwargs.get("event_sequence", None)
+        self._snapshot_sequence = self._event_sequence
 
     def _initialize_inject_counter(self):
         inject_counter = {}
@@ -120,6 +175,11 @@ class Game(AggregateRoot):
         """determine whether this game is already closed."""
         return self._game_state in [GameState.Aborted, GameState.Finished]
 
+    @property
+    def is_archived(self):
+        """determine whether this closed game has been moved to the archive. Archived games can not be changed."""
+        return self._archived_at is not None
+
     @property
     def end_time(self):
         """:return: the timestamp when this game was closed. None if it is not yet closed."""
@@ -139,20 +199,23 @@ class Game(AggregateRoot):
             return inject
         return None
 
+    @records_event("game_started")
     def start_game(self):
         """Begin the actual game and prepare to show the inject."""
-        self._start_time = datetime.now()
+        self._start_time = self._now()
         self._game_state = GameState.In_Progress
         self.game_variables = copy.deepcopy(self.scenario.variables)
         self._current_inject_slug = self.current_story.entry_node.slug
         self._current_story_index = 0
-        self._inject_counter[self._current_inject_slug] += 1
+        self._begin_inject_visit(self._current_inject_slug)
 
+    @records_event("game_aborted")
     def abort_game(self):
         """Prematurely end this game."""
         self._game_state = GameState.Aborted
-        self._end_time = datetime.now()
+        self._end_time = self._now()
 
+    @records_event("variable_set")
     def set_game_variable(self, var_name: str, new_value):
         """Set the value of one this game's variables to a new value."""
         var = self.game_variables.get(var_name, None)
@@ -237,13 +300,17 @@ class Game(AggregateRoot):
 
         :param next_inject: either an object of type GameInject or None"""
         if next_inject:
-            self._inject_counter[self._current_inject_slug] += 1
+            self._begin_inject_visit(self._current_inject_slug)
             self._current_inject_slug = next_inject.slug
             return next_inject
         else:
             self.end_game()
             return next_inject
 
+    def _begin_inject_visit(self, inject_slug: str):
+        """Count that an inject is shown (once again)."""
+        self._inject_counter[inject_slug] = self._inject_counter.get(inject_slug, 0) + 1
+
     def _begin_next_story(self):
         """Begin the next story and return the first inject from that story.
         :returns: the first inject of the next story if one exists, None otherwise."""
@@ -254,15 +321,112 @@ class Game(AggregateRoot):
             self.end_game()
             return None
 
+    @records_event("game_ended")
     def end_game(self):
         """
         Finish this game. It can now no longer be played.
         """
         self._game_state = GameState.Finished
-        self._end_time = datetime.now()
+        self._end_time = self._now()
+
+    def _now(self):
+        """:returns: the time of the current command, which is the time of its event when the event is replayed."""
+        return self._command_time or datetime.now()
+
+    @property
+    def is_event_sourced(self):
+        """
+        determine whether the commands of this game are stored as events. The document of an event-sourced game is
+        only a snapshot of its state, which is brought up to date by replaying the events after it.
+        """
+        return self._event_sequence is not None
+
+    @property
+    def event_sequence(self):
+        """:return: the sequence number of the last stored events of this game. None, if it is not event-sourced."""
+        return self._event_sequence
+
+    @property
+    def events_since_snapshot(self):
+        """:return: how many event sequence numbers have been stored since the last snapshot of this game."""
+        if not self.is_event_sourced:
+            return 0
+        return self._event_sequence - self._snapshot_sequence
+
+    def enable_event_sourcing(self):
+        """Record the commands of this game as events from now on. Must be called before the game is first saved."""
+        if not self.is_event_sourced:
+            self._event_sequence = 0
+            self._snapshot_sequence = 0
+
+    def get_unsaved_events(self):
+        """
+        :returns: the events of the commands since this game was last saved, in the form of
+        {"type", "args", "kwargs", "timestamp"}.
+        """
+        return list(self._unsaved_events)
+
+    def mark_events_persisted(self, sequence: int):
+        """Remember that the unsaved events have been stored with the given sequence number."""
+        self._event_sequence = sequence
+        self._unsaved_events = []
+
+    def apply_events(self, sequence: int, events: List[dict]):
+        """
+        Bring this game up to date by replaying stored events (see get_unsaved_events()) in their order.
+        The changes of replayed events count as unsaved changes until the next snapshot.
+        :param sequence: the sequence number of the last of the events.
+        """
+        for event in events:
+            self._command_time = event["timestamp"]
+            try:
+                getattr(self, _event_commands[event["type"]])(*event["args"], **event["kwargs"])
+            finally:
+                self._command_time = None
+        self._event_sequence = sequence
+
+    def mark_snapshot(self):
+        """Remember that the current state of this game, including all its events, has been saved as a snapshot."""
+        self._snapshot_sequence = self._event_sequence
+        self.mark_persisted()
+
+    def get_changes(self):
+        """
+        Determine how this game has changed since it was last loaded or saved.
+        :returns: an update statement that contains only the changes. Empty, if nothing has changed.
+        """
+        current_state = self._get_persistent_state()
+        if self._persisted_state is None:
+            return {"$set": current_state}
+        changed_fields = {key: value for key, value in current_state.items()
+                          if key not in self._persisted_state or self._persisted_state[key] != value}
+        if changed_fields:
+            return {"$set": changed_fields}
+        return {}
+
+    def mark_persisted(self):
+        """Remember the current state of this game as the one that has been saved."""
+        self._persisted_state = copy.deepcopy(self._get_persistent_state())
+
+    def _get_persistent_state(self):
+        """:returns: the fields of this game that are compared to determine its changes."""
+        return self.dict()
+
+    def get_document(self):
+        """:returns: the fields of this game that are stored in its document (see also get_unsaved_history())."""
+        return self.dict()
+
+    def get_unsaved_history(self):
+        """:returns: a list of the solutions that have been submitted since this game was last saved."""
+        return []
+
+    def load_history(self, entries: List[dict]):
+        """Add solutions that have been stored separately from the game (see get_unsaved_history())."""
+        pass
 
     def dict(self, **kwargs):
         kwargs["by_alias"] = True
+        kwargs["exclude"] = set(kwargs.get("exclude") or []) | {"scenario"}
         return_dict = super().dict(**kwargs)
         return_dict.update(
             {"start_time": self._start_time,
@@ -273,7 +437,8 @@ class Game(AggregateRoot):
              "type": self._type,
              "scenario_id": self.scenario.scenario_id,
              "inject_counter": self._inject_counter})
-        return_dict.pop("scenario")
+        if self.is_event_sourced:
+            return_dict["event_sequence"] = self._event_sequence
         return return_dict
 
     def __str__(self):
@@ -300,17 +465,73 @@ class SingleGame(Game):
         return next_inject
 
 
+class SolutionTally(BaseModel):
+    """
+    Counts the solutions to an inject during its current visit (i.e. since it has last been shown),
+    so that the answers of a group can be evaluated without going through all of its participants.
+    """
+    visit: int = 0
+    solved: int = 0
+    expected: Optional[int] = None
+    solutions: Dict[str, int] = {}
+
+    def count_solution(self, solution: str, already_solved: bool, replaced_solution: str = None):
+        """
+        Count a solution that a participant has submitted.
+        :param already_solved: whether the participant has already solved the inject during this visit.
+        :param replaced_solution: Optional. The solution of the participant that is replaced by this one.
+        """
+        if not already_solved:
+            self.solved += 1
+        elif self.solutions.get(replaced_solution, 0) > 0:
+            self.solutions[replaced_solution] -= 1
+            if not self.solutions[replaced_solution]:
+                del self.solutions[replaced_solution]
+        self.solutions[solution] = self.solutions.get(solution, 0) + 1
+
+    def count_unsolved(self, number_of_participants: int):
+        """
+        :param number_of_participants: the number of participants of the game, which are expected to solve the inject
+        if the tally has been saved before it counted them.
+        :returns: how many of the expected participants have not yet solved the inject during this visit.
+        """
+        expected = self.expected if self.expected is not None else number_of_participants
+        return max(expected - self.solved, 0)
+
+
 class GroupGame(Game):
     """A Game that can be played collaboratively
     (by a group of participants who all share the same variables and injects)."""
     breakpoints: List[str] = []
     next_inject_allowed: bool = False
     participants: Dict[str, GameParticipant] = {}
+    solution_tallies: Dict[str, SolutionTally] = {}
+    visit_log: List[str] = []
     _type: str = "GROUP_GAME"
+    placeholder_solution: ClassVar[str] = "-1"
+    _persisted_tallies: Dict[str, dict] = PrivateAttr({})
+    _visit_positions: Dict[str, List[int]] = PrivateAttr({})
 
     def __init__(self, scenario: GameScenario, **kwargs):
         super().__init__(scenario, **kwargs)
+        if not self.visit_log and any(self._inject_counter.values()):
+            self.visit_log = self._reconstruct_visit_log()
+        for position, inject_slug in enumerate(self.visit_log):
+            self._visit_positions.setdefault(inject_slug, []).append(position)
 
+    def _reconstruct_visit_log(self):
+        """
+        Games that have been saved without a visit log only know how often each inject has been shown.
+        The order of these visits only matters relative to the current visit, which is put last.
+        """
+        visit_log = []
+        for inject_slug, visit_count in self._inject_counter.items():
+            if inject_slug != self._current_inject_slug:
+                visit_log.extend([inject_slug] * visit_count)
+        current_visit_count = self._inject_counter.get(self._current_inject_slug, 0)
+        return visit_log + [self._current_inject_slug] * current_visit_count
+
+    @records_event("breakpoint_added")
     def add_breakpoint(self, inject_slug: str):
         """
         Add a breakpoint which prevents players from moving past a specific story.
@@ -319,6 +540,7 @@ class GroupGame(Game):
         """
         self.breakpoints.append(inject_slug)
 
+    @records_event("breakpoint_removed")
     def remove_breakpoint(self, inject_slug: str):
         """Remove a breakpoint for a given inject."""
         self.breakpoints.remove(inject_slug)
@@ -326,32 +548,179 @@ class GroupGame(Game):
     def add_participant(self, participant_hash: str = ""):
         """Add another participant to this game."""
         if not participant_hash:
-            participant_hash = self._generate_participant_hash()
+            participant_hash = self.generate_participant_hash()
         if participant_hash not in self.participants:
-            participant = GameParticipant(participant_id=participant_hash)
-            if self.is_in_progress and self._inject_counter[self._current_inject_slug] >= 0:
-                participant.initialize_history(self._inject_counter, self._current_inject_slug)
-            self.participants[participant_hash] = participant
+            self._join_participant(participant_hash)
         return participant_hash
 
+    @records_event("participant_joined")
+    def _join_participant(self, participant_hash: str):
+        """
+        Participants who join a game in progress are not expected to solve the injects that have been shown before.
+        Instead of solutions, they only remember the position of the current visit in the visit log as their baseline
+        (see get_solved_count()).
+        """
+        joined_at_visit = len(self.visit_log)
+        if self.is_in_progress and self.visit_log:
+            joined_at_visit -= 1
+        self.participants[participant_hash] = GameParticipant(participant_id=participant_hash,
+                                                              joined_at_visit=joined_at_visit)
+        tally = self.solution_tallies.get(self._current_inject_slug)
+        if tally is not None and tally.expected is not None:
+            tally.expected += 1
+
+    def get_changes(self):
+        """
+        Determine how this game has changed since it was last loaded or saved.
+        New participants are set as a whole (without their history), while only the counters of solved injects
+        are set for known participants. Their solutions are stored separately (see get_unsaved_history()).
+        :returns: an update statement that contains only the changes. Empty, if nothing has changed.
+        Tallies are set per inject.
+        """
+        update_statement = super().get_changes()
+        for inject_slug, tally in self.solution_tallies.items():
+            tally_document = tally.dict()
+            if self._persisted_tallies.get(inject_slug) != tally_document:
+                update_statement.setdefault("$set", {})["solution_tallies.{}".format(inject_slug)] = tally_document
+        for participant_id, participant in self.participants.items():
+            participant_path = "participants.{}".format(participant_id)
+            if not participant.is_persisted:
+                update_statement.setdefault("$set", {})[participant_path] = participant.get_document()
+                continue
+            for inject_slug in {entry.inject_slug for entry in participant.get_unsaved_history()}:
+                counter_path = "{}.solved_counts.{}".format(participant_path, inject_slug)
+                update_statement.setdefault("$set", {})[counter_path] = participant.solved_count(inject_slug)
+        return update_statement
+
+    def get_document(self):
+        game_dict = self.dict(exclude={"participants"})
+        game_dict["participants"] = {participant_id: participant.get_document()
+                                     for participant_id, participant in self.participants.items()}
+        return game_dict
+
+    def get_unsaved_history(self):
+        """
+        :returns: a list of the solutions that have been submitted since this game was last saved, in the form of
+        {"participant_id", "inject_slug", "solution", "timestamp", "sequence"}, where the sequence numbers the
+        solutions of a participant to the same inject (starting with 1).
+        """
+        unsaved_history = []
+        for participant_id, participant in self.participants.items():
+            entries = participant.get_unsaved_history()
+            sequences = {entry.inject_slug: participant.solved_count(entry.inject_slug) for entry in entries}
+            for entry in entries:
+                sequences[entry.inject_slug] -= 1
+            for entry in entries:
+                sequences[entry.inject_slug] += 1
+                unsaved_history.append(dict(entry.dict(), participant_id=participant_id,
+                                            sequence=sequences[entry.inject_slug]))
+        return unsaved_history
+
+    def load_history(self, entries: List[dict]):
+        """
+        Add stored solutions to the histories of the participants (see group_stored_history()).
+        :param entries: solutions in the form returned by get_unsaved_history(), ordered by their sequence.
+        """
+        solved_counts = {participant_id: participant.solved_counts
+                         for participant_id, participant in self.participants.items()}
+        for participant_id, participant_entries in self.group_stored_history(solved_counts, entries).items():
+            self.participants[participant_id].load_history(participant_entries)
+
+    @staticmethod
+    def group_stored_history(solved_counts: Dict[str, Dict[str, int]], entries: List[dict]):
+        """
+        Group stored solutions by their participants. Solutions whose sequence exceeds the count of their participant
+        have been stored by an update of the game that failed afterwards, so they are skipped, just like the
+        solutions of unknown participants and repeated solutions with the same sequence.
+        :param solved_counts: a dict of {participant_id: {inject_slug: number of solutions}}.
+        :param entries: solutions in the form returned by get_unsaved_history(), ordered by their sequence.
+        :returns: a dict of {participant_id: [entry, ...]}.
+        """
+        entries_by_participant = {}
+        seen_keys = set()
+        for entry in entries:
+            participant_counts = solved_counts.get(entry["participant_id"])
+            if participant_counts is None or entry.get("sequence", 0) > participant_counts.get(entry["inject_slug"], 0):
+                continue
+            if "sequence" in entry:
+                key = (entry["participant_id"], entry["inject_slug"], entry["sequence"])
+                if key in seen_keys:
+                    continue
+                seen_keys.add(key)
+            entries_by_participant.setdefault(entry["participant_id"], []).append(entry)
+        return entries_by_participant
+
+    def mark_persisted(self):
+        super().mark_persisted()
+        self._persisted_tallies = {inject_slug: tally.dict() for inject_slug, tally in self.solution_tallies.items()}
+        for participant in self.participants.values():
+            participant.mark_persisted()
+
+    def _get_persistent_state(self):
+        return self.dict(exclude={"participants", "solution_tallies"})
+
     def number_of_participants(self):
         """:return: how many active participants this game currently has."""
         return len(self.participants)
 
+    @records_event("solution_submitted")
     def solve_inject(self, participant_id, inject_slug, solution):
         """Have a single participant submit their solution to an inject."""
         if participant_id not in self.participants:
             self.add_participant(participant_id)
-        self.participants[participant_id].solve_inject(inject_slug, solution)
+        participant = self.participants[participant_id]
+        tally = self.get_solution_tally(inject_slug)
+        already_solved = self.get_solved_count(participant, inject_slug) >= tally.visit
+        replaced_solution = participant.get_solution(inject_slug) if already_solved else None
+        participant.solve_inject(inject_slug, solution, timestamp=self._now())
+        tally.count_solution(str(solution), already_solved, replaced_solution)
+
+    def get_solution_tally(self, inject_slug: str):
+        """
+        :returns: the SolutionTally of the current visit of an inject. Games that have been saved without tallies
+        are counted once from the loaded solutions of their participants.
+        """
+        visit = self._inject_counter.get(inject_slug, 0)
+        tally = self.solution_tallies.get(inject_slug)
+        if tally is None or tally.visit != visit:
+            tally = self._count_solutions(inject_slug, visit)
+            self.solution_tallies[inject_slug] = tally
+        return tally
+
+    def _count_solutions(self, inject_slug: str, visit: int):
+        tally = SolutionTally(visit=visit, expected=len(self.participants))
+        for participant in self.participants.values():
+            if self.get_solved_count(participant, inject_slug) >= visit:
+                tally.solved += 1
+                solution = participant.get_solution(inject_slug)
+                if solution is not None and solution != self.placeholder_solution:
+                    tally.solutions[solution] = tally.solutions.get(solution, 0) + 1
+        return tally
+
+    def _begin_inject_visit(self, inject_slug: str):
+        super()._begin_inject_visit(inject_slug)
+        self._visit_positions.setdefault(inject_slug, []).append(len(self.visit_log))
+        self.visit_log.append(inject_slug)
+        self.solution_tallies[inject_slug] = self._count_solutions(inject_slug, self._inject_counter[inject_slug])
+
+    def get_solved_count(self, participant: GameParticipant, inject_slug: str):
+        """
+        :returns: how often a participant has solved an inject, where the visits of the inject before the participant
+        joined count as solved.
+        """
+        visits_before_joining = bisect.bisect_left(self._visit_positions.get(inject_slug, []),
+                                                   participant.joined_at_visit)
+        return participant.solved_count(inject_slug) + visits_before_joining
 
     def has_participant_solved(self, participant_hash: str):
         """Check whether a participant has solved the current inject."""
         participant = self.participants.get(participant_hash, False)
         if not participant:
             return False
-        solved_count = participant.solved_count(self._current_inject_slug)
+        solved_count = self.get_solved_count(participant, self._current_inject_slug)
         return solved_count >= self._inject_counter[self._current_inject_slug]
 
+    @records_event("next_inject_allowed")
     def allow_next_inject(self):
         """Allow advancement of the game, even if this were not possible otherwise."""
         self.next_inject_allowed = True
@@ -362,11 +731,9 @@ class GroupGame(Game):
             return True
         if self._current_inject_slug in self.breakpoints:
             return False
-        for participant in self.participants:
-            if not self.has_participant_solved(participant):
-                return False
-        return True
+        return self.get_solution_tally(self._current_inject_slug).count_unsolved(len(self.participants)) == 0
 
+    @records_event("advanced")
     def advance(self):
         """Returns the next inject in the story."""
         self.next_inject_allowed = False
@@ -390,22 +757,37 @@ class GroupGame(Game):
         return most_popular
 
     def determine_group_answers(self, inject_slug: str):
-        """Evaluate how often each solution has occurred."""
+        """
+        Evaluate how often each solution has occurred during the current visit of an inject.
+        Participants who have not yet solved it are counted as "no solution".
+        """
         inject = self.get_inject(inject_slug)
+        tally = self.get_solution_tally(inject.slug)
         solution_occurrences = {}
-        for participant_id, participant in self.participants.items():
-            if participant.has_solved(inject.slug):
-                solution = participant.get_solution(inject.slug)
-                if inject.has_choices:
-                    solution = str(inject.choices[int(solution)])
-            else:
-                solution = "no solution"
-            number_of_occurrences = solution_occurrences.get(solution, 0) + 1
-            solution_occurrences[solution] = number_of_occurrences
+        for solution, number_of_occurrences in tally.solutions.items():
+            if inject.has_choices:
+                solution = self._get_choice_label(inject, solution)
+            if solution is None:
+                continue
+            solution_occurrences[solution] = solution_occurrences.get(solution, 0) + number_of_occurrences
+        unsolved_count = tally.count_unsolved(len(self.participants))
+        if unsolved_count > 0:
+            solution_occurrences["no solution"] = unsolved_count
         return solution_occurrences
 
     @staticmethod
-    def _generate_participant_hash():
+    def _get_choice_label(inject: GameInject, solution: str):
+        """:returns: the label of the choice with the index of the solution. None, if there is no such choice."""
+        try:
+            choice_index = int(solution)
+        except (TypeError, ValueError):
+            return None
+        if not 0 <= choice_index < len(inject.choices):
+            return None
+        return str(inject.choices[choice_index])
+
+    @staticmethod
+    def generate_participant_hash():
         letters = string.ascii_lowercase
         random_string = ''.join(random.choice(letters) for i in range(10))
         return random_string
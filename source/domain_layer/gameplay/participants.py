@@ -1,7 +1,8 @@
-from datetime import datetime
-from typing import List
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class InjectHistory(BaseModel):
@@ -14,14 +15,198 @@ class InjectHistory(BaseModel):
         allow_mutation = False
 
 
+class ParticipantHistory:
+    """
+    The solutions of a participant in a compact form. Instead of one InjectHistory per solution, every solution is
+    stored as the index of its inject in a table of slugs, the code of its value in a table of distinct solutions and
+    the number of microseconds since the first solution, each in an array of small integers.
+    Entries are only turned into InjectHistory objects when they are read. The number of solutions and the latest
+    solution per inject are indexed, so that they can be looked up without reading the entries.
+    """
+    __slots__ = ("_inject_slugs", "_inject_positions", "_inject_indices", "_solutions", "_solution_codes_by_value",
+                 "_solution_codes", "_epoch", "_timestamp_offsets", "_counts", "_latest_codes")
+
+    def __init__(self, entries: List[Union[InjectHistory, dict]] = ()):
+        self._inject_slugs: List[str] = []
+        self._inject_positions: Dict[str, int] = {}
+        self._inject_indices = array("H")
+        self._solutions: List[str] = []
+        self._solution_codes_by_value: Dict[str, int] = {}
+        self._solution_codes = array("I")
+        self._epoch: Optional[datetime] = None
+        self._timestamp_offsets = array("q")
+        self._counts: Dict[int, int] = {}
+        self._latest_codes: Dict[int, int] = {}
+        self.extend(entries)
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value):
+        """
+        Accept a history, a list of solutions (InjectHistory objects or their dicts) or a document from to_document().
+        A history is copied, so that participants never share one.
+        """
+        if isinstance(value, cls):
+            return value.copy()
+        if isinstance(value, dict):
+            return cls.from_document(value)
+        if isinstance(value, (list, tuple)):
+            return cls(value)
+        raise TypeError("A history must be a list of solutions or a columnar history document!")
+
+    def append(self, inject_slug: str, solution, timestamp: datetime = None):
+        """Add a solution to the end of this history."""
+        timestamp = timestamp or datetime.now()
+        if self._epoch is None:
+            self._epoch = timestamp
+        inject_index = self._inject_positions.get(inject_slug)
+        if inject_index is None:
+            inject_index = self._inject_positions[inject_slug] = len(self._inject_slugs)
+            self._inject_slugs.append(inject_slug)
+        solution = str(solution)
+        solution_code = self._solution_codes_by_value.get(solution)
+        if solution_code is None:
+            solution_code = self._solution_codes_by_value[solution] = len(self._solutions)
+            self._solutions.append(solution)
+        self._inject_indices.append(inject_index)
+        self._solution_codes.append(solution_code)
+        self._timestamp_offsets.append((timestamp - self._epoch) // timedelta(microseconds=1))
+        self._counts[inject_index] = self._counts.get(inject_index, 0) + 1
+        self._latest_codes[inject_index] = solution_code
+
+    def extend(self, entries: List[Union[InjectHistory, dict]]):
+        """Add solutions (InjectHistory objects or dicts with the same fields) to the end of this history."""
+        for entry in entries:
+            if isinstance(entry, dict):
+                self.append(entry["inject_slug"], entry["solution"], entry.get("timestamp"))
+            else:
+                self.append(entry.inject_slug, entry.solution, entry.timestamp)
+
+    def count(self, inject_slug: str) -> int:
+        """:returns: how many solutions to this inject the history contains."""
+        inject_index = self._inject_positions.get(inject_slug)
+        return 0 if inject_index is None else self._counts[inject_index]
+
+    def count_by_inject(self) -> Dict[str, int]:
+        """:returns: a dict of {inject_slug: number of solutions} for all injects in this history."""
+        return {self._inject_slugs[inject_index]: count for inject_index, count in self._counts.items()}
+
+    def get_latest_solution(self, inject_slug: str) -> Optional[str]:
+        """:returns: the last solution to this inject. None, if the history does not contain the inject."""
+        inject_index = self._inject_positions.get(inject_slug)
+        return None if inject_index is None else self._solutions[self._latest_codes[inject_index]]
+
+    def copy(self):
+        """:returns: an independent copy of this history."""
+        history = ParticipantHistory()
+        history._inject_slugs = list(self._inject_slugs)
+        history._inject_positions = dict(self._inject_positions)
+        history._inject_indices = array("H", self._inject_indices)
+        history._solutions = list(self._solutions)
+        history._solution_codes_by_value = dict(self._solution_codes_by_value)
+        history._solution_codes = array("I", self._solution_codes)
+        history._epoch = self._epoch
+        history._timestamp_offsets = array("q", self._timestamp_offsets)
+        history._counts = dict(self._counts)
+        history._latest_codes = dict(self._latest_codes)
+        return history
+
+    def to_document(self) -> dict:
+        """:returns: this history as a columnar document, which can be read with from_document()."""
+        return {"injects": list(self._inject_slugs),
+                "inject_indices": self._inject_indices.tolist(),
+                "solutions": list(self._solutions),
+                "solution_codes": self._solution_codes.tolist(),
+                "epoch": self._epoch,
+                "timestamp_offsets": self._timestamp_offsets.tolist()}
+
+    @classmethod
+    def from_document(cls, document: dict):
+        history = cls()
+        history._inject_slugs = list(document["injects"])
+        history._inject_positions = {inject_slug: index for index, inject_slug in enumerate(history._inject_slugs)}
+        history._inject_indices = array("H", document["inject_indices"])
+        history._solutions = list(document["solutions"])
+        history._solution_codes_by_value = {solution: code for code, solution in enumerate(history._solutions)}
+        history._solution_codes = array("I", document["solution_codes"])
+        history._epoch = document["epoch"]
+        history._timestamp_offsets = array("q", document["timestamp_offsets"])
+        for inject_index, solution_code in zip(history._inject_indices, history._solution_codes):
+            history._counts[inject_index] = history._counts.get(inject_index, 0) + 1
+            history._latest_codes[inject_index] = solution_code
+        return history
+
+    def _get_entry(self, position: int) -> InjectHistory:
+        return InjectHistory.construct(inject_slug=self._inject_slugs[self._inject_indices[position]],
+                                       solution=self._solutions[self._solution_codes[position]],
+                                       timestamp=self._epoch + timedelta(microseconds=self._timestamp_offsets[position]))
+
+    def __len__(self):
+        return len(self._inject_indices)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._get_entry(position)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._get_entry(position) for position in range(*item.indices(len(self)))]
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("history index out of range")
+        return self._get_entry(item)
+
+    def __eq__(self, other):
+        if not isinstance(other, ParticipantHistory):
+            return NotImplemented
+        return [entry.dict() for entry in self] == [entry.dict() for entry in other]
+
+    def __repr__(self):
+        return "ParticipantHistory({} solutions to {} injects)".format(len(self), len(self._inject_slugs))
+
+
 class GameParticipant(BaseModel):
-    """A participant of a GroupGame."""
+    """
+    A participant of a GroupGame.
+    The history only contains the solutions that have been loaded (usually those of the current inject),
+    while solved_counts counts all solutions of this participant per inject.
+    The history is kept in the compact form of a ParticipantHistory, which also indexes the latest solution to each
+    inject. It is accepted as a list of solutions or as a columnar document, which is what dict() returns.
+    A given history is copied (see ParticipantHistory.validate()). Like all fields, it is only shared by shallow
+    copies of a participant, i.e. copy() without deep=True.
+    joined_at_visit is the position in the visit log of its game at which the participant joined
+    (see GroupGame.get_solved_count()).
+    """
     participant_id: str
-    history: List[InjectHistory] = []
+    history: ParticipantHistory = Field(default_factory=ParticipantHistory)
+    solved_counts: Dict[str, int] = {}
+    joined_at_visit: int = 0
+    _persisted_history_length: Optional[int] = PrivateAttr(None)
+
+    def __init__(self, **data):
+        super().__init__(**data)
+        for inject_slug, history_count in self.history.count_by_inject().items():
+            if self.solved_counts.get(inject_slug, 0) < history_count:
+                self.solved_counts[inject_slug] = history_count
+
+    def solve_inject(self, inject_slug: str, solution, timestamp: datetime = None):
+        """
+        Append the solution for this inject to the solution history of this participant.
+        :param timestamp: Optional. When the solution has been submitted. Defaults to now.
+        """
+        self.history.append(inject_slug, solution, timestamp)
+        self.solved_counts[inject_slug] = self.solved_counts.get(inject_slug, 0) + 1
 
-    def solve_inject(self, inject_slug: str, solution):
-        """Append the solution for this inject to the solution history of this participant."""
-        self.history.append(InjectHistory(inject_slug=inject_slug, solution=solution))
+    def load_history(self, entries: List[Union[InjectHistory, dict]]):
+        """
+        Add solutions that have been stored before. Unlike solve_inject(), they are not counted again.
+        :param entries: InjectHistory objects or dicts with the same fields.
+        """
+        self.history.extend(entries)
 
     def has_solved(self, inject_slug: str):
         """
@@ -30,26 +215,35 @@ class GameParticipant(BaseModel):
         return self.solved_count(inject_slug) > 0
 
     def solved_count(self, inject_slug: str):
-        solved_count = 0
-        for entry in self.history:
-            if entry.inject_slug == inject_slug:
-                solved_count += 1
-        return solved_count
+        return self.solved_counts.get(inject_slug, 0)
 
     def get_solution(self, inject_slug):
         """Check, how this participant has solved a given inject.
         :return: the solution provided by the participant, if they have solved this inject. None otherwise."""
-        for entry in reversed(self.history):
-            if entry.inject_slug == inject_slug:
-                return entry.solution
-        return None
-
-    def initialize_history(self, inject_counter, current_inject_slug):
-        for inject_slug, inject_count in inject_counter.items():
-            if inject_slug == current_inject_slug:
-                inject_count -= 1
-            for count in range(inject_count):
-                self.solve_inject(inject_slug, solution=-1)
+        return self.history.get_latest_solution(inject_slug)
+
+    @property
+    def is_persisted(self):
+        """:returns: True, if this participant has already been saved as part of its game."""
+        return self._persisted_history_length is not None
+
+    def get_unsaved_history(self):
+        """:returns: the entries of the history that have been added since this participant was last saved."""
+        return self.history[self._persisted_history_length or 0:]
+
+    def mark_persisted(self):
+        """Remember that the current history has been saved."""
+        self._persisted_history_length = len(self.history)
+
+    def get_document(self):
+        """:returns: the fields of this participant that are stored in the document of its game."""
+        return self.dict(exclude={"history"})
+
+    def dict(self, **kwargs):
+        participant_dict = super().dict(**kwargs)
+        if "history" in participant_dict:
+            participant_dict["history"] = self.history.to_document()
+        return participant_dict
 
 
 class AuthenticatedParticipant(BaseModel):
@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import List
 
 from domain_layer.common.auxiliary import BaseScenarioVariable
+from domain_layer.common.injects import MediaVariant
 from domain_layer.common.scenario_management import ScenarioRepository, ScenarioFactory
 from domain_layer.scenariodesign.injects import EditableInject
 from domain_layer.scenariodesign.scenarios import EditableScenario, EditableStory
@@ -40,7 +41,26 @@ class EditableScenarioRepository(ScenarioRepository):
 
     @classmethod
     def save_variable(cls, scenario_id, variable: BaseScenarioVariable):
-        """Add a scenario variable to an editable scenario."""
-        scenario = cls.get_scenario_by_id(scenario_id)
-        scenario.variables[variable.name] = variable
-        return cls.save_scenario(scenario)
+        """Add a scenario variable to an editable scenario. Invalidates the cached scenario via save_scenario."""
+        def add_variable(attempt):
+            scenario = cls.get_scenario_by_id(scenario_id)
+            scenario.variables[variable.name] = variable
+            return cls.save_scenario(scenario)
+        return cls._retry_on_conflict(add_variable)
+
+    @classmethod
+    def save_media_variants(cls, scenario_id, media_path: str, media_variants: List[MediaVariant]):
+        """
+        Attach the variants of an image to all injects of a scenario that show this image.
+        Injects whose image has been replaced in the meantime are left unchanged.
+        :returns: the number of injects that have been changed.
+        """
+        def attach_variants(attempt):
+            scenario = cls.get_scenario_by_id(scenario_id)
+            injects = [inject for inject in scenario.get_all_injects() if inject.media_path == media_path]
+            for inject in injects:
+                inject.media_variants = list(media_variants)
+            if injects:
+                cls.save_scenario(scenario)
+            return len(injects)
+        return cls._retry_on_conflict(attach_variants)
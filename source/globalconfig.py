@@ -15,7 +15,7 @@ def _load_config_dict():
 
 class _Config:
     _config_dict = _load_config_dict()
-    _env = "DEV"
+    _env = os.environ.get("CSEP_ENV", "DEV")
 
     @classmethod
     def get_flask_config(cls):
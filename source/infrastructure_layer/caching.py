@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe cache of at most max_size entries, each of which expires ttl seconds after it has been stored.
+    If the cache is full, the least recently used entry is evicted.
+    """
+    def __init__(self, max_size: int = 128, ttl: float = 300, clock=time.monotonic):
+        """
+        :param max_size: the maximum number of entries. A cache with a max_size of 0 stores nothing.
+        :param ttl: the number of seconds after which an entry expires. None if entries should never expire.
+        :param clock: a function that returns the current time in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        """:returns: the cached value for the key, or the default if the key is not cached (any longer)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key, value):
+        """Store a value. Evicts the least recently used entries, if the cache is full."""
+        if self.max_size <= 0:
+            return
+        expires_at = self._clock() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, key):
+        """Remove a single entry, if it exists."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def invalidate_where(self, predicate):
+        """
+        Remove all entries whose key matches the predicate.
+        :param predicate: a function that takes a key and returns True if the entry is to be removed.
+        :returns: the number of removed entries.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self._stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        """:returns: a dict of the counters of hits, misses, evictions, expirations and invalidations."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"size": len(self._entries), "max_size": self.max_size})
+            return stats
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def create_cache_from_config(cache_name: str, max_size: int = 128, ttl: float = 300) -> LRUCache:
+    """
+    Create a cache with the settings of the current environment (e.g. DATABASE.PROD.CACHES.SCENARIOS in config.yml).
+    :param cache_name: the name of the cache within the CACHES section.
+    :param max_size: the maximum number of entries, if it is not configured.
+    :param ttl: the number of seconds after which entries expire, if it is not configured.
+    """
+    from globalconfig import config
+    cache_config = config.get_db_config().get("CACHES", {}).get(cache_name, {})
+    return LRUCache(max_size=cache_config.get("MAX_SIZE", max_size), ttl=cache_config.get("TTL_SECONDS", ttl))
@@ -1,23 +1,339 @@
+import os
+import threading
+
 import bson
 import pymongo
 from bson import ObjectId
 
+VERSION_FIELD = "version"
+
+
+class ConcurrentModificationError(Exception):
+    """Raised if an entity has been changed by someone else since it was loaded."""
+    pass
+
+
+class DuplicateKeyError(ValueError):
+    """Raised by all storage engines if an inserted document violates a unique key (e.g. its id already exists)."""
+    pass
+
+
+class DatabaseBackend:
+    """
+    The interface of a storage engine behind CustomDB.
+    Engines store schemaless documents in named collections and understand (a subset of) MongoDB-query expressions.
+    Documents returned by an engine must contain their id under the key "_id".
+    """
+    def get_collection(self, collection_name: str):
+        """:return: an engine-specific object that represents the collection."""
+        raise NotImplementedError
+
+    def find_one(self, collection_name: str, criteria: dict, projection: dict = None):
+        """:return: the first document that matches the criteria, None if no document matches."""
+        raise NotImplementedError
+
+    def find(self, collection_name: str, criteria: dict, projection: dict = None, sort: list = None,
+             limit: int = None):
+        """
+        :param projection: Optional. A dict of fields to include ({"title": 1}) or to exclude ({"stories": 0}).
+        :param sort: Optional. A list of (field, direction) pairs, where direction is 1 or -1.
+        :param limit: Optional. The maximum number of documents to return.
+        :return: an iterable over all documents that match the criteria.
+        """
+        raise NotImplementedError
+
+    def insert_one(self, collection_name: str, entity: dict):
+        """
+        :return: the id of the newly inserted document as a string.
+        :raises DuplicateKeyError: if a document with the same id (or unique index key) already exists.
+        """
+        raise NotImplementedError
+
+    def update_one(self, collection_name: str, entity_id, update_statement: dict, expected_version: int = None):
+        """
+        Apply an update statement (e.g. {"$set": {...}}) to a document. Inserts the document if it does not exist.
+        :param expected_version: Optional. If provided, the document is only changed if its VERSION_FIELD
+        (0, if it has none) still has this value. Documents are never inserted in this case.
+        :return: True, if the document has been changed, False if its version did not match.
+        """
+        raise NotImplementedError
+
+    def delete_one(self, collection_name: str, criteria: dict):
+        """Delete the first document that matches the criteria."""
+        raise NotImplementedError
+
+    def delete_many(self, collection_name: str, criteria: dict):
+        """Delete all documents that match the criteria."""
+        raise NotImplementedError
+
+    def list_indexes(self, collection_name: str):
+        """:return: the names of all secondary indexes of the collection (i.e. without the index on the id)."""
+        raise NotImplementedError
+
+    def create_index(self, collection_name: str, index):
+        """Create an index (see infrastructure_layer.indexes.IndexDefinition) unless it already exists."""
+        raise NotImplementedError
+
+    def get_index_usage(self, collection_name: str):
+        """:return: a dict of {index_name: number of times it has been used}. None if the engine does not track it."""
+        return None
+
+    def explain(self, collection_name: str, criteria: dict, sort: list = None):
+        """:return: a description of how the engine evaluates a query. None if the engine can not explain queries."""
+        return None
+
+    def close(self):
+        """Release all resources held by this engine."""
+        pass
+
+    def reset_after_fork(self):
+        """Drop all state that must not be shared with a forked child process."""
+        pass
+
+
+class MongoBackend(DatabaseBackend):
+    """
+    Wraps around the pymongo.MongoClient.
+    Legal MongoDB-query expressions can be found in the documentation:
+    https://docs.mongodb.com/manual/reference/operator/query/
+    """
+    _pool_options = dict(
+        MAX_POOL_SIZE="maxPoolSize",
+        MIN_POOL_SIZE="minPoolSize",
+        MAX_IDLE_TIME_MS="maxIdleTimeMS",
+        WAIT_QUEUE_TIMEOUT_MS="waitQueueTimeoutMS",
+        CONNECT_TIMEOUT_MS="connectTimeoutMS",
+        SOCKET_TIMEOUT_MS="socketTimeoutMS",
+        SERVER_SELECTION_TIMEOUT_MS="serverSelectionTimeoutMS"
+    )
+
+    def __init__(self, db_config):
+        self._db_config = db_config
+        self._client = None
+        self._client_pid = None
+        self._client_lock = threading.Lock()
+        self._collection_handles = {}
+
+    def get_client(self):
+        """
+        Get the MongoClient of this process. The client (and its connection pool) is created lazily
+        and shared by all threads. It is re-created if the process has been forked.
+        :return: a pymongo.MongoClient.
+        """
+        if self._client is None or self._client_pid != os.getpid():
+            with self._client_lock:
+                if self._client is None or self._client_pid != os.getpid():
+                    self._client = self._create_client()
+                    self._client_pid = os.getpid()
+                    self._collection_handles = {}
+        return self._client
+
+    def _create_client(self):
+        """Create a new MongoClient with the pool sizes and timeouts configured for the current environment."""
+        pool_config = self._db_config.get("POOL") or {}
+        client_options = {self._pool_options[key]: value for key, value in pool_config.items()
+                          if key in self._pool_options}
+        # connect=False defers opening sockets until the first operation, which makes the client safe to create
+        # before a prefork server forks its workers.
+        return pymongo.MongoClient(self._db_config.DB_HOST, connect=False, **client_options)
+
+    def close(self):
+        """Close the client of this process, if one exists. A new one will be created on the next database access."""
+        with self._client_lock:
+            if self._client is not None and self._client_pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._client_pid = None
+            self._collection_handles = {}
+
+    def reset_after_fork(self):
+        """The parent's client and lock state must not be inherited by a forked worker."""
+        self._client_lock = threading.Lock()
+        self._client = None
+        self._client_pid = None
+        self._collection_handles = {}
+
+    def get_collection(self, collection_name: str):
+        client = self.get_client()
+        coll = self._collection_handles.get(collection_name)
+        if coll is None:
+            coll = client[self._db_config.DB_NAME][collection_name]
+            self._collection_handles[collection_name] = coll
+        return coll
+
+    def find_one(self, collection_name: str, criteria: dict, projection: dict = None):
+        collection = self.get_collection(collection_name)
+        return collection.find_one(filter=self._build_filter(criteria), projection=projection)
+
+    def find(self, collection_name: str, criteria: dict, projection: dict = None, sort: list = None,
+             limit: int = None):
+        collection = self.get_collection(collection_name)
+        cursor = collection.find(self._build_filter(criteria), projection=projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    def insert_one(self, collection_name: str, entity: dict):
+        collection = self.get_collection(collection_name)
+        try:
+            return str(collection.insert_one(entity).inserted_id)
+        except pymongo.errors.DuplicateKeyError as e:
+            raise DuplicateKeyError(str(e)) from e
+
+    def update_one(self, collection_name: str, entity_id, update_statement: dict, expected_version: int = None):
+        collection = self.get_collection(collection_name)
+        query_filter = self._build_filter({"_id": entity_id})
+        if expected_version is None:
+            collection.update_one(filter=query_filter, update=update_statement, upsert=True)
+            return True
+        if expected_version == 0:
+            query_filter[VERSION_FIELD] = {"$in": [0, None]}
+        else:
+            query_filter[VERSION_FIELD] = expected_version
+        result = collection.update_one(filter=query_filter, update=update_statement, upsert=False)
+        return result.matched_count > 0
+
+    def delete_one(self, collection_name: str, criteria: dict):
+        collection = self.get_collection(collection_name)
+        return collection.delete_one(filter=self._build_filter(criteria))
+
+    def delete_many(self, collection_name: str, criteria: dict):
+        collection = self.get_collection(collection_name)
+        return collection.delete_many(filter=self._build_filter(criteria))
+
+    def list_indexes(self, collection_name: str):
+        collection = self.get_collection(collection_name)
+        return [index["name"] for index in collection.list_indexes() if index["name"] != "_id_"]
+
+    def create_index(self, collection_name: str, index):
+        collection = self.get_collection(collection_name)
+        keys = [(field_name, pymongo.TEXT if direction == "text" else direction)
+                for field_name, direction in index.fields]
+        collection.create_index(keys, name=index.name, unique=index.unique)
+
+    def get_index_usage(self, collection_name: str):
+        collection = self.get_collection(collection_name)
+        return {stats["name"]: stats["accesses"]["ops"] for stats in collection.aggregate([{"$indexStats": {}}])}
+
+    def explain(self, collection_name: str, criteria: dict, sort: list = None):
+        cursor = self.get_collection(collection_name).find(self._build_filter(criteria))
+        if sort:
+            cursor = cursor.sort(sort)
+        return cursor.explain().get("queryPlanner", {}).get("winningPlan")
+
+    @classmethod
+    def _build_filter(cls, criteria: dict):
+        """
+        Copy the criteria, converting ids (also within $in, $gt, ..., $or and $and) to ObjectIds.
+        Ids that are not ObjectIds, such as the composite keys of game_histories, are kept as they are.
+        """
+        if not criteria:
+            return {}
+        query_filter = {}
+        for key, condition in criteria.items():
+            if key in ("$or", "$and"):
+                query_filter[key] = [cls._build_filter(sub_criteria) for sub_criteria in condition]
+            elif key == "_id":
+                query_filter[key] = cls._build_id_condition(condition)
+            else:
+                query_filter[key] = condition
+        return query_filter
+
+    @classmethod
+    def _build_id_condition(cls, condition):
+        if not isinstance(condition, dict):
+            return cls._build_object_id(condition)
+        return {operator: [cls._build_object_id(entity_id) for entity_id in operand]
+                if isinstance(operand, (list, tuple)) else cls._build_object_id(operand)
+                for operator, operand in condition.items()}
+
+    @staticmethod
+    def _build_object_id(entity_id):
+        if isinstance(entity_id, str):
+            try:
+                return ObjectId(entity_id)
+            except bson.errors.InvalidId:
+                return entity_id
+        if isinstance(entity_id, ObjectId):
+            return entity_id
+        else:
+            return TypeError("Entity ID must be a string or of type 'bson.ObjectId'!")
+
 
 class CustomDB:
     """
     A custom class for accessing a database.
-    Currently wraps around the pymongo.MongoClient to provide convenience accessors.
+    Delegates to the storage engine that is configured as `DB_BACKEND` for the current environment.
     Legal MongoDB-query expressions can be found in the documentation:
     https://docs.mongodb.com/manual/reference/operator/query/
+    Engines other than MongoDB only understand the subset of these expressions that the repositories use.
    """
     collections = dict(
         scenarios="scenarios",
         games="games",
         game_histories="game_histories",
         histories="game_histories",
+        game_events="game_events",
+        archived_games="archived_games",
+        scenario_snapshots="scenario_snapshots",
         test="test"
     )
 
+    _backends = {}
+    _backends_lock = threading.Lock()
+
+    @classmethod
+    def get_backend(cls) -> DatabaseBackend:
+        """
+        Get the storage engine for the current environment.
+        Engines are created lazily and kept for the lifetime of the process. If INSTRUMENTATION.ENABLED is set,
+        all operations of the engine are recorded (see infrastructure_layer.instrumentation).
+        """
+        from globalconfig import config
+        db_config = config.get_db_config()
+        backend_name = db_config.get("DB_BACKEND", "mongo")
+        backend_key = (backend_name, db_config.get("DB_HOST") or db_config.get("DB_PATH"), db_config.DB_NAME)
+        backend = cls._backends.get(backend_key)
+        if backend is None:
+            with cls._backends_lock:
+                backend = cls._backends.get(backend_key)
+                if backend is None:
+                    backend = cls._create_backend(backend_name, db_config)
+                    instrumentation_config = db_config.get("INSTRUMENTATION") or {}
+                    if instrumentation_config.get("ENABLED", False):
+                        from infrastructure_layer.instrumentation import InstrumentedBackend
+                        backend = InstrumentedBackend(backend, instrumentation_config.get("SLOW_QUERY_MS"))
+                    cls._backends[backend_key] = backend
+        return backend
+
+    @classmethod
+    def _create_backend(cls, backend_name: str, db_config) -> DatabaseBackend:
+        if backend_name == "mongo":
+            return MongoBackend(db_config)
+        elif backend_name == "memory":
+            from infrastructure_layer.memory_database import InMemoryBackend
+            return InMemoryBackend()
+        elif backend_name == "sqlite":
+            from infrastructure_layer.sqlite_database import SQLiteBackend
+            return SQLiteBackend(db_config)
+        raise ValueError("Unknown database backend '{}'!".format(backend_name))
+
+    @classmethod
+    def close_backends(cls):
+        """Close all storage engines of this process."""
+        with cls._backends_lock:
+            for backend in cls._backends.values():
+                backend.close()
+            cls._backends = {}
+
+    @classmethod
+    def _after_fork_in_child(cls):
+        cls._backends_lock = threading.Lock()
+        for backend in cls._backends.values():
+            backend.reset_after_fork()
+
     @classmethod
     def get_collection_by_name(cls, collection_name: str):
         """
@@ -25,27 +341,18 @@ class CustomDB:
         :param collection_name: the name of the collection to access.
         :return: an object that can perform database operations.
         """
-        from globalconfig import config
-        client = pymongo.MongoClient(
-            config.get_db_config().DB_HOST)
-        db = client[config.get_db_config().DB_NAME]
-        coll = db[collection_name]
-        if coll is None:
-            raise NotImplemented
-        else:
-            return coll
+        return cls.get_backend().get_collection(collection_name)
 
     @classmethod
-    def get_one_by_criteria(cls, collection_name: str, criteria: dict):
+    def get_one_by_criteria(cls, collection_name: str, criteria: dict, projection: dict = None):
         """
         Find a single entity from a collection, by the criteria provided.
         :param collection_name: The collection in which to look for the entity.
         :param criteria: The criteria to filter for the entity.
+        :param projection: Optional. The fields to include ({"title": 1}) or exclude ({"stories": 0}).
         :returns: A single entity (first found, if multiple match the criteria).
         """
-        collection = cls.get_collection_by_name(collection_name)
-        entity_filter = CustomDB._build_filter(criteria=criteria)
-        result = collection.find_one(filter=entity_filter)
+        result = cls.get_backend().find_one(collection_name, criteria, projection=projection)
         if result:
             result_id = str(result.pop("_id"))
         else:
@@ -53,18 +360,23 @@ class CustomDB:
         return result_id, result
 
     @classmethod
-    def get_many(cls, collection_name: str, criteria: dict, exact_match=True):
-        collection = cls.get_collection_by_name(collection_name)
-        criteria = cls._build_filter(criteria, exact_match)
-        return collection.find(criteria)
+    def get_many(cls, collection_name: str, criteria: dict, exact_match=True, projection: dict = None,
+                 sort: list = None, limit: int = None):
+        """
+        Find all entities of a collection that match the criteria.
+        :param sort: Optional. A list of (field, direction) pairs, where direction is 1 (ascending) or -1 (descending).
+        :param limit: Optional. The maximum number of entities to return.
+        """
+        return cls.get_backend().find(collection_name, criteria, projection=projection, sort=sort, limit=limit)
 
     @classmethod
-    def get_all(cls, collection_name: str):
+    def get_all(cls, collection_name: str, projection: dict = None):
         """
         Convenience function. Returns all entities within a collection.
         :param collection_name: The collection from which all entities are to be retrieved.
+        :param projection: Optional. The fields to include ({"title": 1}) or exclude ({"stories": 0}).
         """
-        return cls.get_many(collection_name, {})
+        return cls.get_many(collection_name, {}, projection=projection)
 
 
     @classmethod
@@ -92,22 +404,39 @@ class CustomDB:
         :param collection_name: the name of the collection into which this object will be inserted
         :param entity: a dict with the data of the entity
         :returns: the id of the newly inserted entity
+        :raises DuplicateKeyError: if an entity with the same id already exists
         """
-        collection = cls.get_collection_by_name(collection_name)
-        return str(collection.insert_one(entity).inserted_id)
+        return cls.get_backend().insert_one(collection_name, entity)
 
     @classmethod
-    def update_one(cls, collection_name: str, new_values: dict, entity_id):
+    def update_one(cls, collection_name: str, new_values: dict, entity_id, expected_version: int = None):
         """
         :param collection_name: the name of the collection which contains the entity to be changed
         :param new_values: a dict with the data of the entity
         :param entity_id: the id of the entity that is to be changed
+        :param expected_version: Optional. See apply_update().
         :returns: the id of the changed entity
         """
-        collection = cls.get_collection_by_name(collection_name)
-        query_filter = CustomDB._build_filter({"_id": entity_id})
         update_statement = {"$set": new_values}
-        collection.update_one(filter=query_filter, update=update_statement, upsert=True)
+        return cls.apply_update(collection_name, update_statement, entity_id, expected_version=expected_version)
+
+    @classmethod
+    def apply_update(cls, collection_name: str, update_statement: dict, entity_id, expected_version: int = None):
+        """
+        Change only parts of an entity, e.g. {"$set": {"game_state": "open"}, "$push": {"participants.abc.history": {}}}.
+        :param collection_name: the name of the collection which contains the entity to be changed
+        :param update_statement: a MongoDB-style update statement. Supported operators are $set, $push and $inc.
+        :param entity_id: the id of the entity that is to be changed
+        :param expected_version: Optional. If provided, the entity is only changed (compare-and-set),
+        if its version field still has this value.
+        :raises ConcurrentModificationError: if the entity does not have the expected version.
+        :returns: the id of the changed entity
+        """
+        is_updated = cls.get_backend().update_one(collection_name, entity_id, update_statement,
+                                                  expected_version=expected_version)
+        if not is_updated:
+            raise ConcurrentModificationError("The entity {} in {} has been changed since version {}!"
+                                              .format(entity_id, collection_name, expected_version))
         return entity_id
 
     @classmethod
@@ -117,20 +446,51 @@ class CustomDB:
         :param criteria: a dict with criteria of what to delete
         :returns: the deletion result
         """
-        collection = cls.get_collection_by_name(collection_name)
-        entity_filter = CustomDB._build_filter(criteria)
-        return collection.delete_one(filter=entity_filter)
+        return cls.get_backend().delete_one(collection_name, criteria)
+
+    @classmethod
+    def delete_many(cls, collection_name: str, criteria: dict):
+        """
+        :param collection_name: the name of the collection from which to delete
+        :param criteria: a dict with criteria of what to delete. Must not be empty.
+        """
+        if not criteria:
+            raise ValueError("Deleting all entities of a collection is only possible with _purge_database!")
+        return cls.get_backend().delete_many(collection_name, criteria)
+
+    @classmethod
+    def list_indexes(cls, collection_name: str):
+        """:return: the names of the indexes of a collection (without the index on the id)."""
+        return cls.get_backend().list_indexes(collection_name)
+
+    @classmethod
+    def create_index(cls, collection_name: str, index):
+        """
+        :param collection_name: the name of the collection to be indexed.
+        :param index: an IndexDefinition.
+        """
+        return cls.get_backend().create_index(collection_name, index)
+
+    @classmethod
+    def get_index_usage(cls, collection_name: str):
+        """:return: how often each index of a collection has been used. None if this is unknown."""
+        return cls.get_backend().get_index_usage(collection_name)
+
+    @classmethod
+    def reconcile_indexes(cls, create_missing: bool = True):
+        """
+        Create all indexes that repositories have declared, but that do not yet exist.
+        :param create_missing: if False, only report the differences without changing the database.
+        :returns: an IndexReport of created, missing, undeclared and unused indexes.
+        """
+        from infrastructure_layer.indexes import IndexRegistry
+        return IndexRegistry.reconcile(cls, create_missing=create_missing)
 
     @classmethod
     def _purge_database(cls, collection_name: str, criteria: dict = None):
         """Should NOT be used in production"""
         if "prod" not in collection_name:
-            if not criteria:
-                query_filter = {}
-            else:
-                query_filter = CustomDB._build_filter(criteria=criteria)
-            collection = cls.get_collection_by_name(collection_name)
-            collection.delete_many(filter=query_filter)
+            cls.get_backend().delete_many(collection_name, criteria or {})
         else:
             raise NotImplementedError("Purging a production database has consciously not been implemented."
                                       "If this is truly a necessary step, please clear the database directly.")
@@ -139,30 +499,8 @@ class CustomDB:
     def _purge_entire_database(cls):
         """Should NOT be used in production"""
         for collection_name in cls.collections:
-            collection = cls.get_collection_by_name(collection_name)
-            query_filter = {}
-            collection.delete_many(filter=query_filter)
-
+            cls.get_backend().delete_many(collection_name, {})
 
-    @staticmethod
-    def _build_filter(criteria: dict, exact_match=True):
-        if not criteria:
-            pass
-        if "_id" in criteria:
-            entity_id = criteria["_id"]
-            criteria["_id"] = CustomDB._build_object_id(entity_id)
-        tmp_filter = criteria
-        return tmp_filter
 
-
-    @staticmethod
-    def _build_object_id(entity_id):
-        if isinstance(entity_id, str):
-            try:
-                entity_id = ObjectId(entity_id)
-            except bson.errors.InvalidId:
-                return ObjectId()
-        if isinstance(entity_id, ObjectId):
-            return entity_id
-        else:
-            return TypeError("Entity ID must be a string or of type 'bson.ObjectId'!")
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=CustomDB._after_fork_in_child)
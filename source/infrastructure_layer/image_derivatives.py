@@ -0,0 +1,95 @@
+"""
+Resized and re-encoded copies (derivatives) of uploaded images, so that small screens do not download the originals.
+Derivatives are created with Pillow, which is optional: without it, only the original images are served.
+"""
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from infrastructure_layer.media_store import MediaStore
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMAT = ("WEBP", ".webp", "image/webp")
+
+
+def is_available() -> bool:
+    """:returns: True, if Pillow is installed and derivatives can be created."""
+    return Image is not None
+
+
+def create_derivatives(media_store: MediaStore, key: str, widths=DERIVATIVE_WIDTHS, quality: int = 80) -> List[dict]:
+    """
+    Create WebP copies of a stored image at each of the given widths that is smaller than the image itself,
+    and one at the original width. Derivatives are stored in the same media store.
+    :returns: a list of dicts with the media_path, width and mimetype of each derivative, the narrowest first.
+    An empty list, if the file is no image or Pillow is not installed.
+    """
+    if not is_available():
+        return []
+    image_format, extension, mimetype = DERIVATIVE_FORMAT
+    try:
+        with Image.open(media_store.get_path(key)) as image:
+            image.load()
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            original_width, original_height = image.size
+            derivatives = []
+            for width in sorted({width for width in widths if width < original_width} | {original_width}):
+                height = max(1, round(original_height * width / original_width))
+                resized = image if width == original_width else image.resize((width, height), Image.LANCZOS)
+                encoded = io.BytesIO()
+                resized.save(encoded, image_format, quality=quality, method=6)
+                encoded.seek(0)
+                derivatives.append({"media_path": media_store.save(encoded, "derivative" + extension),
+                                    "width": width, "mimetype": mimetype})
+            return derivatives
+    except (OSError, ValueError) as e:
+        logger.warning("Could not create derivatives of %s: %s", key, e)
+        return []
+
+
+class DerivativePipeline:
+    """Creates derivatives in background threads, so that uploads do not wait for the image processing."""
+    max_workers = 2
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, media_store: MediaStore, key: str, on_done):
+        """
+        Create the derivatives of a stored image in the background.
+        :param on_done: a function that takes the list of derivatives (see create_derivatives()) once they exist.
+        It is not called if no derivatives could be created.
+        :returns: a Future of the result of on_done. None, if Pillow is not installed.
+        """
+        if not is_available():
+            return None
+        return cls._get_executor().submit(cls._run, media_store, key, on_done)
+
+    @classmethod
+    def _get_executor(cls) -> ThreadPoolExecutor:
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.max_workers,
+                                                   thread_name_prefix="media-derivatives")
+            return cls._executor
+
+    @staticmethod
+    def _run(media_store: MediaStore, key: str, on_done):
+        derivatives = create_derivatives(media_store, key)
+        if not derivatives:
+            return None
+        try:
+            return on_done(derivatives)
+        except Exception as e:
+            logger.error("Could not save the derivatives of %s: %s", key, e)
+            raise
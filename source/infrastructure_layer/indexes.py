@@ -0,0 +1,105 @@
+from typing import Dict, List
+
+ASCENDING = 1
+DESCENDING = -1
+TEXT = "text"
+
+
+class IndexDefinition:
+    """Declares an index on one or more fields of a collection."""
+    def __init__(self, *fields, name: str = "", unique: bool = False):
+        """
+        :param fields: field names (indexed in ascending order) or tuples of (field_name, direction),
+        where direction is one of ASCENDING, DESCENDING or TEXT.
+        :param name: Optional. The name of the index. Will be derived from the fields if not provided.
+        :param unique: whether the combination of the indexed fields must be unique within the collection.
+        """
+        if not fields:
+            raise ValueError("An index must contain at least one field!")
+        self.fields = [field if isinstance(field, tuple) else (field, ASCENDING) for field in fields]
+        self.name = name or "_".join("{}_{}".format(field_name, direction) for field_name, direction in self.fields)
+        self.unique = unique
+
+    @property
+    def is_text_index(self):
+        return any(direction == TEXT for _, direction in self.fields)
+
+    def __eq__(self, other):
+        if isinstance(other, IndexDefinition):
+            return self.fields == other.fields and self.unique == other.unique
+        return False
+
+    def __repr__(self):
+        return "IndexDefinition({})".format(self.name)
+
+
+class IndexReport:
+    """The outcome of comparing the declared indexes with the indexes that exist in the database."""
+    def __init__(self):
+        self.created: Dict[str, List[str]] = {}
+        self.missing: Dict[str, List[str]] = {}
+        self.undeclared: Dict[str, List[str]] = {}
+        self.unused: Dict[str, List[str]] = {}
+
+    def add(self, category: str, collection_name: str, index_name: str):
+        getattr(self, category).setdefault(collection_name, []).append(index_name)
+
+    @property
+    def is_complete(self):
+        """True if all declared indexes exist."""
+        return not self.missing
+
+    def __str__(self):
+        lines = []
+        for category in ["created", "missing", "undeclared", "unused"]:
+            for collection_name, index_names in getattr(self, category).items():
+                lines.append("{} in {}: {}".format(category, collection_name, ", ".join(index_names)))
+        return "\n".join(lines) or "All declared indexes exist."
+
+
+class IndexRegistry:
+    """Collects the indexes that repositories declare for their collections."""
+    _declarations: Dict[str, Dict[str, IndexDefinition]] = {}
+
+    @classmethod
+    def register(cls, collection_name: str, index: IndexDefinition):
+        collection_indexes = cls._declarations.setdefault(collection_name, {})
+        existing_index = collection_indexes.get(index.name)
+        if existing_index and existing_index != index:
+            raise ValueError("The index {} has been declared differently for the collection {}!"
+                             .format(index.name, collection_name))
+        collection_indexes[index.name] = index
+
+    @classmethod
+    def get_declared_indexes(cls) -> Dict[str, List[IndexDefinition]]:
+        return {collection_name: list(indexes.values()) for collection_name, indexes in cls._declarations.items()}
+
+    @classmethod
+    def reconcile(cls, db, create_missing: bool = True) -> IndexReport:
+        """
+        Compare the declared indexes with those that exist in the database. Idempotent.
+        :param db: the database (e.g. CustomDB) whose indexes are to be reconciled.
+        :param create_missing: if True, indexes that have been declared but do not exist will be created.
+        :returns: an IndexReport.
+        """
+        report = IndexReport()
+        for collection_name, declared_indexes in cls.get_declared_indexes().items():
+            existing_names = db.list_indexes(collection_name)
+            for index in declared_indexes:
+                if index.name in existing_names:
+                    continue
+                if create_missing:
+                    db.create_index(collection_name, index)
+                    report.add("created", collection_name, index.name)
+                else:
+                    report.add("missing", collection_name, index.name)
+            declared_names = {index.name for index in declared_indexes}
+            for index_name in existing_names:
+                if index_name not in declared_names:
+                    report.add("undeclared", collection_name, index_name)
+            usage = db.get_index_usage(collection_name) or {}
+            for index_name, usage_count in usage.items():
+                is_new = index_name in report.created.get(collection_name, [])
+                if usage_count == 0 and index_name in declared_names and not is_new:
+                    report.add("unused", collection_name, index_name)
+        return report
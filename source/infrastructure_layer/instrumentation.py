@@ -0,0 +1,283 @@
+"""
+Instrumentation of the storage engines: every database operation is recorded with its collection, the shape of its
+filter (the criteria without their values), its duration and the number of documents it returned.
+Operations are aggregated per recording (e.g. per request, see start_recording()) and per query shape for the whole
+process. Slow operations are logged together with the query plan of the storage engine.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import List, Optional
+
+from infrastructure_layer.database import DatabaseBackend
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_lock = threading.Lock()
+_recent_stats = deque(maxlen=50)
+_totals = {}
+
+
+class RoundTripBudgetExceededError(Exception):
+    """Raised if a request makes more database calls than its budget allows, e.g. because of an N+1 query."""
+    pass
+
+
+class QueryRecord:
+    """A single database operation."""
+    __slots__ = ("collection", "operation", "filter_shape", "duration_ms", "documents")
+
+    def __init__(self, collection: str, operation: str, filter_shape: str, duration_ms: float = 0.0,
+                 documents: int = 0):
+        self.collection = collection
+        self.operation = operation
+        self.filter_shape = filter_shape
+        self.duration_ms = duration_ms
+        self.documents = documents
+
+    @property
+    def key(self):
+        return self.collection, self.operation, self.filter_shape
+
+    def as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class QueryStats:
+    """The database operations of a single recording, e.g. of a request."""
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.records: List[QueryRecord] = []
+
+    @property
+    def round_trips(self):
+        return len(self.records)
+
+    @property
+    def total_ms(self):
+        return sum(record.duration_ms for record in self.records)
+
+    @property
+    def documents(self):
+        return sum(record.documents for record in self.records)
+
+    def get_repeated_queries(self, threshold: int = 3):
+        """
+        Operations that have been made several times with the same shape, which usually means that entities are
+        loaded one by one in a loop (N+1 queries) instead of with a single query.
+        :returns: a list of ((collection, operation, filter_shape), count), the most frequent first.
+        """
+        counts = Counter(record.key for record in self.records)
+        return [(key, count) for key, count in counts.most_common() if count >= threshold]
+
+    def as_header(self):
+        """:returns: a short summary, e.g. for an HTTP header."""
+        return "round-trips={}; time-ms={:.1f}; documents={}".format(self.round_trips, self.total_ms, self.documents)
+
+
+class InstrumentedBackend(DatabaseBackend):
+    """Records all operations of another storage engine. Everything else is delegated to the wrapped engine."""
+    def __init__(self, backend: DatabaseBackend, slow_query_ms: float = None):
+        """
+        :param backend: the storage engine whose operations are recorded.
+        :param slow_query_ms: Optional. Operations that take at least this many milliseconds are logged as warnings.
+        """
+        self._backend = backend
+        self.slow_query_ms = slow_query_ms
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+    @property
+    def backend(self):
+        return self._backend
+
+    def get_collection(self, collection_name: str):
+        return self._backend.get_collection(collection_name)
+
+    def find_one(self, collection_name: str, criteria: dict, projection: dict = None):
+        record = QueryRecord(collection_name, "find_one", get_filter_shape(criteria))
+        started_at = time.perf_counter()
+        result = self._backend.find_one(collection_name, criteria, projection=projection)
+        record.documents = int(result is not None)
+        self._finish(record, started_at, criteria)
+        return result
+
+    def find(self, collection_name: str, criteria: dict, projection: dict = None, sort: list = None,
+             limit: int = None):
+        record = QueryRecord(collection_name, "find", get_filter_shape(criteria, sort))
+        started_at = time.perf_counter()
+        result = self._backend.find(collection_name, criteria, projection=projection, sort=sort, limit=limit)
+        if isinstance(result, list):
+            record.documents = len(result)
+            self._finish(record, started_at, criteria, sort)
+            return result
+        return self._iter_recorded(result, record, started_at, criteria, sort)
+
+    def insert_one(self, collection_name: str, entity: dict):
+        return self._call("insert_one", collection_name, None, self._backend.insert_one, collection_name, entity)
+
+    def update_one(self, collection_name: str, entity_id, update_statement: dict, expected_version: int = None):
+        return self._call("update_one", collection_name, {"_id": entity_id}, self._backend.update_one,
+                          collection_name, entity_id, update_statement, expected_version=expected_version)
+
+    def delete_one(self, collection_name: str, criteria: dict):
+        return self._call("delete_one", collection_name, criteria, self._backend.delete_one, collection_name, criteria)
+
+    def delete_many(self, collection_name: str, criteria: dict):
+        return self._call("delete_many", collection_name, criteria, self._backend.delete_many,
+                          collection_name, criteria)
+
+    def list_indexes(self, collection_name: str):
+        return self._backend.list_indexes(collection_name)
+
+    def create_index(self, collection_name: str, index):
+        return self._backend.create_index(collection_name, index)
+
+    def get_index_usage(self, collection_name: str):
+        return self._backend.get_index_usage(collection_name)
+
+    def explain(self, collection_name: str, criteria: dict, sort: list = None):
+        return self._backend.explain(collection_name, criteria, sort=sort)
+
+    def close(self):
+        self._backend.close()
+
+    def reset_after_fork(self):
+        self._backend.reset_after_fork()
+
+    def _call(self, operation: str, collection_name: str, criteria: Optional[dict], function, *args, **kwargs):
+        record = QueryRecord(collection_name, operation, get_filter_shape(criteria))
+        started_at = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._finish(record, started_at)
+
+    def _iter_recorded(self, documents, record: QueryRecord, started_at: float, criteria: dict, sort: list):
+        """Lazy results (e.g. cursors) are recorded once they have been consumed, including the time to fetch them."""
+        duration = time.perf_counter() - started_at
+        try:
+            iterator = iter(documents)
+            while True:
+                resumed_at = time.perf_counter()
+                try:
+                    document = next(iterator)
+                except StopIteration:
+                    duration += time.perf_counter() - resumed_at
+                    return
+                duration += time.perf_counter() - resumed_at
+                record.documents += 1
+                yield document
+        finally:
+            self._finish(record, time.perf_counter() - duration, criteria, sort)
+
+    def _finish(self, record: QueryRecord, started_at: float, criteria: dict = None, sort: list = None):
+        record.duration_ms = (time.perf_counter() - started_at) * 1000
+        add_record(record)
+        if self.slow_query_ms is not None and record.duration_ms >= self.slow_query_ms:
+            plan = None
+            if criteria is not None:
+                try:
+                    plan = self._backend.explain(record.collection, criteria, sort=sort)
+                except Exception as e:
+                    plan = "unavailable ({})".format(e)
+            logger.warning("Slow query (%.1f ms): %s on %s with %s returned %s documents. Query plan: %s",
+                           record.duration_ms, record.operation, record.collection, record.filter_shape,
+                           record.documents, plan)
+
+
+def get_filter_shape(criteria: Optional[dict], sort: list = None) -> str:
+    """
+    :returns: the criteria (and sort order) without their values, e.g. '{"_id": {"$in": "?"}}',
+    so that operations which only differ in their values can be grouped.
+    """
+    shape = json.dumps(_strip_values(criteria or {}), sort_keys=True)
+    if sort:
+        shape += " sort " + json.dumps([[path, direction] for path, direction in sort])
+    return shape
+
+
+def _strip_values(condition):
+    if isinstance(condition, dict):
+        return {key: _strip_values(value) if key.startswith("$") or isinstance(value, dict) else "?"
+                for key, value in condition.items()}
+    if isinstance(condition, (list, tuple)) and condition and all(isinstance(item, dict) for item in condition):
+        return [_strip_values(item) for item in condition]
+    return "?"
+
+
+def start_recording(label: str = "") -> QueryStats:
+    """Record all database operations of the current thread until stop_recording() is called."""
+    stats = QueryStats(label)
+    _local.stats = stats
+    return stats
+
+
+def stop_recording() -> Optional[QueryStats]:
+    """:returns: the stats of the current recording, which are kept for get_recent_stats(). None, if there is none."""
+    stats = getattr(_local, "stats", None)
+    _local.stats = None
+    if stats is not None:
+        with _lock:
+            _recent_stats.append(stats)
+    return stats
+
+
+def get_current_stats() -> Optional[QueryStats]:
+    return getattr(_local, "stats", None)
+
+
+def add_record(record: QueryRecord):
+    stats = get_current_stats()
+    if stats is not None:
+        stats.records.append(record)
+    with _lock:
+        totals = _totals.setdefault(record.key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "documents": 0})
+        totals["count"] += 1
+        totals["total_ms"] += record.duration_ms
+        totals["max_ms"] = max(totals["max_ms"], record.duration_ms)
+        totals["documents"] += record.documents
+
+
+def get_recent_stats() -> List[QueryStats]:
+    """:returns: the stats of the most recent recordings, the latest first."""
+    with _lock:
+        return list(reversed(_recent_stats))
+
+
+def get_totals():
+    """:returns: a list of ((collection, operation, filter_shape), totals) of this process, the slowest first."""
+    with _lock:
+        totals = [(key, dict(values)) for key, values in _totals.items()]
+    return sorted(totals, key=lambda item: item[1]["total_ms"], reverse=True)
+
+
+def reset():
+    """Forget all recorded operations."""
+    with _lock:
+        _recent_stats.clear()
+        _totals.clear()
+
+
+def check_round_trip_budget(stats: QueryStats, budget: int, fail: bool = False, repetition_threshold: int = 3):
+    """
+    Warn if a recording made more database calls than its budget allows.
+    :param fail: if True, raise an error instead, e.g. in tests.
+    :raises RoundTripBudgetExceededError: if the budget is exceeded and fail is True.
+    :returns: True, if the recording stayed within the budget.
+    """
+    if budget is None or stats.round_trips <= budget:
+        return True
+    repeated = ", ".join("{}x {} on {} with {}".format(count, operation, collection, filter_shape)
+                         for (collection, operation, filter_shape), count
+                         in stats.get_repeated_queries(repetition_threshold))
+    message = "{} made {} database calls, but its budget is {}. Repeated queries: {}".format(
+        stats.label or "A request", stats.round_trips, budget, repeated or "none")
+    if fail:
+        raise RoundTripBudgetExceededError(message)
+    logger.warning(message)
+    return False
@@ -0,0 +1,84 @@
+"""
+A content-addressed store for uploaded media: every file is stored under the hash of its content,
+so that identical uploads are stored once and a stored file never changes (which makes it safe to cache forever).
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+
+from werkzeug.utils import secure_filename
+
+
+class MediaStore:
+    """
+    Stores files in a local directory, sharded by the first two characters of their hash.
+    A file is stored under its content hash alone. The extension in its key only determines the mimetype with which
+    it is served, so the same content uploaded as e.g. .jpg and .jpeg is stored once.
+    """
+    chunk_size = 64 * 1024
+    _key_pattern = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$")
+
+    def __init__(self, root: str):
+        """:param root: the directory in which files are stored. It is created if it does not exist."""
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def save(self, stream, filename: str = "") -> str:
+        """
+        Stream a file to disk in chunks while hashing it. Files that are already stored are not stored again.
+        :param stream: a binary file-like object.
+        :param filename: Optional. The original name of the file, whose extension is kept (e.g. for the mimetype).
+        :returns: the key of the stored file, i.e. the hex digest of its content plus the extension of the filename.
+        """
+        content_hash = hashlib.sha256()
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                for chunk in iter(lambda: stream.read(self.chunk_size), b""):
+                    content_hash.update(chunk)
+                    temp_file.write(chunk)
+            key = content_hash.hexdigest() + self._get_extension(filename)
+            path = self.get_path(key)
+            if os.path.exists(path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+            return key
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get_path(self, key: str) -> str:
+        """
+        :returns: the path of the stored file with the given key.
+        :raises ValueError: if the key is not the key of a stored file (e.g. a path outside of the store).
+        """
+        if not self.is_media_key(key):
+            raise ValueError("'{}' is not a valid media key!".format(key))
+        return os.path.join(self.root, key[:2], self.get_content_hash(key))
+
+    def exists(self, key: str) -> bool:
+        return self.is_media_key(key) and os.path.exists(self.get_path(key))
+
+    @classmethod
+    def is_media_key(cls, media_path: str) -> bool:
+        """Media paths of injects are either keys of this store or (for older scenarios) names of uploaded files."""
+        return bool(media_path) and cls._key_pattern.match(media_path) is not None
+
+    @staticmethod
+    def get_content_hash(key: str) -> str:
+        return key.split(".", 1)[0]
+
+    @staticmethod
+    def get_mimetype(key: str) -> str:
+        """:returns: the mimetype that the extension of a key stands for. Keys without extension are binary data."""
+        return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    @staticmethod
+    def _get_extension(filename: str) -> str:
+        extension = os.path.splitext(secure_filename(filename or ""))[1].lower()
+        return extension if re.match(r"^\.[a-z0-9]{1,10}$", extension) else ""
@@ -0,0 +1,127 @@
+import copy
+import itertools
+import threading
+
+from bson import ObjectId
+
+from infrastructure_layer import queries
+from infrastructure_layer.database import DatabaseBackend, DuplicateKeyError, VERSION_FIELD
+
+
+class InMemoryBackend(DatabaseBackend):
+    """
+    A thread-safe storage engine that keeps all documents in the memory of the current process.
+    Intended for single-room deployments, load tests and automated tests.
+    Data is lost when the process ends and is not shared between worker processes.
+    """
+    def __init__(self):
+        self._collections = {}
+        self._indexes = {}
+        self._lock = threading.RLock()
+
+    def get_collection(self, collection_name: str):
+        with self._lock:
+            return self._collections.setdefault(collection_name, {})
+
+    def find_one(self, collection_name: str, criteria: dict, projection: dict = None):
+        with self._lock:
+            for document in self._iter_matching(collection_name, criteria):
+                return self._copy(document, projection)
+        return None
+
+    def find(self, collection_name: str, criteria: dict, projection: dict = None, sort: list = None,
+             limit: int = None):
+        with self._lock:
+            documents = self._iter_matching(collection_name, criteria)
+            if sort:
+                documents = queries.sort_documents(documents, sort)
+            if limit:
+                documents = itertools.islice(documents, limit)
+            return [self._copy(document, projection) for document in documents]
+
+    def insert_one(self, collection_name: str, entity: dict):
+        entity_id = str(entity.get("_id") or ObjectId())
+        entity["_id"] = entity_id
+        with self._lock:
+            collection = self.get_collection(collection_name)
+            if entity_id in collection:
+                raise DuplicateKeyError("An entity with the id {} already exists!".format(entity_id))
+            collection[entity_id] = copy.deepcopy(entity)
+        return entity_id
+
+    def update_one(self, collection_name: str, entity_id, update_statement: dict, expected_version: int = None):
+        entity_id = str(entity_id)
+        with self._lock:
+            collection = self.get_collection(collection_name)
+            if expected_version is not None:
+                document = collection.get(entity_id)
+                if document is None or document.get(VERSION_FIELD, 0) != expected_version:
+                    return False
+            document = collection.setdefault(entity_id, {"_id": entity_id})
+            queries.apply_update(document, copy.deepcopy(update_statement))
+            return True
+
+    def delete_one(self, collection_name: str, criteria: dict):
+        with self._lock:
+            for document in self._iter_matching(collection_name, criteria):
+                self._collections[collection_name].pop(document["_id"])
+                return 1
+        return 0
+
+    def delete_many(self, collection_name: str, criteria: dict):
+        with self._lock:
+            matching_ids = [document["_id"] for document in self._iter_matching(collection_name, criteria)]
+            for entity_id in matching_ids:
+                self._collections[collection_name].pop(entity_id)
+        return len(matching_ids)
+
+    def list_indexes(self, collection_name: str):
+        """Indexes are only recorded, since all documents are scanned in memory anyway."""
+        return list(self._indexes.get(collection_name, []))
+
+    def create_index(self, collection_name: str, index):
+        with self._lock:
+            self._indexes.setdefault(collection_name, set()).add(index.name)
+
+    def explain(self, collection_name: str, criteria: dict, sort: list = None):
+        id_criteria = (criteria or {}).get("_id")
+        if id_criteria is None or (isinstance(id_criteria, dict) and list(id_criteria) != ["$in"]):
+            plan = "scan all {} documents".format(len(self._collections.get(collection_name, {})))
+        else:
+            plan = "look up by id"
+        return plan + (", then sort" if sort else "")
+
+    def close(self):
+        with self._lock:
+            self._collections = {}
+
+    @staticmethod
+    def _copy(document: dict, projection: dict = None):
+        """Copy only the projected fields, so that callers can never modify the stored documents."""
+        if queries.is_inclusion_projection(projection):
+            return copy.deepcopy(queries.project(document, projection))
+        return queries.project(copy.deepcopy(document), projection)
+
+    def _iter_matching(self, collection_name: str, criteria: dict):
+        """Iterate over the stored documents that match the criteria. Must be called while holding the lock."""
+        collection = self._collections.get(collection_name, {})
+        criteria = dict(criteria or {})
+        id_criteria = criteria.get("_id")
+        if id_criteria is None:
+            candidates = collection.values()
+        elif isinstance(id_criteria, dict) and list(id_criteria) == ["$in"]:
+            criteria.pop("_id")
+            candidates = [collection[str(entity_id)] for entity_id in id_criteria["$in"]
+                          if str(entity_id) in collection]
+        elif isinstance(id_criteria, dict):
+            criteria["_id"] = {operator: [str(entity_id) for entity_id in operand]
+                               if isinstance(operand, (list, tuple)) else str(operand)
+                               for operator, operand in id_criteria.items()}
+            candidates = collection.values()
+        else:
+            criteria.pop("_id")
+            document = collection.get(str(id_criteria))
+            candidates = [document] if document else []
+        for document in candidates:
+            if queries.matches(document, criteria):
+                yield document
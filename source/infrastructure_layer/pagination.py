@@ -0,0 +1,100 @@
+"""
+Keyset pagination: instead of skipping over all previous results, a page continues after the sort values of the
+last entity of the previous page. The position is handed to clients as an opaque cursor.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional
+
+from bson import ObjectId
+
+from infrastructure_layer import queries
+
+
+class Page:
+    """A slice of a sorted result set."""
+    def __init__(self, items: List[Any], next_cursor: Optional[str] = None):
+        """
+        :param items: the entities on this page.
+        :param next_cursor: the cursor of the next page. None, if this is the last page.
+        """
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(sort: list, document: dict) -> str:
+    """
+    :param sort: the list of (field, direction) pairs by which the result set is sorted.
+    :param document: the last document of the current page.
+    :returns: an opaque, url-safe cursor that points behind the document.
+    """
+    values = [_encode_value(queries.get_path(document, path, None)) for path, direction in sort]
+    payload = {"sort": [[path, direction] for path, direction in sort], "values": values}
+    raw_cursor = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw_cursor).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: list) -> list:
+    """
+    :returns: the sort values of the last document of the previous page.
+    :raises ValueError: if the cursor is malformed or was created for a different sort order.
+    """
+    try:
+        raw_cursor = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw_cursor.decode("utf-8"))
+        cursor_sort = [(path, direction) for path, direction in payload["sort"]]
+        values = [_decode_value(value) for value in payload["values"]]
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, AttributeError, ValueError):
+        raise ValueError("The cursor {} is invalid!".format(cursor))
+    if cursor_sort != [(path, direction) for path, direction in sort] or len(values) != len(sort):
+        raise ValueError("The cursor {} does not belong to this listing!".format(cursor))
+    return values
+
+
+def build_keyset_criteria(sort: list, values: list) -> dict:
+    """
+    Build the criteria for all documents that come after the given sort values,
+    e.g. {"$or": [{"a": {"$gt": 1}}, {"a": 1, "_id": {"$gt": "..."}}]} for the sort [("a", 1), ("_id", 1)].
+    Like in MongoDB, missing values sort before all other values.
+    """
+    alternatives = []
+    for position, (path, direction) in enumerate(sort):
+        value = values[position]
+        criteria = {prefix_path: values[index] for index, (prefix_path, _) in enumerate(sort[:position])}
+        if value is None and direction > 0:
+            criteria[path] = {"$ne": None}
+        elif value is None:
+            continue
+        elif direction < 0:
+            alternatives.append(dict(criteria, **{path: None}))
+            criteria[path] = {"$lt": value}
+        else:
+            criteria[path] = {"$gt": value}
+        alternatives.append(criteria)
+    return {"$or": alternatives} if alternatives else {"_id": {"$in": []}}
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["$date"])
+    return value
@@ -0,0 +1,185 @@
+"""
+This module evaluates the subset of MongoDB-query expressions that the repositories use,
+so that storage engines other than MongoDB can understand them.
+"""
+
+_MISSING = object()
+
+
+def get_path(document: dict, path: str, default=_MISSING):
+    """Resolve a dotted path (e.g. 'participants.abc.history') within a document."""
+    value = document
+    for key in path.split("."):
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return default
+    return value
+
+
+def set_path(document: dict, path: str, value):
+    """Set the value at a dotted path, creating intermediate documents where necessary."""
+    *parents, last_key = path.split(".")
+    target = document
+    for key in parents:
+        if isinstance(target, list):
+            target = target[int(key)]
+        else:
+            target = target.setdefault(key, {})
+    if isinstance(target, list):
+        target[int(last_key)] = value
+    else:
+        target[last_key] = value
+
+
+def matches(document: dict, criteria: dict) -> bool:
+    """
+    Check whether a document satisfies the criteria.
+    Supports exact matches of (dotted) fields, the operators $in, $ne, $gt, $gte, $lt and $lte
+    as well as the logical operators $or and $and.
+    """
+    for path, condition in (criteria or {}).items():
+        if path == "$or":
+            if not any(matches(document, sub_criteria) for sub_criteria in condition):
+                return False
+            continue
+        if path == "$and":
+            if not all(matches(document, sub_criteria) for sub_criteria in condition):
+                return False
+            continue
+        value = get_path(document, path)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            if not _matches_operators(value, condition):
+                return False
+        elif not _matches_value(value, condition):
+            return False
+    return True
+
+
+def _matches_value(value, expected) -> bool:
+    if value is _MISSING:
+        return expected is None
+    if isinstance(value, list) and not isinstance(expected, list):
+        return expected in value
+    return value == expected
+
+
+_COMPARISONS = {
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+}
+
+
+def _matches_operators(value, condition: dict) -> bool:
+    for operator, operand in condition.items():
+        if operator == "$in":
+            if not any(_matches_value(value, candidate) for candidate in operand):
+                return False
+        elif operator == "$ne":
+            if _matches_value(value, operand):
+                return False
+        elif operator in _COMPARISONS:
+            if not _compare(value, operand, _COMPARISONS[operator]):
+                return False
+        else:
+            raise ValueError("The query operator {} is not supported by this database backend!".format(operator))
+    return True
+
+
+def _compare(value, operand, comparison) -> bool:
+    """Like MongoDB, missing values and values of a different type never satisfy a comparison."""
+    if value is _MISSING or value is None or operand is None:
+        return False
+    try:
+        return comparison(value, operand)
+    except TypeError:
+        return False
+
+
+def sort_documents(documents: list, sort: list) -> list:
+    """
+    Sort documents like MongoDB would. Missing and None values come first in ascending order.
+    :param sort: a list of (field, direction) pairs, where direction is 1 (ascending) or -1 (descending).
+    :returns: a new, sorted list.
+    """
+    documents = list(documents)
+    for path, direction in reversed(sort or []):
+        documents.sort(key=lambda document: _sort_key(get_path(document, path, None)), reverse=direction < 0)
+    return documents
+
+
+def _sort_key(value):
+    if value is None:
+        return (0, 0)
+    return (1, value)
+
+
+SUPPORTED_UPDATE_OPERATORS = ["$set", "$push", "$inc"]
+
+
+def apply_update(document: dict, update_statement: dict):
+    """
+    Apply an update statement to a document in place.
+    Supports the operators $set, $push (with or without $each) and $inc, including dotted paths.
+    """
+    for operator in update_statement:
+        if operator not in SUPPORTED_UPDATE_OPERATORS:
+            raise ValueError("The update operator {} is not supported by this database backend!".format(operator))
+    for path, value in update_statement.get("$set", {}).items():
+        set_path(document, path, value)
+    for path, value in update_statement.get("$push", {}).items():
+        array = get_path(document, path)
+        if array is _MISSING:
+            array = []
+            set_path(document, path, array)
+        if not isinstance(array, list):
+            raise ValueError("Can not push to {}, because it is not an array!".format(path))
+        array.extend(get_pushed_values(value))
+    for path, increment in update_statement.get("$inc", {}).items():
+        value = get_path(document, path, 0)
+        if not isinstance(value, (int, float)) or not isinstance(increment, (int, float)):
+            raise ValueError("Can not increment {}, because it is not a number!".format(path))
+        set_path(document, path, value + increment)
+    return document
+
+
+def get_pushed_values(value):
+    """:returns: the list of values that a $push appends, i.e. either the values of $each or the value itself."""
+    if isinstance(value, dict) and list(value) == ["$each"]:
+        return list(value["$each"])
+    return [value]
+
+
+def project(document: dict, projection: dict):
+    """
+    Reduce a document to the fields of a projection.
+    Projections either include ({"title": 1}) or exclude ({"stories": 0}) fields. The "_id" is kept unless excluded.
+    """
+    if not projection:
+        return document
+    if is_inclusion_projection(projection):
+        included_paths = [path for path, flag in projection.items() if flag and path != "_id"]
+        projected_document = {}
+        for path in included_paths:
+            value = get_path(document, path)
+            if value is not _MISSING:
+                set_path(projected_document, path, value)
+        if "_id" in document and projection.get("_id", 1):
+            projected_document["_id"] = document["_id"]
+        return projected_document
+    for path, flag in projection.items():
+        if not flag:
+            *parents, last_key = path.split(".")
+            parent = get_path(document, ".".join(parents)) if parents else document
+            if isinstance(parent, dict):
+                parent.pop(last_key, None)
+    return document
+
+
+def is_inclusion_projection(projection: dict):
+    """:returns: True if the projection lists the fields to include, rather than the fields to exclude."""
+    return bool(projection) and any(flag for path, flag in projection.items() if path != "_id")
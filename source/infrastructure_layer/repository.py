@@ -1,46 +1,95 @@
-from infrastructure_layer.database import CustomDB
+import random
+import time
+from typing import List
+
+from infrastructure_layer.database import CustomDB, ConcurrentModificationError, VERSION_FIELD
+from infrastructure_layer.indexes import IndexDefinition, IndexRegistry
+from infrastructure_layer.pagination import Page, build_keyset_criteria, decode_cursor, encode_cursor
 
 
 class Repository:
     my_db = CustomDB
     collection_name = ""
+    indexes: List[IndexDefinition] = []
+    versioned = False
+    max_update_attempts = 5
+    retry_delay = 0.01
+    max_page_size = 200
+
+    def __init_subclass__(cls, **kwargs):
+        """Register the indexes that a repository declares for its collection."""
+        super().__init_subclass__(**kwargs)
+        for index in cls.indexes:
+            IndexRegistry.register(cls.collection_name, index)
 
     @classmethod
-    def _get_entity_by_id(cls, entity_id):
+    def _get_entity_by_id(cls, entity_id, projection: dict = None):
         """
         :param entity_id: the database id of the entity
+        :param projection: Optional. Restricts the fields that are loaded, e.g. {"title": 1} or {"stories": 0}.
         :return: a tuple of (entity_id: str, entity_data: dict)
         """
         id_criteria = {"_id": entity_id}
-        entity_id, entity = cls.get_one_by_criteria(criteria=id_criteria)
+        entity_id, entity = cls.get_one_by_criteria(criteria=id_criteria, projection=projection)
         return entity_id, entity
 
     @classmethod
-    def get_one_by_criteria(cls, criteria: dict):
+    def get_one_by_criteria(cls, criteria: dict, projection: dict = None):
         """Finds an entity, given the specified criteria."""
-        entity_id, entity = cls.my_db.get_one_by_criteria(cls.collection_name, criteria)
+        entity_id, entity = cls.my_db.get_one_by_criteria(cls.collection_name, criteria, projection=projection)
         if not entity:
             raise ValueError("No entity found with criteria {}!".format(criteria))
         return entity_id, entity
 
     @classmethod
-    def get_many_by_criteria(cls, criteria: dict, exact_match: bool = True):
+    def get_many_by_criteria(cls, criteria: dict, exact_match: bool = True, projection: dict = None):
         """
         Find all entities that have the exact key-value pairs provided in criteria.
 
         :param criteria: a dictionary of key-value pairs that an entity must possess.
         :param exact_match: if set to false, will also find entities that have a superset of the values.
         (i.e. if criteria is {"key": ["value"]}, this would also find an entity with {"key": ["value", "other value"]}
+        :param projection: Optional. Restricts the fields that are loaded, e.g. {"title": 1} or {"stories": 0}.
         :return: a tuple of (entity_id: str, entity_data: dict)
         """
-        resultset = cls.my_db.get_many(collection_name=cls.collection_name, criteria=criteria, exact_match=exact_match)
+        resultset = cls.my_db.get_many(collection_name=cls.collection_name, criteria=criteria, exact_match=exact_match,
+                                       projection=projection)
         return resultset
 
     @classmethod
-    def _get_all(cls):
-        entity_cursor = cls.my_db.get_all(collection_name=cls.collection_name)
+    def _get_all(cls, projection: dict = None):
+        entity_cursor = cls.my_db.get_all(collection_name=cls.collection_name, projection=projection)
         return entity_cursor
 
+    @classmethod
+    def get_page(cls, criteria: dict = None, sort: list = None, limit: int = 50, cursor: str = None,
+                 projection: dict = None) -> Page:
+        """
+        Load one page of the entities that match the criteria. Pages are addressed by the sort values of the last
+        entity of the previous page (keyset pagination), so that every page costs the same, however far back it is.
+        :param sort: Optional. A list of (field, direction) pairs. The id is always used as the final tie-breaker.
+        :param limit: the maximum number of entities on this page (at most max_page_size).
+        :param cursor: Optional. The next_cursor of the previous page.
+        :param projection: Optional. Restricts the fields that are loaded, e.g. {"title": 1} or {"stories": 0}.
+        :returns: a Page of entity dicts (including their "_id").
+        :raises ValueError: if the cursor is invalid.
+        """
+        sort = [(path, direction) for path, direction in sort or [] if path != "_id"] \
+            + [("_id", dict(sort or []).get("_id", 1))]
+        limit = max(1, min(limit, cls.max_page_size))
+        criteria = dict(criteria or {})
+        if cursor:
+            keyset_criteria = build_keyset_criteria(sort, decode_cursor(cursor, sort))
+            criteria = {"$and": [criteria, keyset_criteria]} if criteria else keyset_criteria
+        if projection and any(projection.values()):
+            projection = dict(projection, **{path: 1 for path, direction in sort})
+        documents = list(cls.my_db.get_many(collection_name=cls.collection_name, criteria=criteria,
+                                            projection=projection, sort=sort, limit=limit + 1))
+        if len(documents) <= limit:
+            return Page(documents)
+        documents = documents[:limit]
+        return Page(documents, next_cursor=encode_cursor(sort, documents[-1]))
+
     @classmethod
     def _insert_entity(cls, entity: dict):
         """Insert a new entity to the database.
@@ -60,18 +109,59 @@ class Repository:
         return cls.my_db.delete_one(collection_name=cls.collection_name, criteria=delete_criteria)
 
     @classmethod
-    def _update_entity(cls, entity: dict, entity_id):
+    def _delete_many(cls, criteria: dict):
+        """Remove all entities that match the criteria from the database."""
+        return cls.my_db.delete_many(collection_name=cls.collection_name, criteria=criteria)
+
+    @classmethod
+    def _update_entity(cls, entity: dict, entity_id, expected_version: int = None):
+        if cls.versioned:
+            entity = {key: value for key, value in entity.items() if key not in ["_id", VERSION_FIELD]}
+            return cls._apply_update({"$set": entity}, entity_id, expected_version=expected_version)
         return cls.my_db.save_one(collection_name=cls.collection_name, new_values=entity, entity_id=entity_id)
 
+    @classmethod
+    def _apply_update(cls, update_statement: dict, entity_id, expected_version: int = None):
+        """
+        Persist only the changes of an entity, as described by an update statement (e.g. {"$set": {...}}).
+        The version of entities in versioned repositories is incremented with every change.
+        :param expected_version: Optional. The version of the entity when it was loaded.
+        :raises ConcurrentModificationError: if the entity has been changed since it was loaded.
+        """
+        if cls.versioned:
+            update_statement = dict(update_statement, **{"$inc": {VERSION_FIELD: 1}})
+        return cls.my_db.apply_update(collection_name=cls.collection_name, update_statement=update_statement,
+                                      entity_id=entity_id, expected_version=expected_version)
+
+    @classmethod
+    def _retry_on_conflict(cls, operation):
+        """
+        Run an operation that loads, changes and saves an entity. If the entity has been changed concurrently,
+        the operation is run again (at most max_update_attempts times in total), so that it can be re-applied
+        to the current state of the entity.
+        :param operation: a function that takes the number of the current attempt (starting with 1) as its argument.
+        :returns: the result of the operation.
+        """
+        for attempt in range(1, cls.max_update_attempts + 1):
+            try:
+                return operation(attempt)
+            except ConcurrentModificationError:
+                if attempt == cls.max_update_attempts:
+                    raise
+                time.sleep(random.uniform(0, cls.retry_delay * attempt))
+
     @classmethod
     def partial_update(cls, partial_dict: dict, entity_id: str = ""):
         if entity_id == "":
             entity_id = partial_dict.pop("_entity_id", "")
         if entity_id == "":
             raise ValueError("No id found for this entity!")
-        entity_id, entity_dict = cls._get_entity_by_id(entity_id)
-        for key in partial_dict:
-            if key in entity_dict:
-                entity_dict[key] = partial_dict[key]
-        return cls._update_entity(entity_dict, entity_id)
+
+        def update_entity(attempt):
+            loaded_id, entity_dict = cls._get_entity_by_id(entity_id)
+            for key in partial_dict:
+                if key in entity_dict:
+                    entity_dict[key] = partial_dict[key]
+            return cls._update_entity(entity_dict, loaded_id, expected_version=entity_dict.get(VERSION_FIELD, 0))
+        return cls._retry_on_conflict(update_entity)
 
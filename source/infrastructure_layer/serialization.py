@@ -0,0 +1,42 @@
+"""
+Serializes documents to JSON, preserving the values that MongoDB would store natively (dates and ObjectIds).
+"""
+import base64
+import json
+import zlib
+from datetime import datetime
+
+from bson import ObjectId
+
+
+class _DocumentEncoder(json.JSONEncoder):
+    """Encodes the values that MongoDB would store natively, so that they survive the round trip through JSON."""
+    def default(self, o):
+        if isinstance(o, datetime):
+            return {"$date": o.isoformat()}
+        if isinstance(o, ObjectId):
+            return str(o)
+        return super().default(o)
+
+
+def _decode_special_values(obj: dict):
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+
+def encode_document(document) -> str:
+    return json.dumps(document, cls=_DocumentEncoder, separators=(",", ":"))
+
+
+def decode_document(raw_document: str):
+    return json.loads(raw_document, object_hook=_decode_special_values)
+
+
+def compress_document(document) -> str:
+    """:returns: the document as compressed JSON, encoded in base64, so that every storage engine can store it."""
+    return base64.b64encode(zlib.compress(encode_document(document).encode("utf-8"), 9)).decode("ascii")
+
+
+def decompress_document(compressed_document: str):
+    return decode_document(zlib.decompress(base64.b64decode(compressed_document)).decode("utf-8"))
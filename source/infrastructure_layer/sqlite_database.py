@@ -0,0 +1,378 @@
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+from bson import ObjectId
+
+from infrastructure_layer import queries
+from infrastructure_layer.database import DatabaseBackend, DuplicateKeyError, VERSION_FIELD
+from infrastructure_layer.serialization import encode_document, decode_document
+
+
+class SQLiteBackend(DatabaseBackend):
+    """
+    A storage engine that keeps every collection as a table of JSON documents in a single SQLite file.
+    Intended for small or offline deployments, where the database file can simply be copied around.
+    Simple criteria (exact matches, $in and comparisons on scalar values) are evaluated by SQLite and can use the
+    expression indexes that repositories declare; all other criteria are evaluated in Python.
+    """
+    _index_prefix = "idx__"
+    _table_name_pattern = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+    _index_name_pattern = re.compile(r"^[A-Za-z0-9_\-]+$")
+
+    def __init__(self, db_config):
+        db_path = db_config.get("DB_PATH", ":memory:")
+        self._use_uri = db_path == ":memory:"
+        if self._use_uri:
+            # A plain ":memory:" database would be private to the connection of a single thread.
+            db_path = "file:csep-{}?mode=memory&cache=shared".format(uuid.uuid4().hex)
+        elif not os.path.isabs(db_path):
+            source_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+            db_path = os.path.join(source_dir, db_path)
+        self._db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _get_connection(self):
+        """Every thread uses its own connection. SQLite serializes the writes of all connections."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._db_path, isolation_level=None, timeout=10, uri=self._use_uri,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._connections_lock:
+                self._connections.append(connection)
+            self._local.connection = connection
+            self._local.tables = set()
+        return connection
+
+    def close(self):
+        """Close the connections of all threads. Threads that use this engine afterwards open new connections."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for connection in connections:
+            connection.close()
+
+    def reset_after_fork(self):
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def get_collection(self, collection_name: str):
+        """Creates the table (and its indexes) for this collection, unless the connection of this thread already did.
+        :return: the name of the table."""
+        self._get_connection()
+        if collection_name not in self._local.tables:
+            self._create_table(collection_name)
+            self._local.tables.add(collection_name)
+        return collection_name
+
+    def _create_table(self, collection_name: str):
+        if not self._table_name_pattern.match(collection_name):
+            raise ValueError("{} is not a legal collection name!".format(collection_name))
+        connection = self._get_connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS "{}" (id TEXT PRIMARY KEY, body TEXT NOT NULL)'
+                           .format(collection_name))
+
+    def list_indexes(self, collection_name: str):
+        table = self.get_collection(collection_name)
+        prefix = self._index_prefix + table + "__"
+        rows = self._get_connection().execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+                                              (table,))
+        return [name[len(prefix):] for (name,) in rows if name.startswith(prefix)]
+
+    def create_index(self, collection_name: str, index):
+        """Creates an expression index on the JSON fields. Text indexes become ordinary indexes on the field."""
+        table = self.get_collection(collection_name)
+        if not self._index_name_pattern.match(index.name):
+            raise ValueError("{} is not a legal index name!".format(index.name))
+        expressions = ["{} {}".format(self._json_field(field_name), "DESC" if direction == -1 else "ASC")
+                       for field_name, direction in index.fields]
+        statement = 'CREATE {unique}INDEX IF NOT EXISTS "{prefix}{table}__{name}" ON "{table}" ({expressions})'
+        self._get_connection().execute(statement.format(unique="UNIQUE " if index.unique else "",
+                                                        prefix=self._index_prefix, table=table, name=index.name,
+                                                        expressions=", ".join(expressions)))
+
+    def find_one(self, collection_name: str, criteria: dict, projection: dict = None):
+        for document in self._select(collection_name, criteria, limit=1, projection=projection):
+            return document
+        return None
+
+    def find(self, collection_name: str, criteria: dict, projection: dict = None, sort: list = None,
+             limit: int = None):
+        return list(self._select(collection_name, criteria, limit=limit, projection=projection, sort=sort))
+
+    def insert_one(self, collection_name: str, entity: dict):
+        entity_id = str(entity.get("_id") or ObjectId())
+        entity["_id"] = entity_id
+        body = {key: value for key, value in entity.items() if key != "_id"}
+        table = self.get_collection(collection_name)
+        try:
+            self._get_connection().execute('INSERT INTO "{}" (id, body) VALUES (?, ?)'.format(table),
+                                           (entity_id, encode_document(body)))
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError("An entity with the id {} already exists! ({})".format(entity_id, e)) from e
+        return entity_id
+
+    def update_one(self, collection_name: str, entity_id, update_statement: dict, expected_version: int = None):
+        """Applies the changes as partial updates of JSON paths. Inserts the document if it does not exist."""
+        entity_id = str(entity_id)
+        table = self.get_collection(collection_name)
+        body_expression, parameters = self._build_update_expression(update_statement)
+        if expected_version is not None:
+            statement = 'UPDATE "{table}" SET body = {expression} WHERE id = ? AND coalesce({version}, 0) = ?'.format(
+                table=table, expression=body_expression, version=self._json_field(VERSION_FIELD))
+            cursor = self._get_connection().execute(statement, [*parameters, entity_id, expected_version])
+            return cursor.rowcount > 0
+        new_document = queries.apply_update({}, update_statement)
+        statement = 'INSERT INTO "{table}" (id, body) VALUES (?, ?) ' \
+                    'ON CONFLICT(id) DO UPDATE SET body = {expression}'.format(table=table,
+                                                                              expression=body_expression)
+        self._get_connection().execute(statement, [entity_id, encode_document(new_document), *parameters])
+        return True
+
+    def delete_one(self, collection_name: str, criteria: dict):
+        for document in self._select(collection_name, criteria, limit=1):
+            return self._delete_ids(collection_name, [document["_id"]])
+        return 0
+
+    def delete_many(self, collection_name: str, criteria: dict):
+        if not criteria:
+            table = self.get_collection(collection_name)
+            return self._get_connection().execute('DELETE FROM "{}"'.format(table)).rowcount
+        entity_ids = [document["_id"] for document in self._select(collection_name, criteria)]
+        return self._delete_ids(collection_name, entity_ids)
+
+    def _delete_ids(self, collection_name: str, entity_ids):
+        if not entity_ids:
+            return 0
+        table = self.get_collection(collection_name)
+        placeholders = ", ".join("?" for _ in entity_ids)
+        return self._get_connection().execute('DELETE FROM "{}" WHERE id IN ({})'.format(table, placeholders),
+                                              entity_ids).rowcount
+
+    def explain(self, collection_name: str, criteria: dict, sort: list = None):
+        table = self.get_collection(collection_name)
+        where_clause, parameters, remaining_criteria = self._build_where_clause(criteria or {})
+        order_clause = self._build_order_clause(sort)
+        statement = 'EXPLAIN QUERY PLAN SELECT id, body FROM "{}"'.format(table)
+        if where_clause:
+            statement += " WHERE " + where_clause
+        if order_clause:
+            statement += " ORDER BY " + order_clause
+        plan = [row[-1] for row in self._get_connection().execute(statement, parameters)]
+        if remaining_criteria:
+            plan.append("FILTER IN PYTHON BY {}".format(sorted(remaining_criteria)))
+        return plan
+
+    def _select(self, collection_name: str, criteria: dict, limit: int = None, projection: dict = None,
+                sort: list = None):
+        table = self.get_collection(collection_name)
+        where_clause, parameters, remaining_criteria = self._build_where_clause(criteria or {})
+        order_clause = self._build_order_clause(sort)
+        if queries.is_inclusion_projection(projection) and not remaining_criteria:
+            yield from self._select_fields(table, where_clause, parameters, limit, projection, order_clause)
+            return
+        statement = 'SELECT id, body FROM "{}"'.format(table)
+        if where_clause:
+            statement += " WHERE " + where_clause
+        if order_clause:
+            statement += " ORDER BY " + order_clause
+        if limit and not remaining_criteria:
+            statement += " LIMIT {:d}".format(limit)
+        found = 0
+        for entity_id, raw_body in self._get_connection().execute(statement, parameters):
+            document = decode_document(raw_body)
+            document["_id"] = entity_id
+            if queries.matches(document, remaining_criteria):
+                yield queries.project(document, projection)
+                found += 1
+                if limit and found >= limit:
+                    return
+
+    def _select_fields(self, table: str, where_clause: str, parameters: list, limit: int, projection: dict,
+                       order_clause: str = ""):
+        """Extracts only the projected fields within SQLite, so that the rest of the body is never decoded."""
+        paths = [path for path, flag in projection.items() if flag and path != "_id"]
+        columns = ["json_type(body, '{path}'), json_extract(body, '{path}')".format(
+            path=self._json_path(path.split("."))) for path in paths]
+        statement = 'SELECT id, {} FROM "{}"'.format(", ".join(columns), table)
+        if where_clause:
+            statement += " WHERE " + where_clause
+        if order_clause:
+            statement += " ORDER BY " + order_clause
+        if limit:
+            statement += " LIMIT {:d}".format(limit)
+        for entity_id, *values in self._get_connection().execute(statement, parameters):
+            document = {}
+            for path, json_type, value in zip(paths, values[::2], values[1::2]):
+                if json_type is not None:
+                    queries.set_path(document, path, self._decode_json_value(json_type, value))
+            if projection.get("_id", 1):
+                document["_id"] = entity_id
+            yield document
+
+    @staticmethod
+    def _decode_json_value(json_type: str, value):
+        if json_type in ["object", "array"]:
+            return decode_document(value)
+        if json_type in ["true", "false"]:
+            return json_type == "true"
+        return value
+
+    @classmethod
+    def _build_where_clause(cls, criteria: dict):
+        """
+        Translates the criteria that SQLite can evaluate (exact matches, $in, $gt, $gte, $lt and $lte on scalar values
+        as well as $or and $and of such criteria) into SQL.
+        :returns: a tuple of (where_clause, parameters, criteria that must be evaluated in Python)
+        """
+        conditions = []
+        parameters = []
+        remaining_criteria = {}
+        for path, condition in criteria.items():
+            translation = cls._translate_criterion(path, condition)
+            if translation is None:
+                remaining_criteria[path] = condition
+            else:
+                conditions.append(translation[0])
+                parameters += translation[1]
+        return " AND ".join(conditions), parameters, remaining_criteria
+
+    @classmethod
+    def _translate_criterion(cls, path: str, condition):
+        """:returns: a tuple of (sql, parameters), or None if the criterion must be evaluated in Python."""
+        if path in ("$or", "$and"):
+            return cls._translate_logical_operator(path, condition)
+        operators = condition if isinstance(condition, dict) else {"$eq": condition}
+        if not operators or any(operator not in cls._sql_operators for operator in operators):
+            return None
+        conditions = []
+        parameters = []
+        for operator, operand in operators.items():
+            operands = operand if operator == "$in" else [operand]
+            if not isinstance(operands, (list, tuple)):
+                return None
+            values = [cls._to_sql_value(path, value, is_comparison=operator not in ("$eq", "$in"))
+                      for value in operands]
+            if any(value is None for value in values):
+                return None
+            column = cls._sql_column(path, dates=any(isinstance(value, datetime) for value in operands))
+            if operator == "$in":
+                if not values:
+                    conditions.append("0")
+                else:
+                    conditions.append("{} IN ({})".format(column, ", ".join("?" for _ in values)))
+            else:
+                conditions.append("{} {} ?".format(column, cls._sql_operators[operator]))
+            parameters += values
+        return " AND ".join(conditions), parameters
+
+    _sql_operators = {"$eq": "=", "$in": "IN", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+    @classmethod
+    def _translate_logical_operator(cls, operator: str, sub_criteria: list):
+        parts = []
+        parameters = []
+        for criteria in sub_criteria:
+            where_clause, sub_parameters, remaining_criteria = cls._build_where_clause(criteria)
+            if remaining_criteria:
+                return None
+            parts.append("({})".format(where_clause or "1"))
+            parameters += sub_parameters
+        if not parts:
+            return None
+        return "({})".format((" OR " if operator == "$or" else " AND ").join(parts)), parameters
+
+    @staticmethod
+    def _to_sql_value(path: str, value, is_comparison: bool = False):
+        """:returns: the value as a parameter of an SQL statement, None if it cannot be compared within SQLite."""
+        if value is None:
+            return None
+        if path == "_id":
+            return str(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if isinstance(value, bool):
+            return None if is_comparison else value
+        if isinstance(value, (str, int, float)):
+            return value
+        return None
+
+    @classmethod
+    def _sql_column(cls, path: str, dates: bool = False):
+        if path == "_id":
+            return "id"
+        if dates:
+            return "json_extract(body, '{}')".format(cls._json_path(path.split(".") + ["$date"]))
+        return cls._json_field(path)
+
+    @classmethod
+    def _build_order_clause(cls, sort: list):
+        """Dates are stored as {"$date": iso-string} and are therefore ordered by their ISO representation."""
+        terms = []
+        for path, direction in sort or []:
+            if path == "_id":
+                column = "id"
+            else:
+                column = "coalesce({}, {})".format(cls._sql_column(path, dates=True), cls._json_field(path))
+            terms.append("{} {}".format(column, "DESC" if direction < 0 else "ASC"))
+        return ", ".join(terms)
+
+    @classmethod
+    def _build_update_expression(cls, update_statement: dict):
+        """Translates an update statement into nested calls of json_set and json_insert on the stored body."""
+        for operator in update_statement:
+            if operator not in queries.SUPPORTED_UPDATE_OPERATORS:
+                raise ValueError("The update operator {} is not supported by this database backend!"
+                                 .format(operator))
+        expression = "body"
+        parameters = []
+        for path, value in update_statement.get("$set", {}).items():
+            keys = path.split(".")
+            expression = cls._insert_parents(expression, keys)
+            expression = "json_set({}, '{}', json(?))".format(expression, cls._json_path(keys))
+            parameters.append(encode_document(value))
+        for path, value in update_statement.get("$push", {}).items():
+            keys = path.split(".")
+            expression = cls._insert_parents(expression, keys)
+            expression = "json_insert({}, '{}', json('[]'))".format(expression, cls._json_path(keys))
+            for pushed_value in queries.get_pushed_values(value):
+                expression = "json_insert({}, '{}[#]', json(?))".format(expression, cls._json_path(keys))
+                parameters.append(encode_document(pushed_value))
+        for path, increment in update_statement.get("$inc", {}).items():
+            keys = path.split(".")
+            expression = cls._insert_parents(expression, keys)
+            expression = "json_set({}, '{}', coalesce({}, 0) + ?)".format(expression, cls._json_path(keys),
+                                                                         cls._json_field(path))
+            parameters.append(increment)
+        return expression, parameters
+
+    @classmethod
+    def _insert_parents(cls, expression: str, keys: list):
+        """Wraps the expression, such that all parent objects of the path exist."""
+        for depth in range(1, len(keys)):
+            expression = "json_insert({}, '{}', json('{{}}'))".format(expression, cls._json_path(keys[:depth]))
+        return expression
+
+    @classmethod
+    def _json_field(cls, path: str):
+        return "json_extract(body, '{}')".format(cls._json_path(path.split(".")))
+
+    @staticmethod
+    def _json_path(keys):
+        json_path = "$"
+        for key in keys:
+            if key.isdigit():
+                json_path += "[{}]".format(key)
+            else:
+                if '"' in key or "'" in key:
+                    raise ValueError("Field names must not contain quotes: {}".format(key))
+                json_path += '."{}"'.format(key)
+        return json_path
@@ -0,0 +1,102 @@
+"""
+A unit of work spans a single request: every entity is loaded at most once within it (identity map) and the changes
+of an entity are collected and committed together when the unit of work ends.
+The scope of a unit of work (e.g. flask.g) is provided by the presentation layer, see set_scope_provider().
+"""
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_scope_provider = None
+
+
+class UnitOfWork:
+    """Identity map and pending changes of the entities that have been used within the current scope."""
+    def __init__(self):
+        self._identity_map = {}
+        self._pending = OrderedDict()
+
+    def get(self, key):
+        """:returns: the entity that has been loaded with the given key before. None, if there is none."""
+        return self._identity_map.get(key)
+
+    def add(self, key, entity):
+        """Register a loaded (or saved) entity, so that it is returned by get() for the rest of this unit of work."""
+        self._identity_map[key] = entity
+
+    def remove_where(self, predicate):
+        """Forget all entities whose key matches the predicate, e.g. because they have been changed elsewhere."""
+        for key in [key for key in self._identity_map if predicate(key)]:
+            self._identity_map.pop(key, None)
+
+    def register_change(self, key, change, write):
+        """
+        Register a change of an entity that has already been applied to its instance, but not yet stored.
+        :param write: a function that takes the key and the list of pending changes of the entity and stores them.
+        It returns the entity in the state in which it has been stored.
+        """
+        self._pending.setdefault(key, (write, []))[1].append(change)
+
+    @property
+    def is_dirty(self):
+        return bool(self._pending)
+
+    def commit(self):
+        """
+        Store the pending changes of every entity with a single write per entity.
+        :raises Exception: the first error that occurred while writing. The changes of the other entities are
+        written nonetheless.
+        """
+        first_error = None
+        while self._pending:
+            key, (write, changes) = self._pending.popitem(last=False)
+            try:
+                self._identity_map[key] = write(key, changes)
+            except Exception as e:
+                logger.error("Could not commit %s changes of %s: %s", len(changes), key, e)
+                self._identity_map.pop(key, None)
+                first_error = first_error or e
+        if first_error is not None:
+            raise first_error
+
+
+def set_scope_provider(provider):
+    """
+    :param provider: a function that returns the object which holds the unit of work of the current scope
+    (e.g. flask.g during a request), or None outside of such a scope. None disables units of work altogether.
+    """
+    global _scope_provider
+    _scope_provider = provider
+
+
+def get_current_unit_of_work() -> Optional[UnitOfWork]:
+    """:returns: the unit of work of the current scope, which is created on first use. None outside of a scope."""
+    if _scope_provider is None:
+        return None
+    scope = _scope_provider()
+    if scope is None:
+        return None
+    unit_of_work = getattr(scope, "unit_of_work", None)
+    if unit_of_work is None:
+        unit_of_work = UnitOfWork()
+        setattr(scope, "unit_of_work", unit_of_work)
+    return unit_of_work
+
+
+def end_unit_of_work(commit: bool = True):
+    """
+    Commit the unit of work of the current scope (if there is one) and discard it.
+    :param commit: if False, the changes of the unit of work are discarded without being committed.
+    :raises Exception: the first error that occurred while committing.
+    """
+    if _scope_provider is None:
+        return
+    scope = _scope_provider()
+    unit_of_work = getattr(scope, "unit_of_work", None) if scope is not None else None
+    if unit_of_work is None:
+        return
+    setattr(scope, "unit_of_work", None)
+    if commit:
+        unit_of_work.commit()
@@ -0,0 +1,132 @@
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """
+    Collects pending changes per entity, so that several changes of the same entity can be written at once.
+    Pending changes are written when flush() is called (e.g. at the end of a request), at the latest after a short
+    window and when the process exits. Changes that could not be written are kept pending and written again, up to
+    max_attempts times.
+    """
+    lock_stripes = 32
+    max_attempts = 3
+
+    def __init__(self, write, window: float = 0.05):
+        """
+        :param write: a function that takes an entity id and the list of its pending changes and writes them.
+        :param window: the number of seconds after which pending changes are written, even if flush() is not called.
+        None, if they are only written by flush().
+        """
+        self.window = window
+        self._write = write
+        self._pending = OrderedDict()
+        self._failed_attempts = {}
+        self._lock = threading.Lock()
+        self._entity_locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        self._timer = None
+        self._local = threading.local()
+        atexit.register(self.flush)
+
+    def add(self, entity_id, change):
+        """Add a pending change of an entity."""
+        with self._lock:
+            self._pending.setdefault(entity_id, []).append(change)
+            self._schedule_flush()
+        self._get_touched_ids().add(entity_id)
+
+    def flush_touched(self):
+        """Write the pending changes of all entities that have been changed by the current thread."""
+        touched_ids = self._get_touched_ids()
+        entity_ids = list(touched_ids)
+        touched_ids.clear()
+        return self.flush(entity_ids)
+
+    def flush(self, entity_ids=None, retry: bool = True):
+        """
+        Write the pending changes of the given entities (or of all entities). Waits for changes of these entities
+        that are being written by another thread, so that they are stored once this method returns.
+        :param retry: if True, changes that could not be written are put back in front of the pending changes of
+        their entity, unless they have failed max_attempts times. If False, they are discarded, e.g. because the
+        error is reported to whoever made the changes.
+        :returns: a dict of {entity_id: result of writing its changes}
+        :raises Exception: the first error that occurred while writing. The changes of the other entities are
+        written nonetheless.
+        """
+        if entity_ids is None:
+            with self._lock:
+                entity_ids = list(self._pending)
+        results = {}
+        first_error = None
+        for entity_id in entity_ids:
+            with self._entity_locks[hash(entity_id) % self.lock_stripes]:
+                with self._lock:
+                    changes = self._pending.pop(entity_id, None)
+                if not changes:
+                    continue
+                try:
+                    results[entity_id] = self._write(entity_id, changes)
+                except Exception as e:
+                    logger.error("Could not write %s pending changes of %s: %s", len(changes), entity_id, e)
+                    self._requeue(entity_id, changes, retry)
+                    first_error = first_error or e
+                else:
+                    with self._lock:
+                        self._failed_attempts.pop(entity_id, None)
+        if first_error is not None:
+            raise first_error
+        return results
+
+    def close(self):
+        """Write all pending changes. Changes added afterwards are only written by explicit calls to flush()."""
+        atexit.unregister(self.flush)
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self.window = None
+        self.flush()
+
+    def has_pending_changes(self, entity_id=None):
+        with self._lock:
+            if entity_id is None:
+                return bool(self._pending)
+            return bool(self._pending.get(entity_id))
+
+    def _schedule_flush(self):
+        """Start the timer of the window, unless it is running. Must be called while holding the lock."""
+        if self.window is not None and self._timer is None:
+            self._timer = threading.Timer(self.window, self._flush_after_window)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _requeue(self, entity_id, changes, retry: bool):
+        """Put changes that could not be written back in front of the changes that have been added meanwhile."""
+        with self._lock:
+            failed_attempts = self._failed_attempts.pop(entity_id, 0) + 1
+            if not retry or failed_attempts >= self.max_attempts:
+                logger.error("Discarding %s pending changes of %s after %s failed attempts.",
+                             len(changes), entity_id, failed_attempts)
+                return
+            self._failed_attempts[entity_id] = failed_attempts
+            self._pending[entity_id] = changes + self._pending.get(entity_id, [])
+            self._pending.move_to_end(entity_id, last=False)
+            self._schedule_flush()
+
+    def _flush_after_window(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Could not write the pending changes after the window.")
+
+    def _get_touched_ids(self):
+        touched_ids = getattr(self._local, "touched_ids", None)
+        if touched_ids is None:
+            touched_ids = self._local.touched_ids = set()
+        return touched_ids
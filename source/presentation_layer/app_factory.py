@@ -1,10 +1,16 @@
 
-from flask import Flask
+import os
+
+import click
+from flask import Flask, g, has_request_context, request
 from flask_wtf import CSRFProtect
 
 from globalconfig import config
 from flask_bootstrap import Bootstrap
 
+from infrastructure_layer.database import CustomDB, ConcurrentModificationError
+from infrastructure_layer import instrumentation, unit_of_work
+
 
 def not_found():
     return "Not found", 404
@@ -18,10 +24,16 @@ def bad_request():
     return "Bad Request", 400
 
 
+def conflict(error):
+    return "This was changed by someone else in the meantime. Please reload the page and try again.", 409
+
+
 http_errors = {404: not_found, 403: not_allowed, 400: bad_request}
 
 
 class AppFactory:
+    _reconciled_backends = []
+
     @classmethod
     def create_app(cls):
         """ Flask application factory """
@@ -30,6 +42,16 @@ class AppFactory:
         new_app = Flask(__name__)
         new_app.config.update(config.get_flask_config())
         new_app = cls._register_blueprints(new_app)
+        new_app = cls._register_cli_commands(new_app)
+        new_app = cls._register_static_assets(new_app)
+        new_app = cls._register_compression(new_app)
+        new_app = cls._register_instrumentation(new_app)
+        new_app = cls._register_unit_of_work(new_app)
+        new_app = cls._register_conflict_handler(new_app)
+        if new_app.config.get("DB_ENSURE_INDEXES", False):
+            cls._reconcile_indexes(new_app)
+        if new_app.config.get("SCENARIO_CACHE_WARM_UP", False):
+            cls._warm_up_scenario_cache(new_app)
 
         new_app.url_map.strict_slashes = False
         Bootstrap(new_app)
@@ -46,18 +68,182 @@ class AppFactory:
         from presentation_layer.controllers.scenario_design.injects_blueprint import injects_bp
         from presentation_layer.controllers.facilitate_game.facilitation_bp import facilitation_bp
         from presentation_layer.controllers.test._test_bp import _test_bp
+        from presentation_layer.controllers.media.media_bp import media_bp
         blueprints = [api_bp, game_gp, index_gp, scenario_bp,
-                      variables_bp, injects_bp, facilitation_bp, _test_bp]
+                      variables_bp, injects_bp, facilitation_bp, _test_bp,
+                      media_bp]
+        if cls._is_debug_endpoint_enabled():
+            from presentation_layer.controllers.debug.debug_bp import debug_bp
+            blueprints.append(debug_bp)
         for bp in blueprints:
             new_app.register_blueprint(bp)
         return new_app
 
+    @staticmethod
+    def _is_debug_endpoint_enabled():
+        """:returns: whether the database calls may be shown (INSTRUMENTATION.DEBUG_ENDPOINT, off by default)."""
+        instrumentation_config = config.get_db_config().get("INSTRUMENTATION") or {}
+        return bool(instrumentation_config.get("DEBUG_ENDPOINT", False))
+
+    @classmethod
+    def _register_cli_commands(cls, new_app):
+        @new_app.cli.command("db-indexes")
+        @click.option("--dry-run", is_flag=True, help="Only report missing indexes, do not create them.")
+        def reconcile_indexes_command(dry_run):
+            """Create the database indexes that the repositories declare and report unused ones."""
+            report = CustomDB.reconcile_indexes(create_missing=not dry_run)
+            click.echo(str(report))
+
+        @new_app.cli.command("archive-games")
+        @click.option("--delay-hours", type=float, default=None,
+                      help="Archive games that have been closed for longer than this (default: ARCHIVE config).")
+        @click.option("--open-ttl-hours", type=float, default=None,
+                      help="Delete open games that have not been started for longer than this "
+                           "(default: ARCHIVE config).")
+        def archive_games_command(delay_hours, open_ttl_hours):
+            """Move closed games into the archive and delete open games that have never been started."""
+            from datetime import timedelta
+            from domain_layer.gameplay.game_management import GameArchiveRepository
+            delay = timedelta(hours=delay_hours) if delay_hours is not None else None
+            ttl = timedelta(hours=open_ttl_hours) if open_ttl_hours is not None else None
+            archived_count = GameArchiveRepository.archive_closed_games(delay=delay)
+            deleted_count = GameArchiveRepository.delete_stale_open_games(ttl=ttl)
+            click.echo("Archived {} closed games. Deleted {} open games that were never started."
+                       .format(archived_count, deleted_count))
+        return new_app
+
+    @classmethod
+    def _register_static_assets(cls, new_app):
+        """
+        Link to fingerprinted static files (STATIC_FINGERPRINTING), which are served with far-future cache headers
+        and precompressed into STATIC_BUILD_FOLDER once per process.
+        """
+        if not new_app.config.get("STATIC_FINGERPRINTING", False):
+            return new_app
+        from presentation_layer.static_assets import StaticAssets, serve_static
+        build_folder = os.path.join(new_app.root_path, new_app.config.get("STATIC_BUILD_FOLDER", "static_build"))
+        static_assets = StaticAssets.build_once(new_app.static_folder, build_folder,
+                                                min_size=new_app.config.get("COMPRESS_MIN_SIZE", 1024))
+        new_app.extensions["static_assets"] = static_assets
+        new_app.view_functions["static"] = serve_static
+
+        @new_app.url_defaults
+        def link_fingerprinted_static_files(endpoint, values):
+            if endpoint == "static" and "filename" in values:
+                values["filename"] = static_assets.get_hashed_name(values["filename"])
+        return new_app
+
+    @classmethod
+    def _register_compression(cls, new_app):
+        """
+        Compress dynamic responses (e.g. HTML and JSON) of at least COMPRESS_MIN_SIZE bytes with gzip.
+        Registered first, so that it runs after all other after_request functions.
+        """
+        from presentation_layer.compression import compress_response
+
+        @new_app.after_request
+        def compress_dynamic_response(response):
+            return compress_response(response, request.accept_encodings,
+                                     min_size=new_app.config.get("COMPRESS_MIN_SIZE", 1024),
+                                     level=new_app.config.get("COMPRESS_LEVEL", 6))
+        return new_app
+
+    @classmethod
+    def _register_instrumentation(cls, new_app):
+        """
+        Record the database calls of every request (see DATABASE.<env>.INSTRUMENTATION in config.yml).
+        In debug and test mode, requests which exceed the round-trip budget are reported (BUDGET_MODE: warn) or fail
+        (BUDGET_MODE: fail). If INSTRUMENTATION.DEBUG_ENDPOINT is set as well, a summary is sent in the X-DB-Stats
+        header and the recent calls are shown at /debug/db.
+        Must be registered before the unit of work, so that the calls of its commit are counted as well.
+        """
+        expose_stats = cls._is_debug_endpoint_enabled()
+
+        @new_app.before_request
+        def start_recording():
+            instrumentation.start_recording("{} {}".format(request.method, request.path))
+
+        @new_app.after_request
+        def report_database_calls(response):
+            stats = instrumentation.stop_recording()
+            if stats is None or not (new_app.debug or new_app.testing):
+                return response
+            if expose_stats:
+                response.headers["X-DB-Stats"] = stats.as_header()
+            instrumentation_config = config.get_db_config().get("INSTRUMENTATION") or {}
+            instrumentation.check_round_trip_budget(stats, instrumentation_config.get("ROUND_TRIP_BUDGET"),
+                                                    fail=instrumentation_config.get("BUDGET_MODE") == "fail")
+            return response
+
+        @new_app.teardown_request
+        def stop_recording(error=None):
+            instrumentation.stop_recording()
+        return new_app
+
+    @classmethod
+    def _register_unit_of_work(cls, new_app):
+        """
+        Every request is a unit of work (kept on flask.g): games and scenarios are loaded at most once per request
+        and the changes of games are committed once at the end of the request, before the response is sent.
+        The changes of requests that fail are discarded.
+        """
+        from domain_layer.gameplay.game_management import GameRepository
+        unit_of_work.set_scope_provider(lambda: g if has_request_context() else None)
+
+        @new_app.after_request
+        def commit_unit_of_work(response):
+            try:
+                unit_of_work.end_unit_of_work()
+                GameRepository.flush_pending_writes()
+            except ConcurrentModificationError as e:
+                return new_app.make_response(conflict(e))
+            return response
+
+        @new_app.teardown_request
+        def end_unit_of_work_on_teardown(error=None):
+            try:
+                unit_of_work.end_unit_of_work(commit=error is None)
+                if error is None:
+                    GameRepository.flush_pending_writes()
+            except Exception as e:
+                new_app.logger.error("Could not write the pending changes of games: %s", e)
+        return new_app
+
+    @classmethod
+    def _reconcile_indexes(cls, new_app):
+        """Create missing indexes once per storage engine and process. A failure must not prevent the app start."""
+        backend = CustomDB.get_backend()
+        if backend in cls._reconciled_backends:
+            return
+        cls._reconciled_backends.append(backend)
+        try:
+            report = CustomDB.reconcile_indexes(create_missing=True)
+            new_app.logger.info("Database indexes: %s", report)
+        except Exception as e:
+            new_app.logger.warning("Could not reconcile the database indexes: %s", e)
+
+    @classmethod
+    def _warm_up_scenario_cache(cls, new_app):
+        """Load the scenarios of active games, so that the first requests of running games are served quickly."""
+        from domain_layer.gameplay.game_management import GameRepository
+        try:
+            loaded_count = GameRepository.warm_up_scenario_cache()
+            new_app.logger.info("Loaded %s scenarios of active games into the cache.", loaded_count)
+        except Exception as e:
+            new_app.logger.warning("Could not warm up the scenario cache: %s", e)
+
     @classmethod
     def _register_error_handlers(cls, new_app):
         for err_code in http_errors:
             new_app.register_error_handler(err_code, http_errors[err_code])
         return new_app
 
+    @classmethod
+    def _register_conflict_handler(cls, new_app):
+        """Answer changes that still conflict after all retries (see Repository._retry_on_conflict) with 409."""
+        new_app.register_error_handler(ConcurrentModificationError, conflict)
+        return new_app
+
     @classmethod
     def _register_csrf(cls, new_app):
         csrf = CSRFProtect()
@@ -0,0 +1,53 @@
+"""
+Compression of responses. Static files are compressed once in advance (see static_assets), dynamic responses
+(e.g. HTML pages and JSON) are compressed on the fly if they are large enough to benefit from it.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {"text/html", "text/css", "text/plain", "text/javascript", "text/csv",
+                          "application/javascript", "application/json", "application/xml", "image/svg+xml"}
+
+
+def is_compressible(mimetype: str) -> bool:
+    return mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def get_available_encodings():
+    """:returns: the content encodings that can be created, the preferred first."""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(data: bytes, encoding: str, level: int = None) -> bytes:
+    """Compress data with the given content encoding ("gzip" or "br"), by default at the highest level."""
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if level is None else level)
+    return gzip.compress(data, compresslevel=9 if level is None else level)
+
+
+def compress_response(response, accept_encodings, min_size: int = 1024, level: int = 6):
+    """
+    Compress the body of a dynamic response with gzip, if the client accepts it and the body is at least
+    min_size bytes long. Files (direct passthrough), streamed and partial responses are left unchanged.
+    :param accept_encodings: the Accept-Encoding header of the request, as parsed by werkzeug.
+    :returns: the (changed) response.
+    """
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+            or "Content-Encoding" in response.headers or not is_compressible(response.mimetype):
+        return response
+    response.vary.add("Accept-Encoding")
+    if not accept_encodings.quality("gzip"):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    response.set_data(compress(data, "gzip", level))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, is_weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + "-gzip", weak=is_weak)
+    return response
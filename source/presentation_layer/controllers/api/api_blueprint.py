@@ -1,6 +1,8 @@
 
 import flask
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request, abort, stream_with_context
+
+from domain_layer.gameplay.games import GameState
 
 from application_layer.m2m_transformation import ScenarioTransformer, InjectTransformer, SolutionTransformer
 from domain_layer.gameplay.game_management import GameRepository, GroupGameRepository
@@ -11,18 +13,33 @@ from presentation_layer.controllers.scenario_design import auxiliary as aux
 api_bp = Blueprint('api', __name__, url_prefix="/api/v0")
 
 
+DEFAULT_PAGE_SIZE = 50
+
+
 @api_bp.route("/scenarios")
 def get_scenarios():
-    scenarios = EditableScenarioRepository.get_all_scenarios()
-    scenarios = ScenarioTransformer.scenarios_as_dict(scenarios)
-    return jsonify(scenarios)
+    """
+    List the scenarios page by page. Pass the next_cursor of a response as the cursor of the next request,
+    or request format=ndjson to stream all scenarios as one JSON object per line.
+    """
+    fetch_page = EditableScenarioRepository.get_scenarios_page
+    if request.args.get("format") == "ndjson":
+        return stream_ndjson(fetch_page, ScenarioTransformer.scenario_as_dict)
+    page = get_requested_page(fetch_page)
+    scenarios = ScenarioTransformer.scenarios_as_dict(page)
+    scenarios["next_cursor"] = page.next_cursor
+    return with_next_cursor(jsonify(scenarios), page)
 
 
 @api_bp.route("/scenarioslist")
 def get_scenarios_list():
-    scenarios = EditableScenarioRepository.get_all_scenarios()
-    scenarios = ScenarioTransformer.scenarios_as_json_list(scenarios)
-    return jsonify(scenarios)
+    """List summaries of the scenarios. The cursor of the next page is sent in the header X-Next-Cursor."""
+    fetch_page = EditableScenarioRepository.get_scenario_summaries_page
+    if request.args.get("format") == "ndjson":
+        return stream_ndjson(fetch_page, ScenarioTransformer.scenario_as_dict)
+    page = get_requested_page(fetch_page)
+    scenarios = ScenarioTransformer.scenarios_as_json_list(page)
+    return with_next_cursor(jsonify(scenarios), page)
 
 
 @api_bp.route("scenarios/<scenario_id>", methods=["GET"])
@@ -77,6 +94,33 @@ def delete_scenario_element(scenario_id, details):
     scenario_dict = aux.get_entity_details(scenario_id=scenario_id, details=details)
 
 
+@api_bp.route("/games", methods=["GET"])
+def get_games():
+    """
+    List games, the most recently started games first.
+    Filter them with one or more state parameters, e.g. ?state=open&state=in_progress.
+    """
+    try:
+        states = [GameState(state) for state in request.args.getlist("state")]
+    except ValueError:
+        abort(400, "Unknown game state! Use one of {}.".format(", ".join(state.value for state in GameState)))
+
+    def fetch_page(limit, cursor):
+        return GroupGameRepository.get_games_page(states=states, limit=limit, cursor=cursor)
+
+    if request.args.get("format") == "ndjson":
+        return stream_ndjson(fetch_page, game_as_dict)
+    page = get_requested_page(fetch_page)
+    games = {"games": [game_as_dict(game) for game in page], "next_cursor": page.next_cursor}
+    return with_next_cursor(jsonify(games), page)
+
+
+def game_as_dict(game):
+    game_dict = game.dict()
+    game_dict["game_id"] = game.game_id
+    return game_dict
+
+
 @api_bp.route("/games/<game_id>", methods=["GET"])
 def get_game(game_id):
     game = GroupGameRepository.get_game_by_id(game_id)
@@ -97,3 +141,39 @@ def solution_stats(game_id):
     game = GroupGameRepository.get_game_by_id(game_id)
     chartdata = SolutionTransformer.transform_solution_to_canvasjs(game, game.current_inject)
     return jsonify(chartdata)
+
+
+def get_requested_page(fetch_page):
+    """Load the page that is addressed by the parameters limit and cursor of the current request."""
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+    try:
+        return fetch_page(limit=limit, cursor=request.args.get("cursor"))
+    except ValueError as ve:
+        abort(400, str(ve))
+
+
+def with_next_cursor(response, page):
+    if page.has_next:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+    return response
+
+
+def stream_ndjson(fetch_page, transform):
+    """
+    Stream all entities as newline-delimited JSON, loading one page at a time.
+    The first page is loaded before the response starts, so that an invalid cursor still results in an error.
+    :param fetch_page: a function that takes a limit and a cursor and returns a Page.
+    :param transform: a function that turns an entity into a JSON-serializable object.
+    """
+    first_page = get_requested_page(fetch_page)
+    limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+
+    def generate():
+        page = first_page
+        while True:
+            for entity in page:
+                yield flask.json.dumps(transform(entity)) + "\n"
+            if not page.has_next:
+                return
+            page = fetch_page(limit=limit, cursor=page.next_cursor)
+    return flask.Response(stream_with_context(generate()), mimetype="application/x-ndjson")
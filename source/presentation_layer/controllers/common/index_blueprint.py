@@ -8,7 +8,7 @@ index_gp = Blueprint('index', __name__,
 
 @index_gp.route("/")
 def index():
-    scenarios = ScenarioRepository.get_all_scenarios()
+    scenarios = ScenarioRepository.get_scenario_summaries()
     return render_template("index.html", scenarios=scenarios)
 
 
@@ -0,0 +1,33 @@
+from flask import Blueprint, render_template, abort, current_app, request, jsonify
+
+from domain_layer.common.scenario_management import ScenarioRepository
+from domain_layer.gameplay.game_management import GameFactory
+from infrastructure_layer import instrumentation
+
+debug_bp = Blueprint('debug', __name__,
+                     template_folder='../../templates/debug', url_prefix="/debug")
+
+
+@debug_bp.before_request
+def only_in_debug_mode():
+    if not (current_app.debug or current_app.testing):
+        abort(404)
+
+
+@debug_bp.route("/db")
+def show_database_stats():
+    """The database calls of the most recent requests, the totals per query shape and the cache statistics."""
+    recent_stats = instrumentation.get_recent_stats()
+    totals = instrumentation.get_totals()
+    cache_stats = {"scenarios": ScenarioRepository.get_cache().get_stats(),
+                   "game scenarios": GameFactory.get_scenario_cache().get_stats()}
+    if request.args.get("format") == "json":
+        return jsonify({"requests": [{"label": stats.label, "round_trips": stats.round_trips,
+                                      "time_ms": stats.total_ms, "documents": stats.documents,
+                                      "queries": [record.as_dict() for record in stats.records]}
+                                     for stats in recent_stats],
+                        "totals": [dict(values, collection=collection, operation=operation, filter=filter_shape)
+                                   for (collection, operation, filter_shape), values in totals],
+                        "caches": cache_stats})
+    return render_template("database_stats.html", recent_stats=recent_stats, totals=totals,
+                           cache_stats=cache_stats)
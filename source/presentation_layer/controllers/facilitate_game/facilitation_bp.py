@@ -16,11 +16,14 @@ def show_scenarios():
 
 @facilitation_bp.route("/overview")
 def show_overview():
-    scenarios = ScenarioRepository.get_all_scenarios()
+    scenarios = ScenarioRepository.get_scenario_summaries()
     scenarios = list(scenarios)
-    games = game_repo.get_games_by_state()
-    games = list(games)
-    return render_template("game_overview.html", scenarios=scenarios, games=games)
+    try:
+        games = game_repo.get_games_page(limit=50, cursor=request.args.get("cursor"))
+    except ValueError:
+        return redirect(url_for("facilitation.show_overview"))
+    return render_template("game_overview.html", scenarios=scenarios, games=games.items,
+                           next_cursor=games.next_cursor)
 
 
 @facilitation_bp.route("/games/<scenario_id>/open")
@@ -40,8 +43,7 @@ def show_lobby(game_id):
 @facilitation_bp.route("/games/<game_id>/start")
 def start_game(game_id):
     game = game_repo.get_game_by_id(game_id)
-    game.start_game()
-    game_repo.save_game(game)
+    game = game_repo.update_game(game, lambda current_game: current_game.start_game())
     return redirect(url_for('facilitation.facilitate_game', game_id=game.game_id))
 
 
@@ -68,17 +70,19 @@ def handle_facilitation(game):
 @facilitation_bp.route("/games/<game_id>/advancegame")
 def advance_game(game_id):
     game = game_repo.get_game_by_id(game_id)
+    game_repo.update_game(game, advance)
+    return redirect(url_for("facilitation.facilitate_game", game_id=game_id))
+
+
+def advance(game):
     game.allow_next_inject()
     game.advance()
-    game_repo.save_game(game)
-    return redirect(url_for("facilitation.facilitate_game", game_id=game_id))
 
 
 @facilitation_bp.route("/games/<game_id>/abort")
 def abort_game(game_id):
     game = GameRepository.get_game_by_id(game_id)
-    game.abort_game()
-    GameRepository.save_game(game)
+    game = GameRepository.update_game(game, lambda current_game: current_game.abort_game())
     flash("Aborted Game '{game}'".format(game=game.name), "failure")
     return redirect(url_for("facilitation.show_overview"))
 
@@ -91,8 +95,8 @@ def set_variables(game_id):
         request_args = request
         for var in var_changes:
             try:
-                game.set_game_variable(var, var_changes[var])
-                GameRepository.save_game(game)
+                game = GameRepository.update_game(game, lambda current_game, var=var, value=var_changes[var]:
+                                                  current_game.set_game_variable(var, value))
                 flash("Changed value successfully!", "success")
             except ValueError as ve:
                 flash(str(ve), "failure")
@@ -40,8 +40,7 @@ def group_game(game_id):
         template_name = "participant_lobby.html"
     elif game.is_in_progress:
         if game.is_next_inject_allowed():
-            game.advance()
-            game_repo.save_game(game)
+            game = game_repo.update_game(game, advance_if_allowed)
         return play_game(game, participant_hash)
     elif game.is_closed:
         flash("This game is now closed!")
@@ -52,6 +51,11 @@ def group_game(game_id):
     return render_template(template_name, game_id=game_id, game=game)
 
 
+def advance_if_allowed(game):
+    if game.is_in_progress and game.is_next_inject_allowed():
+        game.advance()
+
+
 def play_game(game, participant_hash):
     current_inject = game.current_inject
     if game.is_closed:
@@ -81,8 +85,8 @@ def show_feedback(game):
 def game_reflection(game_id):
     game = game_repo.get_game_by_id(game_id)
     template_name = "game_reflection.html"
-    game.end_game()
-    game_repo.save_game(game)
+    if not game.is_closed:
+        game = game_repo.update_game(game, lambda current_game: current_game.end_game())
     return render_template(template_name, game=game)
 
 
@@ -91,8 +95,8 @@ def solve_inject(game_id, inject_slug):
     game = game_repo.get_game_by_id(game_id)
     solution = request.args.get("solution", 0)
     participant_hash = get_game_participant(game)
-    game.solve_inject(participant_id=participant_hash, inject_slug=inject_slug, solution=solution)
-    game_repo.save_game(game)
+    game = game_repo.update_game(game, lambda current_game: current_game.solve_inject(
+        participant_id=participant_hash, inject_slug=inject_slug, solution=solution))
     return redirect(url_for('games.inject_feedback', game_id=game.game_id))
 
 
@@ -115,8 +119,8 @@ def get_game_participant(game):
     print("get game participant {}".format(participant_hash))
     if not participant_hash or participant_hash not in game.participants:
         print("participant not found. Getting new participant.")
-        participant_hash = game.add_participant()
-        game_repo.save_game(game)
+        participant_hash = game.generate_participant_hash()
+        game_repo.update_game(game, lambda current_game: current_game.add_participant(participant_hash))
         session["participant_hash"] = participant_hash
         print("Added participant {}.".format(participant_hash))
     return participant_hash
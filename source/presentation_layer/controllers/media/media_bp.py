@@ -0,0 +1,84 @@
+import os
+
+from flask import Blueprint, abort, current_app, send_file, url_for
+
+from domain_layer.common.injects import MediaVariant
+from domain_layer.scenariodesign.scenario_management import EditableScenarioRepository
+from infrastructure_layer.image_derivatives import DerivativePipeline
+from infrastructure_layer.media_store import MediaStore
+
+media_bp = Blueprint('media', __name__, url_prefix="/media")
+
+MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def get_media_store() -> MediaStore:
+    """:returns: the media store of the current app, which is located in its MEDIA_FOLDER."""
+    media_store = current_app.extensions.get("media_store")
+    if media_store is None:
+        media_folder = current_app.config.get("MEDIA_FOLDER", "media")
+        media_store = MediaStore(os.path.join(current_app.root_path, media_folder))
+        current_app.extensions["media_store"] = media_store
+    return media_store
+
+
+def save_media(file_storage) -> str:
+    """
+    Store an uploaded file (e.g. the image of an inject) in the media store.
+    :param file_storage: the uploaded file, as provided by a FileField.
+    :returns: the key under which the file can be referenced, e.g. as media_path of an inject.
+    """
+    return get_media_store().save(file_storage.stream, file_storage.filename)
+
+
+def schedule_media_variants(scenario_id: str, media_path: str):
+    """
+    Create smaller variants of an uploaded image in the background and attach them to the injects of the scenario
+    that show it. Must be called after the scenario has been saved with the new media path.
+    :returns: a Future of the number of changed injects. None, if no variants are created.
+    """
+    if not MediaStore.is_media_key(media_path):
+        return None
+
+    def save_variants(derivatives):
+        media_variants = [MediaVariant(**derivative) for derivative in derivatives]
+        return EditableScenarioRepository.save_media_variants(scenario_id, media_path, media_variants)
+    return DerivativePipeline.submit(get_media_store(), media_path, save_variants)
+
+
+@media_bp.app_template_global()
+def media_url(media_path: str) -> str:
+    """
+    :returns: the url of a stored file.
+    Files that have been uploaded before the media store existed are served as static files.
+    """
+    if MediaStore.is_media_key(media_path):
+        return url_for("media.serve_media", key=media_path)
+    return url_for("static", filename="assets/uploads/" + media_path)
+
+
+@media_bp.app_template_global()
+def media_srcset(media_variants, media_path: str = "") -> str:
+    """
+    :param media_path: Optional. The original image, which is the only candidate if there are no variants (yet).
+    :returns: the srcset of an image with the given variants, e.g. '/media/<key> 320w, /media/<key> 640w'.
+    """
+    if not media_variants:
+        return media_url(media_path) if media_path else ""
+    return ", ".join("{} {}w".format(media_url(variant.media_path), variant.width) for variant in media_variants)
+
+
+@media_bp.route("/<key>")
+def serve_media(key):
+    """
+    Stored files never change, so they can be cached by browsers and proxies forever.
+    Conditional requests (ETag) and range requests are answered by send_file.
+    """
+    media_store = get_media_store()
+    if not media_store.exists(key):
+        abort(404)
+    response = send_file(media_store.get_path(key), mimetype=MediaStore.get_mimetype(key), conditional=True,
+                         etag=MediaStore.get_content_hash(key), max_age=MEDIA_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -1,12 +1,10 @@
-import os
-
 from flask import Blueprint, flash, redirect, render_template, request, make_response, url_for, Response
 from werkzeug.datastructures import CombinedMultiDict
-from werkzeug.utils import secure_filename
 
 from application_layer.m2m_transformation import InjectChoiceTransformer, InjectTransformer
 from domain_layer.scenariodesign.injects import EditableInject, InjectCondition, InjectChoice
 from domain_layer.scenariodesign.scenario_management import EditableScenarioRepository
+from presentation_layer.controllers.media.media_bp import save_media, schedule_media_variants
 from presentation_layer.controllers.scenario_design import auxiliary as aux
 from presentation_layer.controllers.scenario_design.scenario_forms import InjectForm, InjectConditionForm, \
     InjectChoicesForm
@@ -85,6 +83,7 @@ def add_inject(scenario_id):
         inject = EditableInject(**inject_dict)
         scenario.add_inject(inject=inject, story_index=0, preceded_by_inject=preceded_by, make_entry_node=is_entry_node)
         EditableScenarioRepository.save_scenario(scenario)
+        schedule_media_variants(scenario_id, inject.media_path)
         flash("Successfully added the inject!", category="success")
     return redirect(url_for('injects.edit_injects', scenario_id=scenario_id))
 
@@ -98,11 +97,16 @@ def save_inject(scenario_id):
     else:
         new_entry_node = inject_dict.pop("is_entry_node", False)
         remove_image = inject_dict.get("remove_image", False)
-        if not inject_dict["media_path"] and not remove_image:
-            inject_dict["media_path"] = scenario.get_inject_by_slug(inject_dict["slug"]).media_path
+        new_media_path = inject_dict["media_path"]
+        if not new_media_path and not remove_image:
+            previous_inject = scenario.get_inject_by_slug(inject_dict["slug"])
+            inject_dict["media_path"] = previous_inject.media_path
+            inject_dict["media_variants"] = previous_inject.media_variants
         inject = EditableInject(**inject_dict)
         scenario.update_inject(inject, 0, new_entry_node)
         EditableScenarioRepository.save_scenario(scenario)
+        if new_media_path:
+            schedule_media_variants(scenario_id, new_media_path)
         flash("Successfully updated the inject!", category="success")
     return redirect(url_for('injects.edit_injects', scenario_id=scenario_id))
 
@@ -119,17 +123,17 @@ def inject_core_form(scenario_id, inject_slug):
         remove_image = new_entries.get("remove_image", False)
         if not inject_form.media_path.data and not remove_image:
             new_entries["media_path"] = inject.media_path
+        else:
+            new_entries["media_variants"] = []
         if inject_form.media_path.data:
-            filename = secure_filename(inject_form.media_path.data.filename)
-            from presentation_layer.app import app
-            upload_path = app.config['UPLOAD_FOLDER']
-            inject_form.media_path.data.save(os.path.join(upload_path, filename))
-            new_entries["media_path"] = filename
+            new_entries["media_path"] = save_media(inject_form.media_path.data)
         inject_data = inject.dict()
         inject_data.update(new_entries)
         inject = EditableInject(**inject_data)
         scenario.update_inject(inject)
         EditableScenarioRepository.save_scenario(scenario)
+        if inject_form.media_path.data:
+            schedule_media_variants(scenario_id, inject.media_path)
         flash("Successfully updated the inject!", category="success")
     else:
         print(inject_form.errors)
@@ -144,11 +148,7 @@ def process_inject_form(scenario, form_data):
     if inject_form.validate():
         inject_dict = inject_form.data
         if inject_form.media_path.data:
-            filename = secure_filename(inject_form.media_path.data.filename)
-            from presentation_layer.app import app
-            upload_path = app.config['UPLOAD_FOLDER']
-            inject_form.media_path.data.save(os.path.join(upload_path, filename))
-            inject_dict["media_path"] = filename
+            inject_dict["media_path"] = save_media(inject_form.media_path.data)
         return inject_dict
     else:
         print(inject_form.errors)
@@ -12,7 +12,7 @@ scenario_bp = Blueprint('scenarios', __name__,
 
 @scenario_bp.route("/", strict_slashes=False)
 def show_scenarios():
-    scenarios = EditableScenarioRepository.get_all_scenarios()
+    scenarios = EditableScenarioRepository.get_scenario_summaries()
     core_form = ScenarioCoreForm()
     scenarios = list(scenarios)
     return render_template("scenarios_overview.html", scenarios=scenarios, core_form=core_form)
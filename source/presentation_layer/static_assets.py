@@ -0,0 +1,135 @@
+"""
+Fingerprinting of static files: url_for('static', ...) links to names that contain the hash of the file content
+(e.g. css/custom.1a2b3c4d5e6f.css), so that these urls can be cached forever. When a file changes, so does its url.
+Compressible files are additionally stored precompressed (gzip and, if available, brotli) when the app starts.
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import current_app, request, send_file, send_from_directory
+
+from presentation_layer import compression
+
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+
+class StaticAssets:
+    """The fingerprinted names and precompressed copies of the files in a static folder."""
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, static_folder: str, build_folder: str, min_size: int = 1024):
+        """
+        :param static_folder: the folder with the original files.
+        :param build_folder: the folder in which the precompressed copies are stored.
+        :param min_size: files smaller than this number of bytes are not precompressed.
+        """
+        self.static_folder = static_folder
+        self.build_folder = build_folder
+        self.min_size = min_size
+        self._hashed_names = {}
+        self._original_names = {}
+
+    @classmethod
+    def build_once(cls, static_folder: str, build_folder: str, min_size: int = 1024):
+        """:returns: the built assets of the static folder, which are built once per process."""
+        with cls._instances_lock:
+            static_assets = cls._instances.get((static_folder, build_folder))
+            if static_assets is None:
+                static_assets = cls(static_folder, build_folder, min_size)
+                static_assets.build()
+                cls._instances[(static_folder, build_folder)] = static_assets
+            return static_assets
+
+    def build(self):
+        """
+        Fingerprint all files of the static folder and precompress the compressible ones.
+        Copies that exist from a previous start are kept, since their names contain the content hash.
+        :returns: the number of fingerprinted files.
+        """
+        for directory, _, filenames in os.walk(self.static_folder):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                relative_name = os.path.relpath(path, self.static_folder).replace(os.sep, "/")
+                digest = self._hash_file(path)
+                hashed_name = self._get_fingerprinted_name(relative_name, digest)
+                self._hashed_names[relative_name] = hashed_name
+                self._original_names[hashed_name] = (relative_name, digest)
+                if compression.is_compressible(mimetypes.guess_type(relative_name)[0]) \
+                        and os.path.getsize(path) >= self.min_size:
+                    self._precompress(path, hashed_name)
+        return len(self._hashed_names)
+
+    def get_hashed_name(self, filename: str) -> str:
+        """:returns: the fingerprinted name of a static file. The filename itself, if the file is unknown."""
+        return self._hashed_names.get(filename, filename)
+
+    def get_original(self, hashed_name: str):
+        """:returns: a tuple of (original filename, content hash). None, if the name is not fingerprinted."""
+        return self._original_names.get(hashed_name)
+
+    def get_precompressed_path(self, hashed_name: str, encoding: str):
+        """:returns: the path of the compressed copy of a file. None, if there is none."""
+        path = self._get_build_path(hashed_name, encoding)
+        return path if os.path.exists(path) else None
+
+    def _precompress(self, path: str, hashed_name: str):
+        with open(path, "rb") as original:
+            data = None
+            for encoding in compression.get_available_encodings():
+                build_path = self._get_build_path(hashed_name, encoding)
+                if os.path.exists(build_path):
+                    continue
+                data = data if data is not None else original.read()
+                os.makedirs(os.path.dirname(build_path), exist_ok=True)
+                temp_path = build_path + ".tmp{}".format(os.getpid())
+                with open(temp_path, "wb") as compressed:
+                    compressed.write(compression.compress(data, encoding))
+                os.replace(temp_path, build_path)
+
+    def _get_build_path(self, hashed_name: str, encoding: str):
+        extension = ".br" if encoding == "br" else ".gz"
+        return os.path.join(self.build_folder, *hashed_name.split("/")) + extension
+
+    @staticmethod
+    def _get_fingerprinted_name(filename: str, digest: str):
+        root, extension = os.path.splitext(filename)
+        return "{}.{}{}".format(root, digest[:12], extension)
+
+    @staticmethod
+    def _hash_file(path: str):
+        content_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(64 * 1024), b""):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+
+def serve_static(filename: str):
+    """
+    Replaces the static view of flask. Fingerprinted names are served with far-future cache headers and,
+    if the client accepts it, precompressed. All other names are served as usual.
+    """
+    static_assets: StaticAssets = current_app.extensions["static_assets"]
+    original = static_assets.get_original(filename)
+    if original is None:
+        return current_app.send_static_file(filename)
+    original_name, digest = original
+    response = None
+    for encoding in compression.get_available_encodings():
+        path = static_assets.get_precompressed_path(filename, encoding)
+        if path is not None and request.accept_encodings.quality(encoding):
+            mimetype = mimetypes.guess_type(original_name)[0] or "application/octet-stream"
+            response = send_file(path, mimetype=mimetype, conditional=True, etag="{}-{}".format(digest, encoding),
+                                 max_age=STATIC_MAX_AGE)
+            response.headers["Content-Encoding"] = encoding
+            break
+    if response is None:
+        response = send_from_directory(current_app.static_folder, original_name, etag=digest,
+                                       max_age=STATIC_MAX_AGE)
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
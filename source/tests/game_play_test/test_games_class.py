@@ -4,7 +4,7 @@ from unittest import TestCase
 from domain_layer.gameplay.games import GroupGame
 from domain_layer.gameplay.injects import GameInject, GameInjectCondition
 from domain_layer.gameplay.mock_interface import MockGameProvider
-from domain_layer.gameplay.participants import GameParticipant
+from domain_layer.gameplay.participants import GameParticipant, InjectHistory
 
 
 class GameTest(TestCase):
@@ -62,6 +62,40 @@ class GameTest(TestCase):
         participant.solve_inject(inject_slug, "0")
         self.assertTrue(participant.has_solved(inject_slug))
 
+    def test_participant_history_is_indexed(self):
+        history = [InjectHistory(inject_slug="introduction", solution="0"),
+                   InjectHistory(inject_slug="secondinject", solution="0"),
+                   InjectHistory(inject_slug="introduction", solution="1")]
+        participant = GameParticipant(participant_id="some participant", history=history)
+        self.assertEqual(participant.solved_count("introduction"), 2)
+        self.assertEqual(participant.get_solution("introduction"), "1")
+        participant.solve_inject("secondinject", "1")
+        self.assertEqual(participant.get_solution("secondinject"), "1")
+        self.assertIsNone(participant.get_solution("thirdinject"))
+
+    def test_participant_history_is_stored_in_columns(self):
+        participant = GameParticipant(participant_id="some participant")
+        participant.solve_inject("introduction", "0", timestamp=datetime(2021, 5, 1, 10, 0, 0, 123456))
+        participant.solve_inject("secondinject", "0", timestamp=datetime(2021, 5, 1, 10, 5))
+        history_document = participant.dict()["history"]
+        self.assertEqual(history_document["injects"], ["introduction", "secondinject"])
+        self.assertEqual(history_document["solution_codes"], [0, 0])
+
+        restored = GameParticipant(**participant.dict())
+        self.assertEqual(restored.history, participant.history)
+        self.assertEqual(restored.history[-1].timestamp, datetime(2021, 5, 1, 10, 5))
+        self.assertEqual([entry.inject_slug for entry in restored.history[1:]], ["secondinject"])
+
+    def test_participant_history_is_not_shared(self):
+        participant = GameParticipant(participant_id="some participant")
+        participant.solve_inject("introduction", "0")
+        other_participant = GameParticipant(participant_id="other participant", history=participant.history)
+        other_participant.solve_inject("introduction", "1")
+        self.assertEqual(participant.get_solution("introduction"), "0")
+        self.assertEqual(len(participant.history), 1)
+        self.assertEqual(other_participant.get_solution("introduction"), "1")
+        self.assertEqual(len(other_participant.history), 2)
+
     def test_evaluate_change(self):
         pass
 
@@ -100,3 +134,93 @@ class GameTest(TestCase):
         game_dict = self.game.dict()
         print(game_dict)
         self.assertIsInstance(game_dict, dict)
+
+
+class GroupGameChangesTest(TestCase):
+    def setUp(self) -> None:
+        game = MockGameProvider().get_branching_game()
+        self.game = GroupGame(scenario=game.scenario, **game.dict())
+        self.game.add_participant("abc")
+        self.game.mark_persisted()
+
+    def test_no_changes_after_persisting(self):
+        self.assertEqual(self.game.get_changes(), {})
+
+    def test_new_participant_is_set(self):
+        self.game.add_participant("xyz")
+        changes = self.game.get_changes()
+        self.assertEqual(list(changes["$set"]), ["participants.xyz"])
+
+    def test_solution_is_counted(self):
+        self.game.solve_inject("abc", "introduction", "0")
+        changes = self.game.get_changes()
+        tally_document = {"visit": 0, "solved": 1, "expected": 1, "solutions": {"0": 1}}
+        self.assertEqual(changes, {"$set": {"participants.abc.solved_counts.introduction": 1,
+                                            "solution_tallies.introduction": tally_document}})
+
+    def test_solution_is_unsaved_history(self):
+        self.game.solve_inject("abc", "introduction", "0")
+        self.game.solve_inject("abc", "introduction", "1")
+        unsaved_history = self.game.get_unsaved_history()
+        self.assertEqual([entry["sequence"] for entry in unsaved_history], [1, 2])
+        self.game.mark_persisted()
+        self.assertEqual(self.game.get_unsaved_history(), [])
+
+    def test_participant_history_is_not_stored_in_game(self):
+        self.game.solve_inject("abc", "introduction", "0")
+        self.assertNotIn("history", self.game.get_document()["participants"]["abc"])
+
+    def test_changed_state_is_set(self):
+        self.game.start_game()
+        changes = self.game.get_changes()
+        self.assertIn("game_state", changes["$set"])
+        self.assertNotIn("participants", changes["$set"])
+
+
+class GroupGameTallyTest(TestCase):
+    def setUp(self) -> None:
+        game = MockGameProvider().get_branching_game()
+        self.game = GroupGame(scenario=game.scenario, **game.dict())
+        self.game.add_participant("abc")
+        self.game.add_participant("xyz")
+        self.game.start_game()
+        self.inject_slug = self.game.current_inject.slug
+
+    def test_answers_are_tallied(self):
+        self.game.solve_inject("abc", self.inject_slug, "0")
+        self.assertEqual(self.game.determine_group_answers(self.inject_slug), {"Do nothing": 1, "no solution": 1})
+        self.assertFalse(self.game.is_next_inject_allowed())
+        self.game.solve_inject("xyz", self.inject_slug, "1")
+        self.assertEqual(self.game.determine_group_answers(self.inject_slug),
+                         {"Do nothing": 1, "Research on Social Media": 1})
+        self.assertTrue(self.game.is_next_inject_allowed())
+
+    def test_changed_answer_replaces_previous_answer(self):
+        self.game.solve_inject("abc", self.inject_slug, "0")
+        self.game.solve_inject("abc", self.inject_slug, "1")
+        tally = self.game.get_solution_tally(self.inject_slug)
+        self.assertEqual((tally.solved, tally.solutions), (1, {"1": 1}))
+
+    def test_tally_is_restored_from_document(self):
+        self.game.solve_inject("abc", self.inject_slug, "0")
+        game = GroupGame(scenario=self.game.scenario, **self.game.get_document())
+        self.assertEqual(game.solution_tallies, self.game.solution_tallies)
+        self.assertEqual(game.determine_group_answers(self.inject_slug), {"Do nothing": 1, "no solution": 1})
+
+    def test_late_participant_only_has_to_solve_current_inject(self):
+        self.game.solve_inject("abc", self.inject_slug, "0")
+        self.game.solve_inject("xyz", self.inject_slug, "0")
+        self.game.advance()
+        next_inject_slug = self.game.current_inject.slug
+        self.game.add_participant("late")
+
+        late_participant = self.game.participants["late"]
+        self.assertEqual(len(late_participant.history), 0)
+        self.assertEqual(self.game.get_solved_count(late_participant, self.inject_slug), 1)
+        self.assertFalse(self.game.has_participant_solved("late"))
+        self.assertEqual(self.game.determine_group_answers(self.inject_slug), {"Do nothing": 2})
+        self.assertEqual(self.game.determine_group_answers(next_inject_slug), {"no solution": 3})
+
+        self.game.solve_inject("late", next_inject_slug, "0")
+        self.assertTrue(self.game.has_participant_solved("late"))
+        self.assertEqual(self.game.get_solution_tally(next_inject_slug).count_unsolved(3), 2)
@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+from infrastructure_layer.caching import LRUCache
+
+
+class LRUCacheTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.cache = LRUCache(max_size=2, ttl=10, clock=lambda: self.now)
+
+    def test_get_counts_hits_and_misses(self):
+        self.cache.put("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        stats = self.cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.get("a")
+        self.cache.put("c", 3)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertEqual(self.cache.get_stats()["evictions"], 1)
+
+    def test_entries_expire(self):
+        self.cache.put("a", 1)
+        self.now = 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get_stats()["expirations"], 1)
+
+    def test_invalidate_where(self):
+        self.cache.put(("scenario", 1), 1)
+        self.cache.put(("game", 1), 2)
+        self.assertEqual(self.cache.invalidate_where(lambda key: key[0] == "scenario"), 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = LRUCache(max_size=0)
+        cache.put("a", 1)
+        self.assertIsNone(cache.get("a"))
@@ -1,6 +1,8 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 
-from infrastructure_layer.database import CustomDB
+from bson import ObjectId
+
+from infrastructure_layer.database import CustomDB, MongoBackend
 
 
 class ScenarioPersistenceTest(TestCase):
@@ -19,3 +21,41 @@ class ScenarioPersistenceTest(TestCase):
     def test_insert(self):
         inserted_id = self.db.insert_one(collection_name="test", entity={"name": "test"})
         self.assertIsInstance(inserted_id, str)
+
+    def test_client_is_shared(self):
+        backend = self._build_mongo_backend()
+        first_client = backend.get_client()
+        second_client = backend.get_client()
+        self.assertIs(first_client, second_client)
+
+    def test_collection_handle_is_cached(self):
+        backend = self._build_mongo_backend()
+        first_handle = backend.get_collection("scenarios")
+        second_handle = backend.get_collection("scenarios")
+        self.assertIs(first_handle, second_handle)
+
+    def test_client_recreated_after_fork(self):
+        backend = self._build_mongo_backend()
+        first_client = backend.get_client()
+        backend.reset_after_fork()
+        second_client = backend.get_client()
+        self.assertIsNot(first_client, second_client)
+
+    def test_filter_keeps_composite_ids(self):
+        object_id = ObjectId()
+        query_filter = MongoBackend._build_filter({"_id": {"$in": [str(object_id), "game:abc:inject:1"]}})
+        self.assertEqual(query_filter, {"_id": {"$in": [object_id, "game:abc:inject:1"]}})
+
+    def test_save_with_composite_id_targets_same_document(self):
+        backend = self._build_mongo_backend()
+        collection = mock.MagicMock()
+        with mock.patch.object(backend, "get_collection", return_value=collection):
+            backend.update_one("game_histories", "game:abc:inject:1", {"$set": {"solution": "0"}})
+            backend.update_one("game_histories", "game:abc:inject:1", {"$set": {"solution": "0"}})
+        filters = [call.kwargs["filter"] for call in collection.update_one.call_args_list]
+        self.assertEqual(filters, [{"_id": "game:abc:inject:1"}] * 2)
+
+    @staticmethod
+    def _build_mongo_backend():
+        from globalconfig import config
+        return MongoBackend(config.get_db_config())
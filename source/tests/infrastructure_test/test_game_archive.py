@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from domain_layer.common.scenario_management import ScenarioRepository
+from domain_layer.gameplay.game_management import GroupGameFactory, GroupGameRepository, GameArchiveRepository
+from domain_layer.gameplay.mock_interface import MockScenarioBuilder
+from infrastructure_layer.database import CustomDB
+from infrastructure_layer.serialization import decompress_document
+
+
+class GameArchiveTest(TestCase):
+    repo = GroupGameRepository
+    archive = GameArchiveRepository
+    db = CustomDB
+
+    @classmethod
+    def setUpClass(cls):
+        from globalconfig import config
+        config.set_env("TEST")
+        cls.scenario = ScenarioRepository.save_scenario(MockScenarioBuilder.build_scenario())
+
+    def tearDown(self):
+        for collection_name in ["games", "game_histories", "archived_games", "scenario_snapshots"]:
+            self.db._purge_database(collection_name=collection_name)
+
+    def _play_game(self):
+        game_id = self.repo.save_game(GroupGameFactory.create_game(self.scenario))
+        game = self.repo.get_game_by_id(game_id)
+        game.start_game()
+        game.solve_inject("abc", game.current_inject.slug, "0")
+        game.end_game()
+        self.repo.save_game(game)
+        return game_id
+
+    def test_closed_game_is_archived(self):
+        game_id = self._play_game()
+        archived_count = self.archive.archive_closed_games(delay=timedelta(0), now=datetime.now() + timedelta(1))
+        self.assertEqual(archived_count, 1)
+        self.assertEqual(list(self.db.get_many("games", {})), [])
+        self.assertEqual(list(self.db.get_many("game_histories", {})), [])
+
+        game = self.repo.get_game_by_id(game_id)
+        self.assertTrue(game.is_archived)
+        self.assertEqual(game.participants["abc"].history[0].solution, "0")
+        self.assertEqual(game.scenario.title, self.scenario.title)
+        self.assertRaises(ValueError, self.repo.save_game, game)
+
+    def test_archived_history_is_stored_in_columns(self):
+        game_id = self._play_game()
+        self.archive.archive_closed_games(delay=timedelta(0), now=datetime.now() + timedelta(1))
+        _, archived_dict = self.db.get_one_by_criteria("archived_games", {"game_id": game_id})
+        archived_data = decompress_document(archived_dict["data"])
+        history_document = archived_data["game"]["participants"]["abc"]["history"]
+        self.assertEqual(history_document["solutions"], ["0"])
+        self.assertEqual(history_document["solution_codes"], [0])
+        self.assertNotIn("history", archived_data)
+
+    def test_recently_closed_game_is_not_archived(self):
+        self._play_game()
+        self.assertEqual(self.archive.archive_closed_games(delay=timedelta(hours=1)), 0)
+
+    def test_snapshot_is_stored_once(self):
+        self._play_game()
+        self._play_game()
+        self.archive.archive_closed_games(delay=timedelta(0), now=datetime.now() + timedelta(1))
+        self.assertEqual(len(list(self.db.get_many("scenario_snapshots", {}))), 1)
+
+    def test_stale_open_games_are_deleted(self):
+        open_game_id = self.repo.save_game(GroupGameFactory.create_game(self.scenario))
+        self._play_game()
+        deleted_count = self.archive.delete_stale_open_games(ttl=timedelta(0), now=datetime.now() + timedelta(1))
+        self.assertEqual(deleted_count, 1)
+        self.assertRaises(ValueError, self.repo.get_game_by_id, open_game_id)
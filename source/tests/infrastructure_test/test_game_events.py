@@ -0,0 +1,75 @@
+from unittest import TestCase, mock
+
+from domain_layer.common.scenario_management import ScenarioRepository
+from domain_layer.gameplay.game_management import GroupGameFactory, GroupGameRepository
+from domain_layer.gameplay.mock_interface import MockScenarioBuilder
+from infrastructure_layer.database import CustomDB, ConcurrentModificationError
+
+
+class GameEventSourcingTest(TestCase):
+    repo = GroupGameRepository
+    db = CustomDB
+
+    @classmethod
+    def setUpClass(cls):
+        from globalconfig import config
+        config.set_env("TEST")
+        cls.scenario = ScenarioRepository.save_scenario(MockScenarioBuilder.build_scenario())
+        cls.event_sourcing_config = config.get_db_config().setdefault("EVENT_SOURCING", {})
+
+    @classmethod
+    def tearDownClass(cls):
+        for collection_name in ["games", "game_events", "game_histories", "scenarios"]:
+            cls.db._purge_database(collection_name=collection_name)
+        super().tearDownClass()
+
+    def setUp(self):
+        game = GroupGameFactory.create_game(self.scenario)
+        game.enable_event_sourcing()
+        self.game_id = self.repo.save_game(game)
+
+    def test_commands_are_appended_as_events_and_replayed(self):
+        with mock.patch.dict(self.event_sourcing_config, {"SNAPSHOT_EVERY": 50}):
+            game = self.repo.get_game_by_id(self.game_id)
+            self.repo.update_game(game, lambda current_game: current_game.add_participant("abc"))
+            self.repo.update_game(game, lambda current_game: current_game.add_participant("xyz"))
+            self.repo.update_game(game, lambda current_game: current_game.start_game())
+            inject_slug = game.current_inject.slug
+            self.repo.update_game(game, lambda current_game: current_game.solve_inject("abc", inject_slug, "0"))
+
+        _, game_dict = self.db.get_one_by_criteria("games", {"_id": self.game_id})
+        event_documents = list(self.db.get_many("game_events", {"game_id": self.game_id}, sort=[("sequence", 1)]))
+        self.assertEqual([[event["type"] for event in document["events"]] for document in event_documents],
+                         [["participant_joined"], ["participant_joined"], ["game_started"], ["solution_submitted"]])
+        self.assertEqual(game_dict["event_sequence"], 3)
+        self.assertEqual(game_dict["participants"]["abc"]["solved_counts"], {})
+
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertEqual(game.event_sequence, 4)
+        self.assertTrue(game.is_in_progress)
+        self.assertEqual(set(game.participants), {"abc", "xyz"})
+        self.assertEqual(game.participants["abc"].get_solution(inject_slug), "0")
+
+    def test_snapshot_is_saved_every_n_events(self):
+        with mock.patch.dict(self.event_sourcing_config, {"SNAPSHOT_EVERY": 2}):
+            game = self.repo.get_game_by_id(self.game_id)
+            for participant_id in ["p1", "p2", "p3"]:
+                game = self.repo.update_game(game, lambda current_game: current_game.add_participant(participant_id))
+
+        _, game_dict = self.db.get_one_by_criteria("games", {"_id": self.game_id})
+        self.assertEqual(game_dict["event_sequence"], 2)
+        self.assertEqual(set(game_dict["participants"]), {"p1", "p2"})
+        self.assertEqual(set(self.repo.get_game_by_id(self.game_id).participants), {"p1", "p2", "p3"})
+
+    def test_events_with_the_same_sequence_conflict(self):
+        game = self.repo.get_game_by_id(self.game_id)
+        stale_game = self.repo.get_game_by_id(self.game_id)
+        game.add_participant("abc")
+        self.repo.save_game(game)
+        stale_game.add_participant("xyz")
+        with self.assertRaises(ConcurrentModificationError):
+            self.repo.save_game(stale_game)
+
+        game = self.repo.update_game(self.repo.get_game_by_id(self.game_id),
+                                     lambda current_game: current_game.add_participant("xyz"))
+        self.assertEqual(set(game.participants), {"abc", "xyz"})
@@ -0,0 +1,267 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from domain_layer.common.scenario_management import ScenarioRepository
+from domain_layer.gameplay.game_management import GroupGameFactory, GroupGameRepository
+from domain_layer.gameplay.games import GroupGame
+from domain_layer.gameplay.mock_interface import MockScenarioBuilder
+from infrastructure_layer import unit_of_work
+from infrastructure_layer.database import CustomDB, ConcurrentModificationError
+
+
+class GroupGamePersistenceTest(TestCase):
+    repo = GroupGameRepository
+    db = CustomDB
+
+    @classmethod
+    def setUpClass(cls):
+        from globalconfig import config
+        config.set_env("TEST")
+        cls.scenario = ScenarioRepository.save_scenario(MockScenarioBuilder.build_scenario())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db._purge_database(collection_name="games")
+        cls.db._purge_database(collection_name="scenarios")
+        super().tearDownClass()
+
+    def setUp(self):
+        game = GroupGameFactory.create_game(self.scenario)
+        self.game_id = self.repo.save_game(game)
+
+    def test_save_participant_and_solution(self):
+        game = self.repo.get_game_by_id(self.game_id)
+        game.add_participant("abc")
+        self.repo.save_game(game)
+        game.start_game()
+        game.solve_inject("abc", game.current_inject.slug, "0")
+        self.repo.save_game(game)
+
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertTrue(game.is_in_progress)
+        self.assertTrue(game.participants["abc"].has_solved(game.current_inject.slug))
+
+    def test_solutions_are_stored_as_history_events(self):
+        game = self.repo.get_game_by_id(self.game_id)
+        game.start_game()
+        game.solve_inject("abc", game.current_inject.slug, "0")
+        self.repo.save_game(game)
+
+        _, game_dict = self.db.get_one_by_criteria("games", {"_id": self.game_id})
+        events = list(self.db.get_many("game_histories", {"game_id": self.game_id}))
+        self.assertNotIn("history", game_dict["participants"]["abc"])
+        self.assertEqual(game_dict["participants"]["abc"]["solved_counts"], {game.current_inject.slug: 1})
+        self.assertEqual([event["participant_id"] for event in events], ["abc"])
+
+    def test_retried_update_does_not_duplicate_solutions(self):
+        game = self.repo.get_game_by_id(self.game_id)
+        self.repo.update_game(game, lambda current_game: current_game.start_game())
+        inject_slug = game.current_inject.slug
+        stale_game = self.repo.get_game_by_id(self.game_id)
+        self.repo.update_game(game, lambda current_game: current_game.add_participant("xyz"))
+        self.repo.update_game(stale_game, lambda current_game: current_game.solve_inject("abc", inject_slug, "0"))
+
+        entries = list(self.db.get_many("game_histories", {"game_id": self.game_id}))
+        self.assertEqual([(entry["participant_id"], entry["sequence"]) for entry in entries], [("abc", 1)])
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertEqual(game.participants["abc"].solved_count(inject_slug), 1)
+        self.assertEqual(len(game.participants["abc"].history), 1)
+
+    def test_repeated_history_entries_are_loaded_once(self):
+        entry = {"participant_id": "abc", "inject_slug": "inject", "solution": "0", "sequence": 1}
+        entries_by_participant = GroupGame.group_stored_history({"abc": {"inject": 1}}, [entry, dict(entry)])
+        self.assertEqual(entries_by_participant, {"abc": [entry]})
+
+    def test_failed_history_write_leaves_game_unchanged(self):
+        game = self.repo.get_game_by_id(self.game_id)
+        self.repo.update_game(game, lambda current_game: current_game.start_game())
+        inject_slug = game.current_inject.slug
+        with mock.patch.object(self.db, "save_one", side_effect=IOError("The database is not available!")):
+            with self.assertRaises(IOError):
+                self.repo.update_game(game, lambda current_game: current_game.solve_inject("abc", inject_slug, "0"))
+
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertNotIn("abc", game.participants)
+
+    def test_load_game_with_embedded_history(self):
+        game = GroupGameFactory.create_game(self.scenario)
+        game.start_game()
+        game.solve_inject("abc", game.current_inject.slug, "0")
+        game_id = self.db.insert_one("games", game.dict())
+        game = self.repo.get_game_by_id(game_id)
+        self.assertTrue(game.has_participant_solved("abc"))
+        self.assertEqual(game.participants["abc"].get_solution(game.current_inject.slug), "0")
+
+    def test_games_share_compiled_scenario(self):
+        other_game_id = self.repo.save_game(GroupGameFactory.create_game(self.scenario))
+        game = self.repo.get_game_by_id(self.game_id)
+        other_game = self.repo.get_game_by_id(other_game_id)
+        self.assertIs(game.scenario, other_game.scenario)
+
+    def test_game_keeps_scenario_of_creation(self):
+        scenario = ScenarioRepository.get_scenario_by_id(self.scenario.scenario_id)
+        scenario.title = "Edited after the game has been opened"
+        ScenarioRepository.save_scenario(scenario)
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertEqual(game.scenario.title, self.scenario.title)
+
+    def test_snapshot_is_stored_once_per_scenario(self):
+        self.repo.save_game(GroupGameFactory.create_game(self.scenario))
+        _, game_dict = self.db.get_one_by_criteria("games", {"_id": self.game_id})
+        snapshots = list(self.db.get_many("scenario_snapshots", {"scenario_hash": game_dict["scenario_hash"]}))
+        self.assertNotIn("scenario_snapshot", game_dict)
+        self.assertEqual(len(snapshots), 1)
+
+    def test_snapshot_is_not_read_when_cached(self):
+        self.repo.get_game_by_id(self.game_id)
+        backend = self.db.get_backend()
+        with mock.patch.object(backend, "find", wraps=backend.find) as find, \
+                mock.patch.object(backend, "find_one", wraps=backend.find_one) as find_one:
+            game = self.repo.get_game_by_id(self.game_id)
+        game_queries = find_one.call_args_list + find.call_args_list
+        self.assertEqual(game.scenario.title, self.scenario.title)
+        self.assertNotIn("scenario_snapshots", [call.args[0] for call in game_queries])
+        self.assertTrue(all(call.kwargs.get("projection") == {"scenario_snapshot": 0}
+                            for call in game_queries if call.args[0] == "games"))
+
+    def test_load_game_with_embedded_snapshot(self):
+        game = GroupGameFactory.create_game(self.scenario)
+        game_dict = dict(game.dict(), scenario_hash="embedded", scenario_snapshot=game.scenario.dict())
+        game_id = self.db.insert_one("games", game_dict)
+        game = self.repo.get_game_by_id(game_id)
+        self.assertEqual(game.scenario.title, self.scenario.title)
+
+    def test_load_game_without_snapshot(self):
+        game_dict = GroupGameFactory.create_game(self.scenario).dict()
+        game_id = self.db.insert_one("games", game_dict)
+        game = self.repo.get_game_by_id(game_id)
+        self.assertEqual(game.scenario.scenario_id, self.scenario.scenario_id)
+
+    def test_listing_loads_scenarios_in_one_query(self):
+        for _ in range(3):
+            self.db.insert_one("games", GroupGameFactory.create_game(self.scenario).dict())
+        ScenarioRepository.invalidate_cache(self.scenario.scenario_id)
+        backend = self.db.get_backend()
+        with mock.patch.object(backend, "find", wraps=backend.find) as find, \
+                mock.patch.object(backend, "find_one", wraps=backend.find_one) as find_one:
+            games = list(self.repo.get_games_by_state())
+        scenario_queries = [call for call in find.call_args_list + find_one.call_args_list
+                            if call.args[0] == "scenarios"]
+        self.assertEqual(len(scenario_queries), 1)
+
+    def test_pending_commands_are_written_at_once(self):
+        self.repo.configure_write_behind(enabled=True, window_ms=None)
+        try:
+            game = self.repo.get_game_by_id(self.game_id)
+            game = self.repo.update_game(game, lambda current_game: current_game.add_participant("abc"))
+            game = self.repo.update_game(game, lambda current_game: current_game.add_participant("xyz"))
+            self.assertEqual(self.repo.get_game_by_id(self.game_id).number_of_participants(), 0)
+            self.repo.flush_pending_writes()
+        finally:
+            self.repo.configure_write_behind(enabled=True, strict=True)
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertEqual(game.number_of_participants(), 2)
+        self.assertEqual(game.version, 1)
+
+    def test_unit_of_work_loads_and_commits_game_once(self):
+        request_scope = SimpleNamespace()
+        unit_of_work.set_scope_provider(lambda: request_scope)
+        try:
+            game = self.repo.get_game_by_id(self.game_id)
+            self.assertIs(self.repo.get_game_by_id(self.game_id), game)
+            self.repo.update_game(game, lambda current_game: current_game.add_participant("abc"))
+            self.repo.update_game(game, lambda current_game: current_game.add_participant("xyz"))
+            self.assertEqual(self.repo.get_game_by_id(self.game_id).number_of_participants(), 2)
+            unit_of_work.end_unit_of_work()
+        finally:
+            unit_of_work.set_scope_provider(None)
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertEqual(game.number_of_participants(), 2)
+        self.assertEqual(game.version, 1)
+
+    def test_unit_of_work_commits_changed_game(self):
+        request_scope = SimpleNamespace()
+        unit_of_work.set_scope_provider(lambda: request_scope)
+        self.repo.configure_write_behind(enabled=False)
+        try:
+            game = self.repo.get_game_by_id(self.game_id)
+            for participant_id in ["abc", "xyz"]:
+                self.repo.update_game(game, lambda current_game, participant_id=participant_id:
+                                      current_game.add_participant(participant_id))
+            with mock.patch.object(self.repo, "_load_game") as load_game:
+                unit_of_work.end_unit_of_work()
+            load_game.assert_not_called()
+        finally:
+            unit_of_work.set_scope_provider(None)
+            self.repo.configure_write_behind(enabled=True, strict=True)
+        stored_participants = self.repo.get_game_by_id(self.game_id).participants
+        self.assertIn("abc", stored_participants)
+        self.assertIn("xyz", stored_participants)
+        self.assertEqual(len(stored_participants), 2)
+
+    def test_unit_of_work_commits_through_write_buffer(self):
+        request_scope = SimpleNamespace()
+        unit_of_work.set_scope_provider(lambda: request_scope)
+        self.repo.configure_write_behind(enabled=True, window_ms=None)
+        try:
+            game = self.repo.get_game_by_id(self.game_id)
+            self.repo.update_game(game, lambda current_game: current_game.add_participant("abc"))
+            unit_of_work.end_unit_of_work()
+            self.assertTrue(self.repo.get_write_buffer().has_pending_changes())
+            self.repo.flush_pending_writes()
+        finally:
+            unit_of_work.set_scope_provider(None)
+            self.repo.configure_write_behind(enabled=True, strict=True)
+        self.assertEqual(set(self.repo.get_game_by_id(self.game_id).participants), {"abc"})
+
+    def test_saving_outdated_game_fails(self):
+        first_copy = self.repo.get_game_by_id(self.game_id)
+        second_copy = self.repo.get_game_by_id(self.game_id)
+        first_copy.add_participant("abc")
+        second_copy.add_participant("xyz")
+        self.repo.save_game(first_copy)
+        self.assertRaises(ConcurrentModificationError, self.repo.save_game, second_copy)
+
+    def test_concurrent_joins_are_kept(self):
+        first_copy = self.repo.get_game_by_id(self.game_id)
+        second_copy = self.repo.get_game_by_id(self.game_id)
+        self.repo.update_game(first_copy, lambda game: game.add_participant("abc"))
+        self.repo.update_game(second_copy, lambda game: game.add_participant("xyz"))
+
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertEqual(set(game.participants), {"abc", "xyz"})
+        self.assertEqual(game.version, 2)
+
+    def test_concurrent_answers_are_counted(self):
+        game = self.repo.get_game_by_id(self.game_id)
+        game.start_game()
+        self.repo.save_game(game)
+        inject_slug = game.current_inject.slug
+        participant_ids = ["participant{}".format(number) for number in range(20)]
+
+        def answer(participant_id):
+            self.repo.update_game(self.repo.get_game_by_id(self.game_id),
+                                  lambda current_game: current_game.solve_inject(participant_id, inject_slug, "0"))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(answer, participant_ids))
+
+        game = self.repo.get_game_by_id(self.game_id)
+        self.assertEqual(game.determine_group_answers(inject_slug)[str(game.current_inject.choices[0])], 20)
+
+    def test_games_page_by_page(self):
+        for _ in range(3):
+            self.repo.save_game(GroupGameFactory.create_game(self.scenario))
+        first_page = self.repo.get_games_page(limit=2)
+        second_page = self.repo.get_games_page(limit=100, cursor=first_page.next_cursor)
+        game_ids = [game.game_id for game in first_page] + [game.game_id for game in second_page]
+        all_game_ids = [game.game_id for game in self.repo.get_games_by_state()]
+
+        self.assertTrue(first_page.has_next)
+        self.assertFalse(second_page.has_next)
+        self.assertEqual(sorted(game_ids), sorted(all_game_ids))
+        start_times = [game.start_time for game in list(first_page) + list(second_page)]
+        self.assertEqual(start_times, sorted(start_times, reverse=True))
+
+    def test_invalid_cursor(self):
+        self.assertRaises(ValueError, self.repo.get_games_page, cursor="not-a-cursor")
@@ -0,0 +1,45 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from munch import Munch
+
+import domain_layer.gameplay.game_management  # noqa: F401 registers the indexes of the game repositories
+from infrastructure_layer.indexes import IndexRegistry, IndexDefinition
+from infrastructure_layer.sqlite_database import SQLiteBackend
+
+
+class IndexRegistryTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_config = Munch(DB_NAME="csep-test", DB_PATH=os.path.join(self.tmp_dir.name, "test.sqlite3"))
+        self.db = SQLiteBackend(db_config)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_repositories_declare_indexes(self):
+        declared_indexes = IndexRegistry.get_declared_indexes()
+        self.assertIn(IndexDefinition("game_state"), declared_indexes["games"])
+
+    def test_dry_run_reports_missing_indexes(self):
+        report = IndexRegistry.reconcile(self.db, create_missing=False)
+        self.assertIn("game_state_1", report.missing["games"])
+        self.assertEqual(self.db.list_indexes("games"), [])
+
+    def test_reconcile_is_idempotent(self):
+        first_report = IndexRegistry.reconcile(self.db)
+        second_report = IndexRegistry.reconcile(self.db)
+        self.assertIn("game_state_1", first_report.created["games"])
+        self.assertEqual(second_report.created, {})
+        self.assertTrue(second_report.is_complete)
+
+    def test_undeclared_indexes_are_reported(self):
+        self.db.create_index("games", IndexDefinition("participants", name="legacy_index"))
+        report = IndexRegistry.reconcile(self.db)
+        self.assertIn("legacy_index", report.undeclared["games"])
+
+    def test_conflicting_declaration_is_rejected(self):
+        with self.assertRaises(ValueError):
+            IndexRegistry.register("games", IndexDefinition("scenario_id", name="game_state_1"))
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from infrastructure_layer import instrumentation
+from infrastructure_layer.instrumentation import InstrumentedBackend, RoundTripBudgetExceededError
+from infrastructure_layer.memory_database import InMemoryBackend
+
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        self.db = InstrumentedBackend(InMemoryBackend())
+        self.stats = instrumentation.start_recording("test")
+
+    def tearDown(self):
+        instrumentation.stop_recording()
+        instrumentation.reset()
+
+    def test_filter_shape_omits_values(self):
+        shape = instrumentation.get_filter_shape({"_id": {"$in": ["a", "b"]}, "$or": [{"title": "x"}]})
+        self.assertEqual(shape, '{"$or": [{"title": "?"}], "_id": {"$in": "?"}}')
+
+    def test_operations_are_recorded(self):
+        entity_id = self.db.insert_one("test", {"title": "abc"})
+        self.db.find_one("test", {"_id": entity_id})
+        self.assertEqual(len(self.db.find("test", {"title": "abc"})), 1)
+        self.assertEqual([record.operation for record in self.stats.records], ["insert_one", "find_one", "find"])
+        self.assertEqual(self.stats.documents, 2)
+        self.assertEqual(instrumentation.get_totals()[0][1]["count"], 1)
+
+    def test_repeated_queries_exceed_budget(self):
+        for entity_id in ["a", "b", "c", "d"]:
+            self.db.find_one("test", {"_id": entity_id})
+        self.assertEqual(self.stats.get_repeated_queries(), [(("test", "find_one", '{"_id": "?"}'), 4)])
+        self.assertTrue(instrumentation.check_round_trip_budget(self.stats, budget=4, fail=True))
+        self.assertRaises(RoundTripBudgetExceededError,
+                          instrumentation.check_round_trip_budget, self.stats, budget=3, fail=True)
@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+from infrastructure_layer.memory_database import InMemoryBackend
+
+
+class InMemoryBackendTest(TestCase):
+    def setUp(self):
+        self.db = InMemoryBackend()
+        self.game_id = self.db.insert_one("games", {"game_state": "open", "scenario_id": "abc"})
+        self.db.insert_one("games", {"game_state": "finished", "scenario_id": "abc"})
+
+    def test_insert_returns_string_id(self):
+        self.assertIsInstance(self.game_id, str)
+
+    def test_find_by_id(self):
+        game = self.db.find_one("games", {"_id": self.game_id})
+        self.assertEqual(game["game_state"], "open")
+
+    def test_find_unknown_id(self):
+        self.assertIsNone(self.db.find_one("games", {"_id": "unknown"}))
+
+    def test_find_with_in_operator(self):
+        games = self.db.find("games", {"game_state": {"$in": ["open", "in progress"]}})
+        self.assertEqual(len(games), 1)
+
+    def test_find_sorted_with_limit(self):
+        games = self.db.find("games", {"_id": {"$gte": ""}}, sort=[("game_state", -1)], limit=1)
+        self.assertEqual([game["game_state"] for game in games], ["open"])
+
+    def test_find_with_projection(self):
+        game = self.db.find_one("games", {"_id": self.game_id}, projection={"game_state": 1})
+        self.assertEqual(game, {"_id": self.game_id, "game_state": "open"})
+
+    def test_set_nested_value(self):
+        self.db.update_one("games", self.game_id, {"$set": {"participants.abc": {"participant_id": "abc"}}})
+        game = self.db.find_one("games", {"_id": self.game_id})
+        self.assertEqual(game["participants"]["abc"]["participant_id"], "abc")
+
+    def test_push_to_history(self):
+        self.db.update_one("games", self.game_id, {"$push": {"participants.abc.history": {"$each": [{"solution": "1"}]}}})
+        self.db.update_one("games", self.game_id, {"$push": {"participants.abc.history": {"solution": "2"}}})
+        game = self.db.find_one("games", {"_id": self.game_id})
+        self.assertEqual(game["participants"]["abc"]["history"], [{"solution": "1"}, {"solution": "2"}])
+
+    def test_update_with_expected_version(self):
+        update_statement = {"$set": {"game_state": "in progress"}, "$inc": {"version": 1}}
+        self.assertTrue(self.db.update_one("games", self.game_id, update_statement, expected_version=0))
+        self.assertFalse(self.db.update_one("games", self.game_id, update_statement, expected_version=0))
+        self.assertEqual(self.db.find_one("games", {"_id": self.game_id})["version"], 1)
+
+    def test_update_upserts(self):
+        self.db.update_one("games", "new-id", {"$set": {"game_state": "open"}})
+        self.assertIsNotNone(self.db.find_one("games", {"_id": "new-id"}))
+
+    def test_returned_documents_are_copies(self):
+        game = self.db.find_one("games", {"_id": self.game_id})
+        game["game_state"] = "aborted"
+        self.assertEqual(self.db.find_one("games", {"_id": self.game_id})["game_state"], "open")
+
+    def test_delete_many(self):
+        deleted_count = self.db.delete_many("games", {"scenario_id": "abc"})
+        self.assertEqual(deleted_count, 2)
+        self.assertEqual(self.db.find("games", {}), [])
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from domain_layer.common.scenarios import BaseScenario
+from domain_layer.common.scenarios import BaseScenario, ScenarioSummary
 from domain_layer.gameplay.mock_interface import MockScenarioBuilder
 from domain_layer.common.injects import BaseChoiceInject
 from domain_layer.scenariodesign.injects import EditableInject
@@ -51,6 +51,32 @@ class ScenarioPersistenceTest(TestCase):
             print(next(all_scenarios))
         self.assertIsNotNone(all_scenarios)
 
+    def test_get_scenario_summaries(self):
+        summaries = {summary.scenario_id: summary for summary in self.repo.get_scenario_summaries()}
+        summary = summaries[self.test_scenario.scenario_id]
+        self.assertIsInstance(summary, ScenarioSummary)
+        self.assertEqual(summary.title, self.test_scenario.title)
+        self.assertEqual(summary.description, self.test_scenario.scenario_description)
+
+    def test_cached_scenario_is_not_shared(self):
+        scenario = self.repo.get_scenario_by_id(self.test_scenario.scenario_id)
+        scenario.title = "Changed, but not saved"
+        self.assertEqual(self.repo.get_scenario_by_id(self.test_scenario.scenario_id).title, self.test_scenario.title)
+
+    def test_save_invalidates_cached_scenario(self):
+        scenario = self.repo.get_scenario_by_id(self.test_scenario.scenario_id)
+        scenario.title = "Changed title!"
+        self.repo.save_scenario(scenario)
+        self.assertEqual(self.repo.get_scenario_by_id(self.test_scenario.scenario_id).title, "Changed title!")
+
+    def test_scenario_changed_by_another_process_is_reloaded(self):
+        scenario_id = self.test_scenario.scenario_id
+        self.repo.get_scenario_by_id(scenario_id)
+        self.db.apply_update(collection_name="scenarios", entity_id=scenario_id,
+                             update_statement={"$set": {"title": "Changed elsewhere!"}, "$inc": {"version": 1}})
+        self.assertEqual(self.repo.get_scenario_by_id(scenario_id).title, "Changed elsewhere!")
+        self.assertEqual(self.repo.get_scenarios_by_ids([scenario_id])[scenario_id].title, "Changed elsewhere!")
+
     def test_update_scenario_change_title(self):
         self.test_scenario.title = "Changed title!"
         inserted_id = self.repo.save_scenario(self.test_scenario).scenario_id
@@ -0,0 +1,110 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import TestCase
+
+from munch import Munch
+
+from infrastructure_layer.sqlite_database import SQLiteBackend
+
+
+class SQLiteBackendTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        db_config = Munch(DB_NAME="csep-test", DB_PATH=os.path.join(self.tmp_dir.name, "test.sqlite3"))
+        self.db = SQLiteBackend(db_config)
+        self.start_time = datetime(2021, 6, 1, 10, 30)
+        self.game_id = self.db.insert_one("games", {"game_state": "open", "scenario_id": "abc",
+                                                     "start_time": self.start_time, "participants": {}})
+        self.db.insert_one("games", {"game_state": "finished", "scenario_id": "abc"})
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp_dir.cleanup()
+
+    def test_find_by_id(self):
+        game = self.db.find_one("games", {"_id": self.game_id})
+        self.assertEqual(game["game_state"], "open")
+
+    def test_datetime_round_trip(self):
+        game = self.db.find_one("games", {"_id": self.game_id})
+        self.assertEqual(game["start_time"], self.start_time)
+
+    def test_find_with_in_operator(self):
+        games = self.db.find("games", {"game_state": {"$in": ["open", "in progress"]}})
+        self.assertEqual([game["_id"] for game in games], [self.game_id])
+
+    def test_find_sorted_by_date_with_limit(self):
+        later_id = self.db.insert_one("games", {"game_state": "open", "start_time": datetime(2021, 6, 2)})
+        games = self.db.find("games", {"start_time": {"$gt": datetime(2021, 1, 1)}}, sort=[("start_time", -1)],
+                             limit=1)
+        self.assertEqual([game["_id"] for game in games], [later_id])
+
+    def test_find_with_or_and_comparison(self):
+        games = self.db.find("games", {"$or": [{"game_state": "finished"}, {"_id": {"$lt": self.game_id}}]})
+        self.assertEqual([game["game_state"] for game in games], ["finished"])
+
+    def test_find_with_projection(self):
+        game = self.db.find_one("games", {"_id": self.game_id}, projection={"start_time": 1, "participants": 1})
+        self.assertEqual(game, {"_id": self.game_id, "start_time": self.start_time, "participants": {}})
+
+    def test_find_with_exclusion_projection(self):
+        games = self.db.find("games", {"scenario_id": "abc"}, projection={"participants": 0, "start_time": 0})
+        self.assertTrue(all("participants" not in game and "game_state" in game for game in games))
+
+    def test_find_by_indexed_field(self):
+        games = self.db.find("games", {"scenario_id": "abc"})
+        self.assertEqual(len(games), 2)
+
+    def test_partial_update_of_nested_path(self):
+        self.db.update_one("games", self.game_id, {"$set": {"participants.abc": {"participant_id": "abc"},
+                                                            "participants.xyz.history": []}})
+        game = self.db.find_one("games", {"_id": self.game_id})
+        self.assertEqual(game["participants"]["abc"], {"participant_id": "abc"})
+        self.assertEqual(game["participants"]["xyz"], {"history": []})
+        self.assertEqual(game["game_state"], "open")
+
+    def test_push_to_history(self):
+        self.db.update_one("games", self.game_id, {"$set": {"participants.abc": {"history": [{"solution": "0"}]}}})
+        self.db.update_one("games", self.game_id, {"$push": {"participants.abc.history": {"$each": [{"solution": "1"}]},
+                                                             "participants.xyz.history": {"solution": "2"}}})
+        game = self.db.find_one("games", {"_id": self.game_id})
+        self.assertEqual(game["participants"]["abc"]["history"], [{"solution": "0"}, {"solution": "1"}])
+        self.assertEqual(game["participants"]["xyz"]["history"], [{"solution": "2"}])
+
+    def test_update_with_expected_version(self):
+        update_statement = {"$set": {"game_state": "in progress"}, "$inc": {"version": 1}}
+        self.assertTrue(self.db.update_one("games", self.game_id, update_statement, expected_version=0))
+        self.assertFalse(self.db.update_one("games", self.game_id, update_statement, expected_version=0))
+        self.assertEqual(self.db.find_one("games", {"_id": self.game_id})["version"], 1)
+
+    def test_update_upserts(self):
+        self.db.update_one("games", "new-id", {"$set": {"game_state": "open"}})
+        self.assertEqual(self.db.find_one("games", {"_id": "new-id"})["game_state"], "open")
+
+    def test_delete_one(self):
+        self.db.delete_one("games", {"_id": self.game_id})
+        self.assertIsNone(self.db.find_one("games", {"_id": self.game_id}))
+
+
+class InMemorySQLiteBackendTest(TestCase):
+    def setUp(self):
+        self.db = SQLiteBackend(Munch(DB_NAME="csep-test", DB_PATH=":memory:"))
+        self.game_id = self.db.insert_one("games", {"game_state": "open"})
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_threads_share_database(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            game = executor.submit(self.db.find_one, "games", {"_id": self.game_id}).result()
+            executor.submit(self.db.insert_one, "scenarios", {"title": "Phishing"}).result()
+        self.assertEqual(game["game_state"], "open")
+        self.assertEqual(len(self.db.find("scenarios", {})), 1)
+
+    def test_close_closes_connections_of_all_threads(self):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(self.db.find_one, "games", {"_id": self.game_id}).result()
+        self.db.close()
+        self.assertIsNone(self.db.find_one("games", {"_id": self.game_id}))
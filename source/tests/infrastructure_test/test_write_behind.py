@@ -0,0 +1,71 @@
+import threading
+import time
+from unittest import TestCase
+
+from infrastructure_layer.write_behind import WriteBehindBuffer
+
+
+class WriteBehindBufferTest(TestCase):
+    def setUp(self):
+        self.writes = []
+        self.buffer = WriteBehindBuffer(lambda entity_id, changes: self.writes.append((entity_id, changes)),
+                                        window=None)
+
+    def tearDown(self):
+        self.buffer.close()
+
+    def test_changes_are_coalesced(self):
+        self.buffer.add("game", 1)
+        self.buffer.add("game", 2)
+        self.buffer.add("other game", 3)
+        self.buffer.flush()
+        self.assertEqual(self.writes, [("game", [1, 2]), ("other game", [3])])
+
+    def test_flush_touched_only_writes_own_changes(self):
+        thread = threading.Thread(target=self.buffer.add, args=("other game", 1))
+        thread.start()
+        thread.join()
+        self.buffer.add("game", 2)
+        self.buffer.flush_touched()
+        self.assertEqual(self.writes, [("game", [2])])
+        self.assertTrue(self.buffer.has_pending_changes("other game"))
+
+    def test_changes_are_written_after_window(self):
+        self.buffer.window = 0.01
+        self.buffer.add("game", 1)
+        time.sleep(0.2)
+        self.assertEqual(self.writes, [("game", [1])])
+
+    def test_failed_changes_are_written_again(self):
+        failures = [IOError("The database is not available!")]
+        self.buffer = WriteBehindBuffer(self._write_unless_failing(failures), window=None)
+        self.buffer.add("game", 1)
+        with self.assertRaises(IOError):
+            self.buffer.flush()
+        self.buffer.add("game", 2)
+        self.buffer.flush()
+        self.assertEqual(self.writes, [("game", [1, 2])])
+
+    def test_failed_changes_are_discarded_after_max_attempts(self):
+        failures = [IOError("The database is not available!")] * self.buffer.max_attempts
+        self.buffer = WriteBehindBuffer(self._write_unless_failing(failures), window=None)
+        self.buffer.add("game", 1)
+        for _ in range(self.buffer.max_attempts):
+            with self.assertRaises(IOError):
+                self.buffer.flush()
+        self.assertFalse(self.buffer.has_pending_changes())
+
+    def test_failed_window_flush_is_retried(self):
+        failures = [IOError("The database is not available!")]
+        self.buffer = WriteBehindBuffer(self._write_unless_failing(failures), window=0.01)
+        with self.assertLogs("infrastructure_layer.write_behind", level="ERROR"):
+            self.buffer.add("game", 1)
+            time.sleep(0.2)
+        self.assertEqual(self.writes, [("game", [1])])
+
+    def _write_unless_failing(self, failures):
+        def write(entity_id, changes):
+            if failures:
+                raise failures.pop()
+            self.writes.append((entity_id, changes))
+        return write
@@ -1,8 +1,12 @@
-from unittest import TestCase
+from unittest import TestCase, mock
 
 from flask import Flask
 
+from domain_layer.common.scenario_management import ScenarioRepository
+from domain_layer.gameplay.game_management import GroupGameFactory, GroupGameRepository
 from domain_layer.gameplay.mock_interface import MockScenarioBuilder
+from domain_layer.scenariodesign.scenario_management import EditableScenarioRepository
+from infrastructure_layer.database import ConcurrentModificationError
 from presentation_layer import app_factory
 
 
@@ -18,4 +22,43 @@ class AppFactoryTest(TestCase):
         new_app = app_factory.AppFactory.create_app()
         self.assertIsInstance(new_app, Flask)
 
+    def test_conflict_is_answered_with_409(self):
+        scenario = ScenarioRepository.save_scenario(MockScenarioBuilder.build_scenario())
+        new_app = app_factory.AppFactory.create_app()
+        new_app.config["WTF_CSRF_ENABLED"] = False
+        conflict = ConcurrentModificationError("The scenario has been changed concurrently!")
+        with mock.patch.object(EditableScenarioRepository, "save_scenario", side_effect=conflict), \
+                mock.patch.object(EditableScenarioRepository, "retry_delay", 0):
+            response = new_app.test_client().post("/scenarios/{}/variables/add".format(scenario.scenario_id),
+                                                  data={"name": "budget", "datatype": "numeric", "value": "10"},
+                                                  headers={"Referer": "/"})
+        self.assertEqual(response.status_code, 409)
+
+    def test_debug_endpoint_is_off_by_default(self):
+        with mock.patch.object(app_factory.config, "get_db_config", return_value={"INSTRUMENTATION": {}}):
+            self.assertFalse(app_factory.AppFactory._is_debug_endpoint_enabled())
+        with mock.patch.object(app_factory.AppFactory, "_is_debug_endpoint_enabled", return_value=False):
+            new_app = app_factory.AppFactory.create_app()
+        self.assertNotIn("debug", new_app.blueprints)
+        self.assertEqual(new_app.test_client().get("/debug/db").status_code, 404)
+
+    def test_debug_endpoint_can_be_enabled(self):
+        with mock.patch.object(app_factory.AppFactory, "_is_debug_endpoint_enabled", return_value=True):
+            new_app = app_factory.AppFactory.create_app()
+        self.assertIn("debug", new_app.blueprints)
+
+    def test_changes_of_failed_request_are_discarded(self):
+        game_id = GroupGameRepository.save_game(
+            GroupGameFactory.create_game(ScenarioRepository.save_scenario(MockScenarioBuilder.build_scenario())))
+        new_app = app_factory.AppFactory.create_app()
+
+        @new_app.route("/failing/<game_id>")
+        def join_and_fail(game_id):
+            game = GroupGameRepository.get_game_by_id(game_id)
+            GroupGameRepository.update_game(game, lambda current_game: current_game.add_participant("abc"))
+            raise RuntimeError("The request failed after the game was changed!")
 
+        new_app.testing = True
+        with self.assertRaises(RuntimeError):
+            new_app.test_client().get("/failing/{}".format(game_id))
+        self.assertEqual(GroupGameRepository.get_game_by_id(game_id).number_of_participants(), 0)
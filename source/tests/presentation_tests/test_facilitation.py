@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from domain_layer.common.scenario_management import ScenarioRepository
+from domain_layer.gameplay.game_management import GroupGameFactory, GroupGameRepository
+from domain_layer.gameplay.mock_interface import MockScenarioBuilder
+from presentation_layer.app_factory import AppFactory
+
+
+class FacilitationTest(TestCase):
+    repo = GroupGameRepository
+
+    def setUp(self):
+        scenario = ScenarioRepository.save_scenario(MockScenarioBuilder.build_scenario())
+        game = GroupGameFactory.create_game(scenario)
+        game.start_game()
+        self.game_id = self.repo.save_game(game)
+        self.app = AppFactory.create_app()
+        self.app.config["WTF_CSRF_ENABLED"] = False
+
+    def test_set_several_variables_in_one_request(self):
+        response = self.app.test_client().post("/trainers/games/{}/variables".format(self.game_id),
+                                               data={"Budget": "5000", "Reputation Damage": "Severe"})
+        self.assertEqual(response.status_code, 302)
+        game_variables = self.repo.get_game_by_id(self.game_id).game_variables
+        self.assertEqual(game_variables["Budget"].value, 5000)
+        self.assertEqual(game_variables["Reputation Damage"].value, "Severe")
@@ -0,0 +1,138 @@
+import io
+import os
+import tempfile
+from unittest import TestCase, mock, skipUnless
+
+from domain_layer.common.scenario_management import ScenarioRepository
+from domain_layer.gameplay.mock_interface import MockScenarioBuilder
+from domain_layer.scenariodesign.scenario_management import EditableScenarioRepository
+from infrastructure_layer import image_derivatives
+from infrastructure_layer.database import ConcurrentModificationError
+from presentation_layer.app_factory import AppFactory
+from presentation_layer.controllers.media import media_bp
+
+
+class MediaTest(TestCase):
+    def setUp(self):
+        self.media_folder = tempfile.TemporaryDirectory()
+        self.app = AppFactory.create_app()
+        self.app.config["MEDIA_FOLDER"] = self.media_folder.name
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        self.media_folder.cleanup()
+
+    def _save(self, content: bytes, filename: str):
+        from presentation_layer.controllers.media.media_bp import get_media_store
+        with self.app.app_context():
+            return get_media_store().save(io.BytesIO(content), filename)
+
+    def test_identical_uploads_are_stored_once(self):
+        first_key = self._save(b"image", "first.PNG")
+        second_key = self._save(b"image", "second.png")
+        self.assertEqual(first_key, second_key)
+        self.assertTrue(first_key.endswith(".png"))
+        stored_files = [name for _, _, names in os.walk(self.media_folder.name) for name in names]
+        self.assertEqual(stored_files, [first_key[:-len(".png")]])
+
+    def test_same_content_with_other_extension_is_stored_once(self):
+        jpg_key = self._save(b"image", "photo.jpg")
+        jpeg_key = self._save(b"image", "photo.jpeg")
+        self.assertNotEqual(jpg_key, jpeg_key)
+        stored_files = [name for _, _, names in os.walk(self.media_folder.name) for name in names]
+        self.assertEqual(len(stored_files), 1)
+        for key in (jpg_key, jpeg_key):
+            response = self.client.get("/media/" + key)
+            self.assertEqual(response.mimetype, "image/jpeg")
+            self.assertEqual(response.data, b"image")
+
+    def test_media_is_cacheable(self):
+        key = self._save(b"0123456789", "image.png")
+        response = self.client.get("/media/" + key)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertEqual(response.mimetype, "image/png")
+
+        response = self.client.get("/media/" + key, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get("/media/" + key, headers={"Range": "bytes=2-4"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b"234")
+
+    def test_unknown_media_is_not_found(self):
+        self.assertEqual(self.client.get("/media/" + "0" * 64).status_code, 404)
+        self.assertEqual(self.client.get("/media/..%2Fconfig.yml").status_code, 404)
+
+    @skipUnless(image_derivatives.is_available(), "Pillow is not installed")
+    def test_derivatives_are_created_for_smaller_widths(self):
+        from PIL import Image
+        from presentation_layer.controllers.media.media_bp import get_media_store
+        image = io.BytesIO()
+        Image.new("RGB", (800, 400), "red").save(image, "PNG")
+        key = self._save(image.getvalue(), "image.png")
+        with self.app.app_context():
+            derivatives = image_derivatives.create_derivatives(get_media_store(), key)
+        self.assertEqual([derivative["width"] for derivative in derivatives], [320, 640, 800])
+        response = self.client.get("/media/" + derivatives[0]["media_path"])
+        self.assertEqual(response.mimetype, "image/webp")
+        with Image.open(io.BytesIO(response.data)) as derivative:
+            self.assertEqual(derivative.size, (320, 160))
+
+    def _save_scenario_with_image(self, media_path: str):
+        scenario_id = ScenarioRepository.save_scenario(MockScenarioBuilder.build_scenario()).scenario_id
+        scenario = EditableScenarioRepository.get_scenario_by_id(scenario_id)
+        scenario.get_all_injects()[0].media_path = media_path
+        EditableScenarioRepository.save_scenario(scenario)
+        return scenario_id
+
+    def _schedule_variants(self, scenario_id: str, media_path: str):
+        derivatives = [{"media_path": "1" * 64 + ".webp", "width": 320, "mimetype": "image/webp"},
+                       {"media_path": "2" * 64 + ".webp", "width": 640, "mimetype": "image/webp"}]
+        with mock.patch.object(image_derivatives, "is_available", return_value=True), \
+                mock.patch.object(image_derivatives, "create_derivatives", return_value=derivatives):
+            with self.app.app_context():
+                future = media_bp.schedule_media_variants(scenario_id, media_path)
+            return future.result(timeout=5)
+
+    def _get_image_injects(self, scenario_id: str, media_path: str):
+        scenario = EditableScenarioRepository.get_scenario_by_id(scenario_id)
+        return [inject for inject in scenario.get_all_injects() if inject.media_path == media_path]
+
+    def test_variants_are_attached_in_background(self):
+        media_path = self._save(b"image", "image.png")
+        scenario_id = self._save_scenario_with_image(media_path)
+        self.assertEqual(self._schedule_variants(scenario_id, media_path), 1)
+        inject = self._get_image_injects(scenario_id, media_path)[0]
+        self.assertEqual([(variant.media_path, variant.width) for variant in inject.media_variants],
+                         [("1" * 64 + ".webp", 320), ("2" * 64 + ".webp", 640)])
+
+    def test_variants_are_attached_after_concurrent_edit(self):
+        media_path = self._save(b"image", "image.png")
+        scenario_id = self._save_scenario_with_image(media_path)
+        save_scenario = EditableScenarioRepository.save_scenario
+        attempts = []
+
+        def save_after_concurrent_edit(scenario):
+            attempts.append(scenario)
+            if len(attempts) == 1:
+                raise ConcurrentModificationError("The scenario has been changed concurrently!")
+            return save_scenario(scenario)
+
+        with mock.patch.object(EditableScenarioRepository, "save_scenario", side_effect=save_after_concurrent_edit), \
+                mock.patch.object(EditableScenarioRepository, "retry_delay", 0):
+            self.assertEqual(self._schedule_variants(scenario_id, media_path), 1)
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(len(self._get_image_injects(scenario_id, media_path)[0].media_variants), 2)
+
+    def test_srcset_lists_variants(self):
+        media_variants = [media_bp.MediaVariant(media_path="1" * 64 + ".webp", width=320),
+                          media_bp.MediaVariant(media_path="2" * 64 + ".webp", width=640)]
+        with self.app.test_request_context():
+            srcset = media_bp.media_srcset(media_variants, "3" * 64 + ".png")
+        self.assertEqual(srcset, "/media/{}.webp 320w, /media/{}.webp 640w".format("1" * 64, "2" * 64))
+
+    def test_srcset_falls_back_to_original(self):
+        with self.app.test_request_context():
+            self.assertEqual(media_bp.media_srcset([], "3" * 64 + ".png"), "/media/{}.png".format("3" * 64))
+            self.assertEqual(media_bp.media_srcset([], ""), "")
@@ -0,0 +1,42 @@
+import gzip
+from unittest import TestCase
+
+from flask import url_for
+
+from presentation_layer.app_factory import AppFactory
+
+
+class StaticAssetsTest(TestCase):
+    def setUp(self):
+        self.app = AppFactory.create_app()
+        self.client = self.app.test_client()
+
+    def _get_static_url(self, filename):
+        with self.app.test_request_context():
+            return url_for("static", filename=filename)
+
+    def test_static_urls_are_fingerprinted(self):
+        url = self._get_static_url("css/custom.css")
+        self.assertRegex(url, r"^/static/css/custom\.[0-9a-f]{12}\.css$")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("immutable", response.headers["Cache-Control"])
+        self.assertEqual(response.mimetype, "text/css")
+        response.close()
+
+    def test_precompressed_file_is_served(self):
+        url = self._get_static_url("js/libs/jquery-3.5.1.min.js")
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        compressed = response.data
+        response.close()
+        response = self.client.get(url)
+        self.assertEqual(gzip.decompress(compressed), response.data)
+        response.close()
+
+    def test_large_dynamic_responses_are_compressed(self):
+        response = self.client.get("/", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertIn(b"<html", gzip.decompress(response.data).lower())
+        response = self.client.get("/")
+        self.assertNotIn("Content-Encoding", response.headers)